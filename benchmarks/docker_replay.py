@@ -0,0 +1,477 @@
+"""
+Docker discovery convergence benchmark.
+
+Boots a real Moat server against the fake Docker engine (benchmarks/fake_docker_engine.py), replays
+a synthetic or recorded container event stream into it, and measures how long Moat takes to reach
+the routing table the engine's final state calls for. Moat runs in its own process, so its CPU time
+(read from /proc, Linux-only) excludes the engine and the harness. Each scenario gets a fresh Moat.
+
+    compose_up      --containers labelled containers started in one burst (`docker compose up`)
+    reboot          every container dies, the engine restarts (event streams drop) and all containers
+                    start again on new published ports
+    restart_storm   --storm-containers containers each crash-loop --storm-cycles times; about half end stopped
+    out_of_order    start/die/start sequences delivered shuffled, with non-monotonic event times
+    replay          events from --events-file (`docker events --format '{{json .}}'` output), replayed
+                    with their original gaps divided by --speed (0 replays as fast as possible)
+
+    python benchmarks/docker_replay.py run [--scenarios compose_up,reboot] [--containers 2000]
+                                           [--output results.json] [--compare baseline.json] [--tolerance 0.15]
+    python benchmarks/docker_replay.py compare results.json baseline.json [--tolerance 0.15]
+
+Reported per scenario: time from the first event to a correct routing table (polled through the
+Admin API every --poll-interval seconds, which adds a little Moat CPU), routes still missing, wrong
+or extra at the end, events Moat received vs. emitted (dropped), events applied later than one
+second after they happened (late), the event queue's peak depth, and Moat CPU per emitted event.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from fake_docker_engine import FakeDockerEngine  # noqa: E402
+from load_test import ProcessSampler, _free_port  # noqa: E402
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MOAT_HOST = "moat.bench.local"
+API_TOKEN = "bench-admin-api-token"
+LABEL_PREFIX = "moat"
+FIRST_PUBLISHED_PORT = 20000
+# Actions Moat acts on; the dropped-event count only considers these.
+ROUTED_ACTIONS = {"start", "stop", "die", "pause", "unpause"}
+# Applied events whose lag exceeded this are "late" (must be a moat_docker_event_lag_seconds bucket bound).
+LATE_EVENT_SECONDS = 1.0
+
+# metric -> True if higher is better
+COMPARED_METRICS = {"convergence_s": False, "cpu_us_per_event": False, "dropped_events": False, "late_events": False}
+
+
+def _container_id(index: int) -> str:
+    return f"{index + 1:064x}"
+
+def _labels(index: int) -> Dict[str, str]:
+    return {f"{LABEL_PREFIX}.enable": "true", f"{LABEL_PREFIX}.hostname": f"c{index}.bench.local", f"{LABEL_PREFIX}.port": "80",
+            "com.docker.compose.project": "bench"}
+
+def _add_containers(engine: FakeDockerEngine, count: int, running: bool):
+    for i in range(count):
+        engine.add_container(_container_id(i), f"bench-{i}", _labels(i), published_port=FIRST_PUBLISHED_PORT + i, running=running)
+
+
+def expected_routes(engine: FakeDockerEngine) -> Dict[str, str]:
+    """hostname -> target URL that Moat should route, derived from the engine's final container state."""
+    routes: Dict[str, str] = {}
+    for c in engine.containers.values():
+        labels = c["labels"]
+        if not c["running"] or labels.get(f"{LABEL_PREFIX}.enable") != "true": continue
+        hostname, port = labels.get(f"{LABEL_PREFIX}.hostname"), labels.get(f"{LABEL_PREFIX}.port")
+        if not hostname or not (port or "").isdigit(): continue
+        scheme = labels.get(f"{LABEL_PREFIX}.scheme", "http")
+        if c["published_port"] and int(port) == c["internal_port"]:
+            routes[hostname] = f"{scheme}://127.0.0.1:{c['published_port']}"
+        elif c["networks"]:
+            routes[hostname] = f"{scheme}://{c['networks'][sorted(c['networks'])[0]]}:{port}"
+        else:
+            routes[hostname] = f"{scheme}://{c['name']}:{port}"
+    return routes
+
+
+async def _yield_every(index: int, every: int = 200):
+    """Lets the engine's /events handler write while a scenario emits a long burst."""
+    if index % every == every - 1: await asyncio.sleep(0)
+
+
+# Each scenario has a prepare step (engine state before Moat starts) and a run step that emits the
+# events and returns how many it emitted.
+
+def _prepare_compose_up(engine: FakeDockerEngine, args):
+    _add_containers(engine, args.containers, running=False)
+
+async def _run_compose_up(engine: FakeDockerEngine, args) -> int:
+    for i in range(args.containers):
+        engine.emit("start", _container_id(i))
+        await _yield_every(i)
+    return args.containers
+
+
+def _prepare_reboot(engine: FakeDockerEngine, args):
+    _add_containers(engine, args.containers, running=True)
+
+async def _run_reboot(engine: FakeDockerEngine, args) -> int:
+    for i in range(args.containers):
+        engine.emit("die", _container_id(i))
+        await _yield_every(i)
+    engine.disconnect_streams()
+    await asyncio.sleep(0.2)
+    for i in range(args.containers):
+        engine.containers[_container_id(i)]["published_port"] = FIRST_PUBLISHED_PORT + args.containers + i
+        engine.emit("start", _container_id(i))
+        await _yield_every(i)
+    return 2 * args.containers
+
+
+def _prepare_restart_storm(engine: FakeDockerEngine, args):
+    _add_containers(engine, args.containers, running=True)
+
+async def _run_restart_storm(engine: FakeDockerEngine, args) -> int:
+    rng = random.Random(args.seed)
+    storm = rng.sample(range(args.containers), min(args.storm_containers, args.containers))
+    emitted = 0
+    for cycle in range(args.storm_cycles):
+        for index, i in enumerate(storm):
+            engine.emit("die", _container_id(i))
+            # The last cycle leaves about half of the storm stopped.
+            if cycle < args.storm_cycles - 1 or i % 2 == 0:
+                engine.emit("start", _container_id(i))
+                emitted += 1
+            emitted += 1
+            await _yield_every(index)
+        await asyncio.sleep(args.storm_interval)
+    return emitted
+
+
+def _prepare_out_of_order(engine: FakeDockerEngine, args):
+    _add_containers(engine, args.containers, running=False)
+
+async def _run_out_of_order(engine: FakeDockerEngine, args) -> int:
+    """start(t0), die(t1), start(t2) per container, delivered in shuffled order; every container ends running."""
+    rng = random.Random(args.seed)
+    base = time.time_ns()
+    events = []
+    for i in range(args.containers):
+        container_id = _container_id(i)
+        engine.containers[container_id]["running"] = True
+        for step, action in enumerate(("start", "die", "start")):
+            events.append(engine.make_event(action, container_id, base + (i * 3 + step) * 1000))
+    # Shuffle within windows, so each container's events arrive close together but in any order.
+    window = 300
+    for start in range(0, len(events), window):
+        chunk = events[start:start + window]
+        rng.shuffle(chunk)
+        events[start:start + window] = chunk
+    for index, event in enumerate(events):
+        engine.emit_raw(event)
+        await _yield_every(index)
+    return len(events)
+
+
+def _load_recorded_events(path: str) -> List[Dict[str, Any]]:
+    events = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            event = json.loads(line)
+            if event.get("Type") == "container" and (event.get("Actor") or {}).get("ID"):
+                events.append(event)
+    if not events:
+        raise SystemExit(f"No container events in {path}.")
+    return events
+
+def _prepare_replay(engine: FakeDockerEngine, args):
+    """Creates a container for every ID in the recording, from the labels and name in its events."""
+    for event in _load_recorded_events(args.events_file):
+        container_id = event["Actor"]["ID"]
+        if container_id in engine.containers: continue
+        attributes = dict(event["Actor"].get("Attributes") or {})
+        name = attributes.pop("name", container_id[:12])
+        index = len(engine.containers)
+        engine.add_container(container_id, name, attributes, running=False, networks={"bench": f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"})
+
+async def _run_replay(engine: FakeDockerEngine, args) -> int:
+    events = _load_recorded_events(args.events_file)
+    offset = time.time_ns() - int(events[0].get("timeNano") or int(events[0].get("time", 0)) * 1_000_000_000)
+    previous_nano = None
+    for index, event in enumerate(events):
+        time_nano = int(event.get("timeNano") or int(event.get("time", 0)) * 1_000_000_000)
+        if args.speed > 0 and previous_nano is not None and time_nano > previous_nano:
+            await asyncio.sleep((time_nano - previous_nano) / 1e9 / args.speed)
+        previous_nano = time_nano
+        container = engine.containers[event["Actor"]["ID"]]
+        action = event.get("Action") or event.get("status")
+        if action in ("start", "unpause"): container["running"] = True
+        elif action in ("die", "stop", "kill", "pause"): container["running"] = False
+        replayed = dict(event, timeNano=time_nano + offset, time=(time_nano + offset) // 1_000_000_000)
+        replayed["Actor"] = dict(event["Actor"], Attributes={**container["labels"], "name": container["name"]})
+        engine.emit_raw(replayed)
+        await _yield_every(index)
+    return len(events)
+
+
+SCENARIOS = {
+    "compose_up": (_prepare_compose_up, _run_compose_up),
+    "reboot": (_prepare_reboot, _run_reboot),
+    "restart_storm": (_prepare_restart_storm, _run_restart_storm),
+    "out_of_order": (_prepare_out_of_order, _run_out_of_order),
+    "replay": (_prepare_replay, _run_replay),
+}
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Flattens Prometheus text into {"name{labels}": value}."""
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"): continue
+        key, _, value = line.rpartition(" ")
+        try: values[key] = float(value)
+        except ValueError: pass
+    return values
+
+def _metric_sum(metrics: Dict[str, float], name: str) -> float:
+    return sum(value for key, value in metrics.items() if key == name or key.startswith(name + "{"))
+
+
+class ReplayEnvironment:
+    """One Moat process (Docker discovery only) and a fake engine, in a temporary working directory."""
+    def __init__(self):
+        self.workdir = Path(tempfile.mkdtemp(prefix="moat-docker-replay-"))
+        self.moat_port = _free_port()
+        self.docker_socket = str(self.workdir / "docker.sock")
+        self.engine = FakeDockerEngine()
+        self.moat_process: Optional[subprocess.Popen] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def moat_url(self) -> str:
+        return f"http://127.0.0.1:{self.moat_port}"
+
+    def _write_config(self):
+        (self.workdir / "moat").symlink_to(REPO_ROOT / "moat")
+        (self.workdir / "config.yml").write_text(f"""
+listen_host: 127.0.0.1
+listen_port: {self.moat_port}
+secret_key: bench-secret-key-not-for-production
+database_url: sqlite+aiosqlite:///./moat.db
+moat_base_url: http://{MOAT_HOST}
+cookie_domain: null
+docker_monitor_enabled: true
+moat_label_prefix: {LABEL_PREFIX}
+registry_snapshot_path: null
+access_log_path: null
+slow_request_threshold_ms: null
+admin_api_token: {API_TOKEN}
+metrics_bearer_token: {API_TOKEN}
+""")
+
+    def _env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        env["PYTHONPATH"] = str(REPO_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+        env["DOCKER_HOST"] = f"unix://{self.docker_socket}"
+        env.pop("HOSTNAME", None)
+        return env
+
+    async def start(self):
+        self._write_config()
+        await self.engine.start(self.docker_socket)
+        self.moat_process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "moat.server:app", "--host", "127.0.0.1", "--port", str(self.moat_port),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=self.workdir, env=self._env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self._session = aiohttp.ClientSession(headers={"Host": MOAT_HOST, "Authorization": f"Bearer {API_TOKEN}"},
+                                              timeout=aiohttp.ClientTimeout(total=30))
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                # Ready once the initial scan is done and the event stream is connected.
+                if self.engine._subscribers and await self.routes() is not None: return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+        raise RuntimeError("Moat did not start and connect to the fake Docker engine in time.")
+
+    async def routes(self) -> Optional[Dict[str, str]]:
+        async with self._session.get(f"{self.moat_url}/moat/admin/api/routes") as resp:
+            if resp.status != 200: return None
+            payload = await resp.json()
+        return {route["hostname"]: route["target_url"] for route in payload["routes"] if route["source"] == "docker"}
+
+    async def metrics(self) -> Dict[str, float]:
+        async with self._session.get(f"{self.moat_url}/moat/metrics") as resp:
+            return parse_metrics(await resp.text())
+
+    async def stop(self):
+        if self._session: await self._session.close()
+        if self.moat_process:
+            self.moat_process.terminate()
+            try: self.moat_process.wait(timeout=10)
+            except subprocess.TimeoutExpired: self.moat_process.kill()
+        await self.engine.stop()
+
+
+def _route_diff(expected: Dict[str, str], actual: Dict[str, str]) -> Dict[str, int]:
+    return {
+        "missing_routes": sum(1 for hostname in expected if hostname not in actual),
+        "wrong_targets": sum(1 for hostname, target in expected.items() if hostname in actual and actual[hostname] != target),
+        "extra_routes": sum(1 for hostname in actual if hostname not in expected),
+    }
+
+
+async def run_scenario(name: str, args) -> Dict[str, Any]:
+    prepare, run = SCENARIOS[name]
+    env = ReplayEnvironment()
+    prepare(env.engine, args)
+    await env.start()
+    try:
+        sampler = ProcessSampler(env.moat_process.pid)
+        metrics_before = await env.metrics()
+        cpu_before = sampler.cpu_seconds()
+        log_start = len(env.engine.event_log)
+        started = time.perf_counter()
+
+        emit_task = asyncio.get_running_loop().create_task(run(env.engine, args))
+        peak_queue_depth = 0
+        converged_at: Optional[float] = None
+        actual: Dict[str, str] = {}
+        deadline = started + args.timeout
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(args.poll_interval)
+            metrics = await env.metrics()
+            peak_queue_depth = max(peak_queue_depth, int(metrics.get("moat_docker_event_queue_depth", 0)))
+            if not emit_task.done(): continue
+            actual = await env.routes() or {}
+            if actual == expected_routes(env.engine):
+                converged_at = time.perf_counter()
+                break
+        emitted = await emit_task
+        cpu_after = sampler.cpu_seconds()
+        convergence_s = round(converged_at - started, 3) if converged_at is not None else None
+        # Let the debounce window run out before counting received/applied events.
+        await asyncio.sleep(args.settle)
+        metrics_after = await env.metrics()
+        if converged_at is None: actual = await env.routes() or {}
+    finally:
+        await env.stop()
+
+    def delta(metric: str) -> float:
+        return _metric_sum(metrics_after, metric) - _metric_sum(metrics_before, metric)
+
+    routed_emitted = sum(1 for event in env.engine.event_log[log_start:] if event.get("Action") in ROUTED_ACTIONS)
+    received = int(delta("moat_docker_events_total"))
+    applied_lags = int(delta("moat_docker_event_lag_seconds_count"))
+    on_time = int(delta(f'moat_docker_event_lag_seconds_bucket{{le="{LATE_EVENT_SECONDS:g}"}}'))
+    cpu_seconds = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return {
+        "containers": len(env.engine.containers),
+        "events": emitted,
+        "converged": converged_at is not None,
+        "convergence_s": convergence_s,
+        **_route_diff(expected_routes(env.engine), actual),
+        "events_received": received,
+        "dropped_events": max(0, routed_emitted - received),
+        "events_applied": int(delta("moat_docker_events_applied_total")),
+        "late_events": applied_lags - on_time,
+        "peak_queue_depth": peak_queue_depth,
+        "cpu_ms": round(cpu_seconds * 1000, 1) if cpu_seconds is not None else None,
+        "cpu_us_per_event": round(cpu_seconds * 1e6 / emitted, 1) if cpu_seconds is not None and emitted else None,
+    }
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """Prints a per-scenario comparison. Returns True if any scenario stopped converging or regressed beyond tolerance."""
+    regressed = False
+    for name, result in current.get("scenarios", {}).items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            print(f"{name}: no baseline")
+            continue
+        if base.get("converged") and not result.get("converged"):
+            regressed = True
+            print(f"{name:14} converged            True -> False REGRESSION")
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            new_value, old_value = result.get(metric), base.get(metric)
+            if new_value is None or old_value is None: continue
+            if not old_value:
+                flag = "REGRESSION" if new_value > 0 and not higher_is_better else ""
+                change_text = "new" if new_value else "+0.0%"
+            else:
+                change = (new_value - old_value) / old_value
+                worse = -change if higher_is_better else change
+                flag = "REGRESSION" if worse > tolerance else ""
+                change_text = f"{change:+.1%}"
+            if flag: regressed = True
+            print(f"{name:14} {metric:20} {old_value:>12} -> {new_value:>12} ({change_text}) {flag}")
+    return regressed
+
+
+async def run_benchmarks(args) -> Dict[str, Any]:
+    default_names = [name for name in SCENARIOS if name != "replay" or args.events_file]
+    names = [n.strip() for n in args.scenarios.split(",")] if args.scenarios else default_names
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(unknown)}. Available: {', '.join(SCENARIOS)}")
+    if "replay" in names and not args.events_file:
+        raise SystemExit("The replay scenario needs --events-file.")
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": time.time(), "python": platform.python_version(), "platform": platform.platform(),
+            "containers": args.containers, "storm_containers": args.storm_containers, "storm_cycles": args.storm_cycles,
+            "events_file": args.events_file or None, "seed": args.seed,
+        },
+        "scenarios": {},
+    }
+    for name in names:
+        print(f"Running {name}...", flush=True)
+        result = await run_scenario(name, args)
+        results["scenarios"][name] = result
+        outcome = f"converged in {result['convergence_s']} s" if result["converged"] else \
+            f"NOT converged ({result['missing_routes']} missing, {result['wrong_targets']} wrong, {result['extra_routes']} extra)"
+        print(f"  {result['events']} events, {outcome}, dropped {result['dropped_events']}, late {result['late_events']}, "
+              f"peak queue {result['peak_queue_depth']}, cpu {result['cpu_us_per_event']} us/event")
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Boot Moat and replay Docker event scenarios.")
+    run_parser.add_argument("--scenarios", default="", help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    run_parser.add_argument("--containers", type=int, default=2000, help="Containers in the synthetic scenarios.")
+    run_parser.add_argument("--storm-containers", type=int, default=200, help="Containers crash-looping in restart_storm.")
+    run_parser.add_argument("--storm-cycles", type=int, default=10, help="die/start cycles per storm container.")
+    run_parser.add_argument("--storm-interval", type=float, default=0.05, help="Seconds between storm cycles.")
+    run_parser.add_argument("--events-file", default="", help="Recorded `docker events --format '{{json .}}'` output for replay.")
+    run_parser.add_argument("--speed", type=float, default=0.0, help="Replay speed-up of recorded gaps; 0 replays without gaps.")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--timeout", type=float, default=120.0, help="Give up on convergence after this many seconds.")
+    run_parser.add_argument("--poll-interval", type=float, default=0.1)
+    run_parser.add_argument("--settle", type=float, default=1.0, help="Seconds to wait after convergence before reading event counters.")
+    run_parser.add_argument("--output", default="", help="Write results JSON here.")
+    run_parser.add_argument("--compare", default="", help="Baseline results JSON to compare against.")
+    run_parser.add_argument("--tolerance", type=float, default=0.15)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files.")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15)
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        current = json.loads(Path(args.current).read_text())
+        baseline = json.loads(Path(args.baseline).read_text())
+        return 1 if compare_results(current, baseline, args.tolerance) else 0
+
+    results = asyncio.run(run_benchmarks(args))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"Results written to {args.output}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        return 1 if compare_results(results, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+A fake Docker Engine API served on a unix socket, for benchmarks.
+
+Implements just what moat.docker_client uses: /_ping, /containers/json, /containers/{id}/json and
+a streaming /events endpoint (honouring since=). Containers and events are driven from Python:
+
+    engine = FakeDockerEngine()
+    await engine.start("/tmp/fake-docker.sock")
+    engine.add_container("abc...", "web", labels={...}, published_port=9500)
+    engine.emit("start", "abc...")
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+
+class FakeDockerEngine:
+    def __init__(self):
+        self.containers: Dict[str, Dict[str, Any]] = {}
+        self.event_log: List[Dict[str, Any]] = []
+        self._subscribers: List[asyncio.Queue] = []
+        self._runner: Optional[web.AppRunner] = None
+        self.socket_path: Optional[str] = None
+        self.inspect_calls = 0
+        self.list_calls = 0
+
+    def add_container(self, container_id: str, name: str, labels: Dict[str, str], published_port: Optional[int] = None,
+                      internal_port: int = 80, networks: Optional[Dict[str, str]] = None, running: bool = True):
+        self.containers[container_id] = {
+            "id": container_id, "name": name, "labels": dict(labels), "published_port": published_port,
+            "internal_port": internal_port, "networks": dict(networks or {}), "running": running,
+        }
+
+    def remove_container(self, container_id: str):
+        self.containers.pop(container_id, None)
+
+    def _summary(self, c: Dict[str, Any]) -> Dict[str, Any]:
+        ports = []
+        if c["published_port"]:
+            ports.append({"IP": "127.0.0.1", "PrivatePort": c["internal_port"], "PublicPort": c["published_port"], "Type": "tcp"})
+        return {
+            "Id": c["id"], "Names": [f"/{c['name']}"], "Labels": c["labels"], "State": "running" if c["running"] else "exited",
+            "Ports": ports,
+            "NetworkSettings": {"Networks": {net: {"IPAddress": ip} for net, ip in c["networks"].items()}},
+        }
+
+    def _inspect(self, c: Dict[str, Any]) -> Dict[str, Any]:
+        port_key = f"{c['internal_port']}/tcp"
+        bindings = [{"HostIp": "127.0.0.1", "HostPort": str(c["published_port"])}] if c["published_port"] else None
+        return {
+            "Id": c["id"], "Name": f"/{c['name']}",
+            "State": {"Status": "running" if c["running"] else "exited"},
+            "Config": {"Labels": c["labels"], "ExposedPorts": {port_key: {}}},
+            "NetworkSettings": {
+                "Ports": {port_key: bindings},
+                "Networks": {net: {"IPAddress": ip} for net, ip in c["networks"].items()},
+            },
+        }
+
+    def make_event(self, action: str, container_id: str, time_nano: Optional[int] = None) -> Dict[str, Any]:
+        c = self.containers.get(container_id, {"name": container_id[:12], "labels": {}})
+        time_nano = time_nano if time_nano is not None else time.time_ns()
+        return {
+            "Type": "container", "Action": action, "status": action, "id": container_id,
+            "Actor": {"ID": container_id, "Attributes": {**c["labels"], "name": c["name"]}},
+            "time": time_nano // 1_000_000_000, "timeNano": time_nano,
+        }
+
+    def emit(self, action: str, container_id: str, time_nano: Optional[int] = None) -> Dict[str, Any]:
+        """Records the event and pushes it to every connected /events stream. Updates running state."""
+        if container_id in self.containers:
+            if action in ("start", "unpause"): self.containers[container_id]["running"] = True
+            elif action in ("die", "stop", "kill"): self.containers[container_id]["running"] = False
+        event = self.make_event(action, container_id, time_nano)
+        self.emit_raw(event)
+        return event
+
+    def emit_raw(self, event: Dict[str, Any]):
+        self.event_log.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def disconnect_streams(self):
+        """Closes every open /events stream, as an engine restart would."""
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+    async def _handle_ping(self, request: web.Request) -> web.Response:
+        return web.Response(text="OK")
+
+    async def _handle_list(self, request: web.Request) -> web.Response:
+        self.list_calls += 1
+        filters = json.loads(request.query.get("filters", "{}") or "{}")
+        only_running = "running" in (filters.get("status") or [])
+        return web.json_response([self._summary(c) for c in self.containers.values() if c["running"] or not only_running])
+
+    async def _handle_inspect(self, request: web.Request) -> web.Response:
+        self.inspect_calls += 1
+        container = self.containers.get(request.match_info["id"])
+        if container is None:
+            return web.json_response({"message": "No such container"}, status=404)
+        return web.json_response(self._inspect(container))
+
+    async def _handle_events(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        queue: asyncio.Queue = asyncio.Queue()
+        since = request.query.get("since")
+        if since:
+            seconds, _, fraction = since.partition(".")
+            since_nano = int(seconds) * 1_000_000_000 + int((fraction or "0").ljust(9, "0")[:9])
+            for event in self.event_log:
+                if event["timeNano"] >= since_nano: queue.put_nowait(event)
+        self._subscribers.append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None: break
+                await response.write((json.dumps(event) + "\n").encode())
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self._subscribers.remove(queue)
+        return response
+
+    async def start(self, socket_path: str):
+        if os.path.exists(socket_path): os.unlink(socket_path)
+        app = web.Application()
+        app.router.add_get("/_ping", self._handle_ping)
+        app.router.add_get("/containers/json", self._handle_list)
+        app.router.add_get("/containers/{id}/json", self._handle_inspect)
+        app.router.add_get("/events", self._handle_events)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.UnixSite(self._runner, socket_path).start()
+        self.socket_path = socket_path
+
+    async def stop(self):
+        self.disconnect_streams()
+        if self._runner: await self._runner.cleanup()
+        self._runner = None
+        if self.socket_path and os.path.exists(self.socket_path): os.unlink(self.socket_path)
@@ -0,0 +1,80 @@
+"""
+Import-time budget check for the Moat CLI.
+
+Runs `python -X importtime` in a fresh interpreter for the modules every CLI invocation loads and
+fails if the cumulative import time exceeds the budget, or if a heavy server-only dependency
+(FastAPI, aiohttp, uvicorn, ...) gets pulled in at import time again.
+
+    python benchmarks/import_time.py [--budget-ms 150] [--runs 5]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Module -> cumulative import-time budget in milliseconds (median of several runs).
+DEFAULT_BUDGETS_MS: Dict[str, float] = {
+    "moat.main": 150.0,
+}
+
+# Modules that must not be imported just by loading the CLI.
+FORBIDDEN_AT_IMPORT: List[str] = [
+    "fastapi", "starlette", "uvicorn", "aiohttp", "watchdog", "jinja2", "aiosqlite", "jose", "passlib", "moat.server",
+]
+
+
+def measure_import(module: str) -> Tuple[float, List[str]]:
+    """Returns (cumulative import time in ms, names of all modules imported) for a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    cumulative_us = None
+    imported: List[str] = []
+    for line in result.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indented module name>"
+        if not line.startswith("import time:"): continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit(): continue
+        name = fields[2].strip()
+        imported.append(name)
+        if name == module:
+            cumulative_us = int(fields[1])
+    if cumulative_us is None:
+        raise RuntimeError(f"Could not find '{module}' in -X importtime output.")
+    return cumulative_us / 1000.0, imported
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=None, help="Override the budget for every module.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module; the median is compared.")
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget_ms in DEFAULT_BUDGETS_MS.items():
+        budget_ms = args.budget_ms if args.budget_ms is not None else budget_ms
+        timings = []
+        imported: List[str] = []
+        for _ in range(args.runs):
+            elapsed_ms, imported = measure_import(module)
+            timings.append(elapsed_ms)
+        median_ms = statistics.median(timings)
+        status = "OK" if median_ms <= budget_ms else "OVER BUDGET"
+        print(f"{module}: median {median_ms:.1f} ms over {args.runs} runs (budget {budget_ms:.0f} ms) {status}")
+        if median_ms > budget_ms: failed = True
+
+        leaked = sorted(set(imported) & set(FORBIDDEN_AT_IMPORT))
+        if leaked:
+            print(f"{module}: imports server-only modules at load time: {', '.join(leaked)}")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+End-to-end load benchmark for Moat.
+
+Boots a real Moat server (uvicorn, in a temporary working directory), the stand-in backends from
+benchmarks/upstreams.py and a fake Docker engine, then drives each scenario with an async
+closed-loop load generator. Reports RPS, p50/p99 latency, and the Moat process's CPU time per
+request and RSS (read from /proc, so those two are Linux-only).
+
+    python benchmarks/load_test.py run [--scenarios auth_proxy,large_download] [--duration 10]
+                                       [--concurrency 32] [--output results.json]
+                                       [--compare baseline.json] [--tolerance 0.10]
+    python benchmarks/load_test.py compare results.json baseline.json [--tolerance 0.10]
+
+`compare` (or `run --compare`) exits with status 1 if any scenario regressed beyond the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from fake_docker_engine import FakeDockerEngine  # noqa: E402
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BENCH_USERNAME = "bench"
+STATIC_HOST = "bench.local"
+DOCKER_HOST_NAME = "docker.bench.local"
+MOAT_HOST = "moat.bench.local"
+UPLOAD_BODY_SIZE = 4 * 1024 * 1024
+
+# name -> request shape. "concurrency" caps the global --concurrency for heavy scenarios.
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "auth_proxy": {"host": STATIC_HOST, "path": "/fast", "cookie": True, "expect": {200}},
+    "unauth_redirect": {"host": STATIC_HOST, "path": "/fast", "cookie": False, "expect": {307}},
+    "large_download": {"host": STATIC_HOST, "path": "/large?size=8388608", "cookie": True, "expect": {200}, "concurrency": 8},
+    "streaming": {"host": STATIC_HOST, "path": "/stream?chunks=32", "cookie": True, "expect": {200}, "concurrency": 8},
+    "large_upload": {"host": STATIC_HOST, "path": "/upload", "method": "POST", "body_size": UPLOAD_BODY_SIZE, "cookie": True, "expect": {200}, "concurrency": 8},
+    "docker_churn": {"host": DOCKER_HOST_NAME, "path": "/fast", "cookie": True, "expect": {200}, "churn": True},
+}
+
+# metric -> True if higher is better
+COMPARED_METRICS = {"rps": True, "p50_ms": False, "p99_ms": False, "cpu_ms_per_request": False, "rss_peak_mib": False}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+class ProcessSampler:
+    """Reads CPU time and RSS of a process from /proc."""
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            fields = Path(f"/proc/{self.pid}/stat").read_text().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self.clock_ticks  # utime + stime
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def rss_mib(self) -> Optional[float]:
+        try:
+            for line in Path(f"/proc/{self.pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        except (OSError, ValueError):
+            pass
+        return None
+
+
+class BenchEnvironment:
+    """Moat + stand-in upstream + fake Docker engine, all on localhost."""
+    def __init__(self, churn_containers: int):
+        self.workdir = Path(tempfile.mkdtemp(prefix="moat-bench-"))
+        self.moat_port = _free_port()
+        self.upstream_port = _free_port()
+        self.docker_socket = str(self.workdir / "docker.sock")
+        self.churn_container_ids = [f"{i:064x}" for i in range(1, churn_containers + 1)]
+        self.engine = FakeDockerEngine()
+        self.processes: List[subprocess.Popen] = []
+        self.moat_process: Optional[subprocess.Popen] = None
+        self.token = ""
+
+    @property
+    def moat_url(self) -> str:
+        return f"http://127.0.0.1:{self.moat_port}"
+
+    def _write_config(self):
+        (self.workdir / "moat").symlink_to(REPO_ROOT / "moat")
+        config = f"""
+listen_host: 127.0.0.1
+listen_port: {self.moat_port}
+secret_key: bench-secret-key-not-for-production
+access_token_expire_minutes: 600
+database_url: sqlite+aiosqlite:///./moat.db
+moat_base_url: http://{MOAT_HOST}
+cookie_domain: null
+docker_monitor_enabled: true
+moat_label_prefix: moat
+registry_snapshot_path: null
+slow_request_threshold_ms: null
+static_services:
+- hostname: {STATIC_HOST}
+  target_url: http://127.0.0.1:{self.upstream_port}
+"""
+        (self.workdir / "config.yml").write_text(config)
+
+    def _create_user_and_token(self):
+        script = (
+            "import asyncio\n"
+            "from moat import database, models\n"
+            "from moat.security import create_access_token\n"
+            "async def main():\n"
+            "    await database.init_db()\n"
+            f"    await database.create_user_db(models.User(username={BENCH_USERNAME!r}), 'bench-password')\n"
+            "asyncio.run(main())\n"
+            f"print(create_access_token({{'sub': {BENCH_USERNAME!r}}}))\n"
+        )
+        result = subprocess.run([sys.executable, "-c", script], cwd=self.workdir, env=self._env(), capture_output=True, text=True, check=True)
+        self.token = result.stdout.strip().splitlines()[-1]
+
+    def _env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        env["PYTHONPATH"] = str(REPO_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+        env["DOCKER_HOST"] = f"unix://{self.docker_socket}"
+        env.pop("HOSTNAME", None)
+        return env
+
+    async def start(self):
+        self._write_config()
+        self._create_user_and_token()
+
+        await self.engine.start(self.docker_socket)
+        labels = {"moat.enable": "true", "moat.hostname": DOCKER_HOST_NAME, "moat.port": "80"}
+        self.engine.add_container("f" * 64, "bench-docker-app", labels, published_port=self.upstream_port)
+        for i, container_id in enumerate(self.churn_container_ids):
+            churn_labels = {"moat.enable": "true", "moat.hostname": f"churn-{i}.bench.local", "moat.port": "80"}
+            self.engine.add_container(container_id, f"bench-churn-{i}", churn_labels, published_port=self.upstream_port, running=False)
+
+        self.processes.append(subprocess.Popen(
+            [sys.executable, str(REPO_ROOT / "benchmarks" / "upstreams.py"), "--port", str(self.upstream_port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+        self.moat_process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "moat.server:app", "--host", "127.0.0.1", "--port", str(self.moat_port),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=self.workdir, env=self._env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.processes.append(self.moat_process)
+        await self._wait_until_ready()
+
+    async def _wait_until_ready(self, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                try:
+                    headers = {"Host": DOCKER_HOST_NAME, "Cookie": f"moat_access_token={self.token}"}
+                    async with session.get(f"{self.moat_url}/fast", headers=headers, allow_redirects=False) as resp:
+                        if resp.status == 200: return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError("Moat did not become ready (static and Docker routes) in time.")
+
+    async def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try: process.wait(timeout=10)
+            except subprocess.TimeoutExpired: process.kill()
+        await self.engine.stop()
+
+
+async def _churn_containers(engine: FakeDockerEngine, container_ids: List[str], interval: float):
+    """Starts and kills the churn containers round-robin, like a crash-looping compose stack."""
+    running = set()
+    index = 0
+    while True:
+        container_id = container_ids[index % len(container_ids)]
+        engine.emit("die" if container_id in running else "start", container_id)
+        running.symmetric_difference_update({container_id})
+        index += 1
+        await asyncio.sleep(interval)
+
+
+async def run_scenario(env: BenchEnvironment, name: str, duration: float, concurrency: int, warmup: float) -> Dict[str, Any]:
+    scenario = SCENARIOS[name]
+    concurrency = min(concurrency, scenario.get("concurrency", concurrency))
+    method = scenario.get("method", "GET")
+    body = b"u" * scenario["body_size"] if scenario.get("body_size") else None
+    headers = {"Host": scenario["host"]}
+    if scenario["cookie"]:
+        headers["Cookie"] = f"moat_access_token={env.token}"
+    url = f"{env.moat_url}{scenario['path']}"
+
+    latencies: List[float] = []
+    errors = 0
+    bytes_received = 0
+    recording = False
+
+    async def worker(session: aiohttp.ClientSession, stop_at: float):
+        nonlocal errors, bytes_received
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                async with session.request(method, url, headers=headers, data=body, allow_redirects=False) as resp:
+                    payload = await resp.read()
+                    ok = resp.status in scenario["expect"]
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                ok, payload = False, b""
+            if not recording: continue
+            latencies.append(time.perf_counter() - started)
+            bytes_received += len(payload)
+            if not ok: errors += 1
+
+    churn_task = None
+    if scenario.get("churn") and env.churn_container_ids:
+        churn_task = asyncio.get_running_loop().create_task(_churn_containers(env.engine, env.churn_container_ids, 0.01))
+
+    sampler = ProcessSampler(env.moat_process.pid)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        if warmup > 0:
+            await asyncio.gather(*(worker(session, time.monotonic() + warmup) for _ in range(concurrency)))
+        recording = True
+        cpu_before = sampler.cpu_seconds()
+        rss_samples: List[float] = []
+        started = time.perf_counter()
+        stop_at = time.monotonic() + duration
+        load = asyncio.gather(*(worker(session, stop_at) for _ in range(concurrency)))
+        while not load.done():
+            rss = sampler.rss_mib()
+            if rss is not None: rss_samples.append(rss)
+            await asyncio.wait([load], timeout=0.2)
+        await load
+        elapsed = time.perf_counter() - started
+        cpu_after = sampler.cpu_seconds()
+
+    if churn_task:
+        churn_task.cancel()
+        try: await churn_task
+        except asyncio.CancelledError: pass
+
+    latencies.sort()
+    requests = len(latencies)
+    cpu_ms_per_request = None
+    if cpu_before is not None and cpu_after is not None and requests:
+        cpu_ms_per_request = (cpu_after - cpu_before) * 1000 / requests
+    return {
+        "requests": requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "mib_per_second": round(bytes_received / elapsed / 1024 / 1024, 2) if elapsed else 0.0,
+        "cpu_ms_per_request": round(cpu_ms_per_request, 4) if cpu_ms_per_request is not None else None,
+        "rss_peak_mib": round(max(rss_samples), 1) if rss_samples else None,
+        "rss_end_mib": round(rss_samples[-1], 1) if rss_samples else None,
+    }
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """Prints a per-scenario comparison. Returns True if any compared metric regressed beyond tolerance."""
+    regressed = False
+    for name, result in current.get("scenarios", {}).items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            print(f"{name}: no baseline")
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            new_value, old_value = result.get(metric), base.get(metric)
+            if new_value is None or not old_value: continue
+            change = (new_value - old_value) / old_value
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            if flag: regressed = True
+            print(f"{name:16} {metric:20} {old_value:>12} -> {new_value:>12} ({change:+.1%}) {flag}")
+    return regressed
+
+
+async def run_benchmarks(args) -> Dict[str, Any]:
+    names = [n.strip() for n in args.scenarios.split(",")] if args.scenarios else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(unknown)}. Available: {', '.join(SCENARIOS)}")
+
+    env = BenchEnvironment(churn_containers=args.churn_containers)
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": time.time(), "python": platform.python_version(), "platform": platform.platform(),
+            "duration_s": args.duration, "concurrency": args.concurrency,
+        },
+        "scenarios": {},
+    }
+    await env.start()
+    try:
+        for name in names:
+            print(f"Running {name}...", flush=True)
+            result = await run_scenario(env, name, args.duration, args.concurrency, args.warmup)
+            results["scenarios"][name] = result
+            print(f"  {result['rps']} req/s, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+                  f"cpu {result['cpu_ms_per_request']} ms/req, rss peak {result['rss_peak_mib']} MiB, errors {result['errors']}")
+    finally:
+        await env.stop()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Boot Moat and run load scenarios.")
+    run_parser.add_argument("--scenarios", default="", help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    run_parser.add_argument("--duration", type=float, default=10.0, help="Seconds of measured load per scenario.")
+    run_parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of unmeasured load before each scenario.")
+    run_parser.add_argument("--concurrency", type=int, default=32)
+    run_parser.add_argument("--churn-containers", type=int, default=50, help="Containers cycled during docker_churn.")
+    run_parser.add_argument("--output", default="", help="Write results JSON here.")
+    run_parser.add_argument("--compare", default="", help="Baseline results JSON to compare against.")
+    run_parser.add_argument("--tolerance", type=float, default=0.10)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files.")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--tolerance", type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        current = json.loads(Path(args.current).read_text())
+        baseline = json.loads(Path(args.baseline).read_text())
+        return 1 if compare_results(current, baseline, args.tolerance) else 0
+
+    results = asyncio.run(run_benchmarks(args))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"Results written to {args.output}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        return 1 if compare_results(results, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Micro-benchmarks for Moat's per-request and per-reload hot paths.
+
+Each case runs in-process (no server, no network) against a throwaway config, and reports the
+best and median time per operation over several repeats:
+
+    registry_lookup_{10,1k,50k}   ServiceRegistry.get_target_url with that many entries
+    proxy_headers                 backend URL + request header filtering/X-Forwarded-* + response header filtering
+    decode_access_token           JWT verification of a session cookie
+    process_container_labels      applying a labelled container (start event) to the registry
+    apply_settings_noop_2k        config reload with 2000 unchanged static services
+    apply_settings_update_2k      config reload where all 2000 static targets changed
+
+    python benchmarks/micro.py run [--cases registry_lookup_50k,proxy_headers] [--repeats 7]
+                                   [--output results.json] [--compare baseline.json] [--tolerance 0.15]
+    python benchmarks/micro.py compare results.json baseline.json [--tolerance 0.15]
+
+Cases are compared on the best (minimum) time per operation, the least noisy statistic for
+code this small. `compare` (or `run --compare`) exits with status 1 if any case got slower than
+the baseline by more than the tolerance.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+STATIC_SERVICE_COUNT = 2000
+TARGET_REPEAT_SECONDS = 0.2
+
+# A typical browser request as seen by Moat behind nothing (no X-Forwarded-* yet).
+REQUEST_HEADERS: List[Tuple[bytes, bytes]] = [
+    (b"host", b"app.bench.local"),
+    (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64; rv:131.0) Gecko/20100101 Firefox/131.0"),
+    (b"accept", b"text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"),
+    (b"accept-language", b"en-US,en;q=0.5"),
+    (b"accept-encoding", b"gzip, deflate, br"),
+    (b"connection", b"keep-alive"),
+    (b"cookie", b"moat_access_token=placeholder; theme=dark"),
+    (b"upgrade-insecure-requests", b"1"),
+    (b"sec-fetch-dest", b"document"),
+    (b"sec-fetch-mode", b"navigate"),
+    (b"sec-fetch-site", b"none"),
+    (b"priority", b"u=0, i"),
+]
+RESPONSE_HEADERS: Dict[str, str] = {
+    "Content-Type": "text/html; charset=utf-8", "Content-Length": "5120", "Connection": "keep-alive",
+    "Keep-Alive": "timeout=5", "Date": "Mon, 19 Oct 2026 12:00:00 GMT", "ETag": '"abc123"',
+    "Cache-Control": "no-cache", "Vary": "Accept-Encoding", "X-Frame-Options": "SAMEORIGIN",
+}
+
+# name -> async factory returning (operation, operations per call). The factory does all setup.
+CaseFactory = Callable[[], Awaitable[Tuple[Callable[[], Any], int]]]
+
+
+def _write_config(workdir: Path):
+    services = "".join(
+        f"- hostname: svc{i}.bench.local\n  target_url: http://127.0.0.1:{10000 + i}\n" for i in range(STATIC_SERVICE_COUNT)
+    )
+    (workdir / "config.yml").write_text(
+        "secret_key: bench-secret-key-not-for-production\n"
+        "moat_base_url: http://moat.bench.local\n"
+        "docker_monitor_enabled: false\n"
+        "moat_label_prefix: moat\n"
+        "registry_snapshot_path: null\n"
+        "static_services:\n" + services
+    )
+
+
+def _registry_lookup_case(size: int) -> CaseFactory:
+    async def factory():
+        from moat.service_registry import ServiceRegistry
+        registry = ServiceRegistry()
+        for i in range(size):
+            registry._services[f"svc{i}.bench.local"] = (f"http://10.0.{i // 250}.{i % 250}:80", "static", None)
+        hostnames = [f"svc{i * 7919 % size}.bench.local" for i in range(min(size, 1000))] + ["missing.bench.local"]
+
+        async def lookup_all():
+            for hostname in hostnames:
+                await registry.get_target_url(hostname)
+        return lookup_all, len(hostnames)
+    return factory
+
+
+async def _proxy_headers_case():
+    from starlette.requests import Request
+    from moat.proxy import build_backend_url, build_backend_headers, filter_response_headers
+    scope = {
+        "type": "http", "method": "GET", "scheme": "http", "path": "/dashboard/overview", "raw_path": b"/dashboard/overview",
+        "query_string": b"tab=1&sort=desc", "headers": REQUEST_HEADERS, "client": ("192.0.2.10", 51234),
+        "server": ("127.0.0.1", 8000), "root_path": "", "http_version": "1.1",
+    }
+
+    def build():
+        # A fresh Request per call, as in reverse_proxy: starlette caches parsed headers/url on the instance.
+        request = Request(scope)
+        target_url = build_backend_url("http://127.0.0.1:9090", request)
+        build_backend_headers(request, "app.bench.local", target_url)
+        filter_response_headers(RESPONSE_HEADERS)
+    return build, 1
+
+
+async def _decode_access_token_case():
+    from moat.security import create_access_token, decode_access_token
+    token = create_access_token({"sub": "bench"})
+    return (lambda: decode_access_token(token)), 1
+
+
+async def _process_container_labels_case():
+    from moat.docker_monitor import process_container_labels
+    container = {
+        "id": "c0ffee" * 10 + "beef", "name": "bench-web",
+        "labels": {"moat.enable": "true", "moat.hostname": "web.bench.local", "moat.port": "80", "com.example.team": "bench"},
+        "ports": {"80/tcp": [{"HostIp": "0.0.0.0", "HostPort": "18080"}]},
+        "networks": {"bridge": "172.17.0.5"},
+    }
+
+    async def apply():
+        await process_container_labels(container, "start")
+    return apply, 1
+
+
+def _apply_settings_case(update_targets: bool) -> CaseFactory:
+    async def factory():
+        from moat import config
+        from moat.runtime_config import apply_settings_changes_to_runtime
+        from moat.service_registry import registry
+        settings = config.get_settings()
+        alternate = settings.model_copy(update={"static_services": [
+            s.model_copy(update={"target_url": str(s.target_url).replace("127.0.0.1", "127.0.0.2")}) for s in settings.static_services
+        ]})
+        await apply_settings_changes_to_runtime(None, settings)
+        state = {"current": settings}
+
+        async def reload():
+            new = (alternate if state["current"] is settings else settings) if update_targets else settings
+            await apply_settings_changes_to_runtime(state["current"], new)
+            state["current"] = new
+
+        async def reset():
+            registry._services.clear()
+        return reload, 1, reset
+    return factory
+
+
+CASES: Dict[str, CaseFactory] = {
+    "registry_lookup_10": _registry_lookup_case(10),
+    "registry_lookup_1k": _registry_lookup_case(1000),
+    "registry_lookup_50k": _registry_lookup_case(50000),
+    "proxy_headers": _proxy_headers_case,
+    "decode_access_token": _decode_access_token_case,
+    "process_container_labels": _process_container_labels_case,
+    "apply_settings_noop_2k": _apply_settings_case(update_targets=False),
+    "apply_settings_update_2k": _apply_settings_case(update_targets=True),
+}
+
+
+async def _timed_calls(operation: Callable[[], Any], calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        result = operation()
+        if asyncio.iscoroutine(result): await result
+    return time.perf_counter() - started
+
+
+async def run_case(name: str, repeats: int) -> Dict[str, Any]:
+    setup = await CASES[name]()
+    operation, ops_per_call = setup[0], setup[1]
+    # Calibrate: grow the call count until one repeat takes about TARGET_REPEAT_SECONDS.
+    calls = 1
+    while True:
+        elapsed = await _timed_calls(operation, calls)
+        if elapsed >= TARGET_REPEAT_SECONDS / 4 or calls >= 1_000_000: break
+        calls *= 4
+    calls = max(1, int(calls * TARGET_REPEAT_SECONDS / max(elapsed, 1e-9)))
+
+    per_op_ns = []
+    for _ in range(repeats):
+        elapsed = await _timed_calls(operation, calls)
+        per_op_ns.append(elapsed * 1e9 / (calls * ops_per_call))
+    if len(setup) > 2: await setup[2]()
+    return {
+        "best_ns": round(min(per_op_ns), 1), "median_ns": round(statistics.median(per_op_ns), 1),
+        "ops_per_repeat": calls * ops_per_call, "repeats": repeats,
+    }
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """Prints a per-case comparison of best_ns. Returns True if any case regressed beyond tolerance."""
+    regressed = False
+    for name, result in current.get("cases", {}).items():
+        base = baseline.get("cases", {}).get(name)
+        if not base or not base.get("best_ns"):
+            print(f"{name}: no baseline")
+            continue
+        change = (result["best_ns"] - base["best_ns"]) / base["best_ns"]
+        flag = "REGRESSION" if change > tolerance else ""
+        if flag: regressed = True
+        print(f"{name:26} {base['best_ns']:>14.1f} ns -> {result['best_ns']:>14.1f} ns ({change:+.1%}) {flag}")
+    return regressed
+
+
+async def run_benchmarks(args) -> Dict[str, Any]:
+    names = [n.strip() for n in args.cases.split(",")] if args.cases else list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        raise SystemExit(f"Unknown case(s): {', '.join(unknown)}. Available: {', '.join(CASES)}")
+
+    results: Dict[str, Any] = {
+        "meta": {"timestamp": time.time(), "python": platform.python_version(), "platform": platform.platform(), "repeats": args.repeats},
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="moat-micro-") as tmp:
+        workdir = Path(tmp)
+        _write_config(workdir)
+        from moat import config
+        from moat.dns_cache import dns_cache
+        config.CONFIG_FILE_PATH = workdir / "config.yml"
+        # Moat logs with print(); keep that out of both the timings and the report.
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                config.load_config()
+            try:
+                for name in names:
+                    with contextlib.redirect_stdout(devnull):
+                        result = await run_case(name, args.repeats)
+                    results["cases"][name] = result
+                    print(f"{name:26} best {result['best_ns']:>12.1f} ns/op, median {result['median_ns']:>12.1f} ns/op", flush=True)
+            finally:
+                await dns_cache.stop()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run micro-benchmark cases.")
+    run_parser.add_argument("--cases", default="", help=f"Comma-separated subset of: {', '.join(CASES)}")
+    run_parser.add_argument("--repeats", type=int, default=7)
+    run_parser.add_argument("--output", default="", help="Write results JSON here.")
+    run_parser.add_argument("--compare", default="", help="Baseline results JSON to compare against.")
+    run_parser.add_argument("--tolerance", type=float, default=0.15)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files.")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15)
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        current = json.loads(Path(args.current).read_text())
+        baseline = json.loads(Path(args.baseline).read_text())
+        return 1 if compare_results(current, baseline, args.tolerance) else 0
+
+    results = asyncio.run(run_benchmarks(args))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"Results written to {args.output}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        return 1 if compare_results(results, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Stand-in backends for Moat benchmarks.
+
+One aiohttp app serves every behaviour the load scenarios need, selected by path:
+
+    /fast                 small response after --latency-ms
+    /large?size=N         N-byte body (default 8 MiB)
+    /stream?chunks=N      chunked response, N chunks of --chunk-size bytes, --chunk-interval-ms apart
+    /upload               reads the request body slowly (a "slow reader"), returns the byte count
+
+    python benchmarks/upstreams.py --port 9500 [--latency-ms 5]
+"""
+import argparse
+import asyncio
+
+from aiohttp import web
+
+DEFAULT_LARGE_BODY_SIZE = 8 * 1024 * 1024
+
+
+def build_app(latency_ms: float, chunk_size: int, chunk_interval_ms: float, upload_read_delay_ms: float) -> web.Application:
+    large_bodies = {}
+
+    async def fast(request: web.Request) -> web.Response:
+        if latency_ms: await asyncio.sleep(latency_ms / 1000)
+        return web.json_response({"ok": True, "path": request.path})
+
+    async def large(request: web.Request) -> web.Response:
+        size = int(request.query.get("size", DEFAULT_LARGE_BODY_SIZE))
+        body = large_bodies.get(size)
+        if body is None:
+            body = large_bodies[size] = b"x" * size
+        return web.Response(body=body, content_type="application/octet-stream")
+
+    async def stream(request: web.Request) -> web.StreamResponse:
+        chunks = int(request.query.get("chunks", 16))
+        response = web.StreamResponse(headers={"Content-Type": "application/octet-stream"})
+        await response.prepare(request)
+        chunk = b"s" * chunk_size
+        for _ in range(chunks):
+            await response.write(chunk)
+            if chunk_interval_ms: await asyncio.sleep(chunk_interval_ms / 1000)
+        await response.write_eof()
+        return response
+
+    async def upload(request: web.Request) -> web.Response:
+        received = 0
+        async for data in request.content.iter_chunked(64 * 1024):
+            received += len(data)
+            if upload_read_delay_ms: await asyncio.sleep(upload_read_delay_ms / 1000)
+        return web.json_response({"received": received})
+
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_route("*", "/fast", fast)
+    app.router.add_get("/large", large)
+    app.router.add_get("/stream", stream)
+    app.router.add_post("/upload", upload)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Delay before /fast responds.")
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    parser.add_argument("--chunk-interval-ms", type=float, default=1.0)
+    parser.add_argument("--upload-read-delay-ms", type=float, default=1.0, help="Pause between 64 KiB reads in /upload.")
+    args = parser.parse_args()
+    app = build_app(args.latency_ms, args.chunk_size, args.chunk_interval_ms, args.upload_read_delay_ms)
+    web.run_app(app, host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .metrics import metrics_registry, access_log_records_total, Gauge
+
+class AccessLog:
+    """
+    JSON-lines access log. log() only appends to an in-memory buffer; a background task hands the
+    buffer to a single writer thread in batches, so a slow disk delays the log, never requests.
+    When the buffer is full, records are dropped and counted instead of waiting for the writer.
+    """
+    def __init__(self):
+        self.path: Optional[Path] = None
+        self.max_bytes = 0
+        self.rotate_seconds = 0
+        self.backup_count = 5
+        self.max_buffered_records = 10000
+        self.flush_interval_seconds = 1.0
+        self.dropped_records = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._flush_wanted = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._reported_dropped_records = 0
+        # Writer-thread state
+        self._file = None
+        self._file_path: Optional[Path] = None
+        self._file_size = 0
+        self._file_opened_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def configure(self, path: Optional[str], max_bytes: int, rotate_seconds: int, backup_count: int,
+                  max_buffered_records: int, flush_interval_seconds: float):
+        self.path = Path(path) if path else None
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.max_buffered_records = max_buffered_records
+        self.flush_interval_seconds = flush_interval_seconds
+
+    def log(self, record: Dict[str, Any]):
+        if self.path is None: return
+        if len(self._buffer) >= self.max_buffered_records:
+            self.dropped_records += 1
+            access_log_records_total.inc("dropped")
+            return
+        self._buffer.append(record)
+        if len(self._buffer) == self.max_buffered_records // 2:
+            self._flush_wanted.set()
+
+    def start(self):
+        if self.path is None or (self._task and not self._task.done()): return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="moat-access-log")
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try: await asyncio.wait_for(self._flush_wanted.wait(), timeout=self.flush_interval_seconds)
+            except asyncio.TimeoutError: pass
+            self._flush_wanted.clear()
+            await self.flush()
+
+    async def flush(self):
+        if self.dropped_records != self._reported_dropped_records:
+            print(f"Access Log: Dropped {self.dropped_records - self._reported_dropped_records} record(s); the writer is falling behind.")
+            self._reported_dropped_records = self.dropped_records
+        if not self._buffer or self._executor is None: return
+        batch, self._buffer = self._buffer, []
+        path = self.path
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write_batch, batch, path)
+            access_log_records_total.inc("written", amount=len(batch))
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Access Log: Error writing {len(batch)} record(s) to {path}: {e}")
+            self.dropped_records += len(batch)
+            self._reported_dropped_records += len(batch)
+            access_log_records_total.inc("dropped", amount=len(batch))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            self._task = None
+        await self.flush()
+        if self._executor:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._close_file)
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # --- Writer thread ---
+
+    def _write_batch(self, batch: List[Dict[str, Any]], path: Optional[Path]):
+        if path is None: return
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in batch).encode()
+        if self._file is None or self._file_path != path:
+            self._open_file(path)
+        elif self._should_rotate(len(data)):
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+
+    def _should_rotate(self, incoming_bytes: int) -> bool:
+        if self._file_size == 0: return False
+        if self.max_bytes and self._file_size + incoming_bytes > self.max_bytes: return True
+        return bool(self.rotate_seconds) and time.time() - self._file_opened_at >= self.rotate_seconds
+
+    def _open_file(self, path: Path):
+        self._close_file()
+        self._file = open(path, "ab")
+        self._file_path = path
+        self._file_size = self._file.tell()
+        self._file_opened_at = time.time()
+        if self._should_rotate(0): self._rotate()
+
+    def _rotate(self):
+        path = self._file_path
+        self._close_file()
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                older = path.with_name(f"{path.name}.{index}")
+                if older.exists(): older.replace(path.with_name(f"{path.name}.{index + 1}"))
+            path.replace(path.with_name(f"{path.name}.1"))
+        else:
+            path.unlink(missing_ok=True)
+        self._open_file(path)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+# Global instance
+access_log = AccessLog()
+
+metrics_registry.register(Gauge("moat_access_log_buffered_records", "Access log records waiting for the writer.", value_callback=lambda: len(access_log._buffer)))
@@ -0,0 +1,101 @@
+from typing import Dict, FrozenSet, Iterable, Mapping, Optional, Tuple
+
+from .models import AccessPolicyConfig
+
+Policy = Tuple[FrozenSet[str], FrozenSet[str]] # (allowed users, allowed groups)
+
+def compile_configured_policies(policies: Mapping[str, AccessPolicyConfig]) -> Dict[str, Policy]:
+    """access_policies from config in the form AccessPolicies works with; built once per config load (see DerivedSettings)."""
+    return {hostname: (frozenset(policy.allowed_users), frozenset(policy.allowed_groups)) for hostname, policy in policies.items()}
+
+def parse_label_list(value: Optional[str]) -> FrozenSet[str]:
+    return frozenset(item.strip() for item in (value or "").split(",") if item.strip())
+
+
+class AccessPolicies:
+    """
+    Per-service allow lists from config (access_policies) and Docker labels; config wins for a hostname
+    that has both. Services without a policy are open to every authenticated user.
+
+    Policies are compiled whenever they change: each group named by any policy gets a bit, and each
+    service keeps (allowed users, allowed-group bitmask). A user's group set is turned into a bitmask
+    once (memoized per distinct set), so allows() is a set lookup plus an AND, with no database access.
+    """
+    def __init__(self):
+        self._configured: Dict[str, Policy] = {}
+        self._docker: Dict[str, Policy] = {}
+        self._docker_hostnames_by_container: Dict[str, str] = {}
+        self._compiled: Dict[str, Tuple[FrozenSet[str], int]] = {}
+        self._group_bits: Dict[str, int] = {}
+        self._mask_cache: Dict[FrozenSet[str], int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._compiled)
+
+    def configure(self, policies: Mapping[str, Policy]):
+        """Takes the config's policies as compiled by compile_configured_policies()."""
+        self._configured = dict(policies)
+        self._compile()
+
+    def set_docker_policy(self, hostname: str, container_id: Optional[str], allowed_users: FrozenSet[str], allowed_groups: FrozenSet[str]):
+        """Sets (or, with both lists empty, clears) the label policy of a Docker-discovered service."""
+        policy = (allowed_users, allowed_groups) if allowed_users or allowed_groups else None
+        if self._docker.get(hostname) == policy and (container_id is None or self._docker_hostnames_by_container.get(container_id) == hostname):
+            return
+        if policy is None: self._docker.pop(hostname, None)
+        else: self._docker[hostname] = policy
+        if container_id is not None: self._docker_hostnames_by_container[container_id] = hostname
+        self._compile()
+
+    def remove_container(self, container_id: str):
+        hostname = self._docker_hostnames_by_container.pop(container_id, None)
+        if hostname is not None and hostname not in self._docker_hostnames_by_container.values() and self._docker.pop(hostname, None):
+            self._compile()
+
+    def _compile(self):
+        merged = {**self._docker, **self._configured}
+        group_bits: Dict[str, int] = {}
+        compiled: Dict[str, Tuple[FrozenSet[str], int]] = {}
+        for hostname, (allowed_users, allowed_groups) in merged.items():
+            mask = 0
+            for group in allowed_groups:
+                if group not in group_bits: group_bits[group] = 1 << len(group_bits)
+                mask |= group_bits[group]
+            compiled[hostname] = (allowed_users, mask)
+        self._group_bits, self._compiled, self._mask_cache = group_bits, compiled, {}
+        print(f"Access Policies: {len(compiled)} service(s) restricted, {len(group_bits)} group(s) referenced")
+
+    def group_mask(self, groups: FrozenSet[str]) -> int:
+        mask = self._mask_cache.get(groups)
+        if mask is None:
+            mask = 0
+            for group in groups: mask |= self._group_bits.get(group, 0)
+            self._mask_cache[groups] = mask
+        return mask
+
+    def allows(self, hostname: str, username: str, groups: FrozenSet[str]) -> bool:
+        policy = self._compiled.get(hostname)
+        if policy is None: return True
+        allowed_users, allowed_group_mask = policy
+        return username in allowed_users or bool(allowed_group_mask and allowed_group_mask & self.group_mask(groups))
+
+    def docker_policies(self) -> Dict[str, Dict[str, list]]:
+        """Label policies in JSON form, saved with the registry snapshot."""
+        return {hostname: {"allowed_users": sorted(users), "allowed_groups": sorted(groups)}
+                for hostname, (users, groups) in self._docker.items()}
+
+    def restore_docker_policies(self, policies: Mapping[str, Mapping[str, Iterable[str]]], container_ids: Mapping[str, str]):
+        """
+        Restores label policies of the routes loaded from a registry snapshot (container_ids: hostname -> container),
+        so restored routes are never briefly unrestricted before the Docker scan re-reads the labels.
+        """
+        for hostname, container_id in container_ids.items():
+            policy = policies.get(hostname)
+            if policy is None or hostname in self._docker: continue
+            self._docker[hostname] = (frozenset(policy.get("allowed_users") or ()), frozenset(policy.get("allowed_groups") or ()))
+            self._docker_hostnames_by_container[container_id] = hostname
+        self._compile()
+
+# Global instance
+access_policies = AccessPolicies()
@@ -0,0 +1,144 @@
+import asyncio
+import hmac
+from typing import Dict, List, Optional
+
+import yaml
+from fastapi import APIRouter, Request, HTTPException, Depends, status
+from pydantic import BaseModel
+
+from moat.models import StaticServiceConfig
+from moat.dependencies import get_current_user_from_cookie
+from moat.config import get_settings, get_derived_settings, update_static_services, persist_static_services
+from moat.config_dir import config_directory
+from moat.service_registry import registry as global_registry
+from moat.dns_cache import dns_cache
+from moat.runtime_config import static_target_hostnames
+
+router = APIRouter(prefix="/moat/admin/api", tags=["admin_api"])
+
+# API changes are applied to the registry immediately; config.yml is rewritten once they stop arriving for this long.
+CONFIG_PERSIST_DELAY_SECONDS = 1.0
+
+_persist_requested = False
+_persist_task: Optional[asyncio.Task] = None
+
+class RouteBatch(BaseModel):
+    upsert: List[StaticServiceConfig] = []
+    remove: List[str] = []
+
+def _is_same_origin(request: Request) -> bool:
+    """False for browser requests sent from another site (CSRF). Clients that send neither header (curl) pass."""
+    fetch_site = request.headers.get("sec-fetch-site")
+    if fetch_site is not None:
+        return fetch_site in ("same-origin", "none")
+    origin = request.headers.get("origin")
+    return origin is None or origin.rstrip("/") == get_derived_settings().moat_base_url.rstrip("/")
+
+async def require_api_user(request: Request) -> str:
+    """
+    Accepts `Authorization: Bearer <admin_api_token>` (for automation) or the login cookie of an admin_group
+    member. Cookie-authenticated changes must come from Moat's own origin.
+    """
+    cfg = get_settings()
+    authorization_header = request.headers.get("authorization", "")
+    if cfg.admin_api_token and hmac.compare_digest(authorization_header, f"Bearer {cfg.admin_api_token}"):
+        return "api-token"
+    user = await get_current_user_from_cookie(request)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated.",
+                            headers={"WWW-Authenticate": "Bearer"})
+    if cfg.admin_group not in getattr(request.state, "moat_user_groups", frozenset()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="The Admin API is limited to admin_api_token and the admin group.")
+    if request.method not in ("GET", "HEAD") and not _is_same_origin(request):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Cross-site requests with a login cookie are refused.")
+    return user.username
+
+def _validate_batch(batch: RouteBatch) -> List[Dict[str, object]]:
+    errors = []
+    static_hostnames = {s.hostname for s in get_settings().static_services}
+    seen = set()
+    for index, service in enumerate(batch.upsert):
+        if not service.hostname or "://" in service.hostname or "/" in service.hostname or ":" in service.hostname:
+            errors.append({"op": "upsert", "index": index, "hostname": service.hostname,
+                           "error": "Hostname must be a plain domain name without scheme, port or path."})
+        elif service.hostname in seen:
+            errors.append({"op": "upsert", "index": index, "hostname": service.hostname, "error": "Hostname appears more than once."})
+        elif service.hostname in config_directory.owners:
+            errors.append({"op": "upsert", "index": index, "hostname": service.hostname,
+                           "error": f"Defined in config dir file {config_directory.owners[service.hostname]}; edit that file."})
+        seen.add(service.hostname)
+    for index, hostname in enumerate(batch.remove):
+        if hostname in seen:
+            errors.append({"op": "remove", "index": index, "hostname": hostname, "error": "Hostname is both upserted and removed."})
+        elif hostname in config_directory.owners:
+            errors.append({"op": "remove", "index": index, "hostname": hostname,
+                           "error": f"Defined in config dir file {config_directory.owners[hostname]}; edit that file."})
+        elif hostname not in static_hostnames:
+            errors.append({"op": "remove", "index": index, "hostname": hostname, "error": "No static route with this hostname."})
+        seen.add(hostname)
+    return errors
+
+def _schedule_config_persist():
+    global _persist_requested, _persist_task
+    _persist_requested = True
+    if _persist_task is None or _persist_task.done():
+        _persist_task = asyncio.get_running_loop().create_task(_persist_config_changes(), name="RouteConfigPersist")
+
+async def _persist_config_changes():
+    global _persist_requested
+    loop = asyncio.get_running_loop()
+    while _persist_requested:
+        await asyncio.sleep(CONFIG_PERSIST_DELAY_SECONDS)
+        _persist_requested = False
+        try:
+            await loop.run_in_executor(None, persist_static_services)
+        except (OSError, yaml.YAMLError) as e:
+            print(f"Admin API: Error writing route changes to config: {e}")
+
+async def flush_pending_route_changes():
+    """Writes out route changes still waiting for the coalesced config write (used at shutdown)."""
+    global _persist_requested
+    if _persist_task and not _persist_task.done():
+        _persist_task.cancel()
+        try: await _persist_task
+        except asyncio.CancelledError: pass
+        _persist_requested = True
+    if _persist_requested:
+        _persist_requested = False
+        try: await asyncio.get_running_loop().run_in_executor(None, persist_static_services)
+        except (OSError, yaml.YAMLError) as e: print(f"Admin API: Error writing route changes to config: {e}")
+
+@router.get("/routes")
+async def list_routes(api_user: str = Depends(require_api_user)):
+    services = await global_registry.get_all_services()
+    return {
+        "generation": global_registry.generation,
+        "routes": [{"hostname": hostname, "target_url": target_url, "source": source_type, "container_id": container_id}
+                   for hostname, (target_url, source_type, container_id) in sorted(services.items())],
+    }
+
+@router.post("/routes")
+async def change_routes(batch: RouteBatch, api_user: str = Depends(require_api_user)):
+    """
+    Adds/updates and removes static routes in one all-or-nothing call. Changes take effect immediately;
+    config.yml is rewritten shortly after, once for any burst of calls.
+    """
+    errors = _validate_batch(batch)
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={"errors": errors})
+
+    upserts = {service.hostname: service for service in batch.upsert}
+    removals = set(batch.remove)
+    # Settings are swapped synchronously, so concurrent calls apply in order; the registry lock is FIFO.
+    new_settings = update_static_services(upserts, removals)
+    upserted, removed = await global_registry.apply_changes(
+        {hostname: (str(service.target_url).rstrip('/'), "static", None) for hostname, service in upserts.items()},
+        removals,
+    )
+    dns_cache.set_watched_hostnames(static_target_hostnames(new_settings))
+    _schedule_config_persist()
+    print(f"Admin API: '{api_user}' upserted {len(upserts)} and removed {len(removals)} route(s)")
+    return {
+        "upserted": upserted, "unchanged": len(upserts) - upserted, "removed": removed,
+        "generation": global_registry.generation, "static_routes": len(new_settings.static_services),
+    }
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Request, Depends, Form, HTTPException, status
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request, Depends, Form, HTTPException, Query, status
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 import yaml
 import asyncio
 
 from moat.models import User 
-from moat.dependencies import get_current_user_or_redirect
+from moat.dependencies import get_current_admin_or_redirect
 from moat.config import get_settings, save_settings, CONFIG_FILE_PATH, load_config
 from moat.runtime_config import apply_settings_changes_to_runtime
+from moat.dashboard import dashboard
+from moat.mirroring import traffic_mirror
+from moat.profiling import (
+    MAX_PROFILE_SECONDS, ProfileInProgressError, sample_cpu_profile, memory_snapshot_diff, profile_filename
+)
 
 router = APIRouter(prefix="/moat/admin", tags=["admin_ui"])
 templates = Jinja2Templates(directory="moat/templates")
@@ -15,7 +20,7 @@ templates = Jinja2Templates(directory="moat/templates")
 @router.get("/config", response_class=HTMLResponse)
 async def view_config_form(
     request: Request,
-    current_user: User = Depends(get_current_user_or_redirect),
+    current_user: User = Depends(get_current_admin_or_redirect),
     success: bool = False,
     error: str = None
 ):
@@ -29,8 +34,7 @@ async def view_config_form(
         raw_config_content = f"# Error loading config.yml: {e}"
         error = error or f"Error loading config.yml: {e}"
 
-    return templates.TemplateResponse("admin_config.html", {
-        "request": request,
+    return templates.TemplateResponse(request, "admin_config.html", {
         "current_user": current_user,
         "config_content": raw_config_content,
         "success_message": "Configuration updated successfully and reload attempted!" if success else None,
@@ -41,7 +45,7 @@ async def view_config_form(
 async def save_config_from_form(
     request: Request,
     config_content: str = Form(...),
-    current_user: User = Depends(get_current_user_or_redirect)
+    current_user: User = Depends(get_current_admin_or_redirect)
 ):
     error_message = None
     old_settings_for_apply = None
@@ -52,9 +56,10 @@ async def save_config_from_form(
         if not isinstance(new_config_data, dict):
             raise ValueError("Invalid YAML structure. Root must be a mapping (dictionary).")
 
-        if save_settings(new_config_data): # save_settings also reloads internal _settings in config.py
+        current_loop = asyncio.get_event_loop()
+        # save_settings also reloads internal _settings in config.py; it writes the file and re-reads config_dir, so keep it off the loop.
+        if await current_loop.run_in_executor(None, save_settings, new_config_data):
             reloaded_settings_after_save = get_settings()
-            current_loop = asyncio.get_event_loop()
             await apply_settings_changes_to_runtime(old_settings_for_apply, reloaded_settings_after_save, loop=current_loop)
             
             redirect_url = request.url_for("view_config_form").include_query_params(success=True)
@@ -69,9 +74,60 @@ async def save_config_from_form(
     except Exception as e:
         error_message = f"An unexpected error occurred: {e}"
 
-    return templates.TemplateResponse("admin_config.html", {
-        "request": request,
-        "current_user": current__user,
+    return templates.TemplateResponse(request, "admin_config.html", {
+        "current_user": current_user,
         "config_content": config_content, 
         "error_message": error_message
     })
+
+@router.get("/profile/cpu", response_class=PlainTextResponse)
+async def cpu_profile(
+    seconds: float = Query(10.0, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    include_idle: bool = False,
+    current_user: User = Depends(get_current_admin_or_redirect)
+):
+    """Samples the live event loop and returns collapsed stacks (flamegraph.pl / speedscope input)."""
+    try:
+        collapsed, counts = await sample_cpu_profile(seconds, interval_ms, include_idle)
+    except ProfileInProgressError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(collapsed, headers={
+        "Content-Disposition": f'attachment; filename="{profile_filename("cpu", "collapsed")}"',
+        "X-Moat-Profile-Samples": str(counts["samples"]),
+        "X-Moat-Profile-Idle-Samples": str(counts["idle_samples"]),
+    })
+
+@router.get("/profile/memory", response_class=PlainTextResponse)
+async def memory_profile(
+    seconds: float = Query(10.0, gt=0, le=MAX_PROFILE_SECONDS),
+    top: int = Query(50, ge=1, le=1000),
+    frames: int = Query(1, ge=1, le=50),
+    current_user: User = Depends(get_current_admin_or_redirect)
+):
+    """Traces allocations for a while and returns the allocation sites that grew the most."""
+    try:
+        report = await memory_snapshot_diff(seconds, top, frames)
+    except ProfileInProgressError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(report, headers={
+        "Content-Disposition": f'attachment; filename="{profile_filename("memory", "txt")}"',
+    })
+
+@router.get("/mirror")
+async def mirror_report(current_user: User = Depends(get_current_admin_or_redirect)):
+    """Per-service comparison of primary and mirror status codes and latency."""
+    return traffic_mirror.report()
+
+@router.get("/dashboard", response_class=HTMLResponse)
+async def view_dashboard(request: Request, current_user: User = Depends(get_current_admin_or_redirect)):
+    return templates.TemplateResponse(request, "admin_dashboard.html", {"current_user": current_user})
+
+@router.get("/dashboard/events")
+async def dashboard_events(current_user: User = Depends(get_current_admin_or_redirect)):
+    """Server-sent events: one aggregated per-service stats payload per second, shared by all viewers."""
+    async def event_stream():
+        async for payload in dashboard.subscribe():
+            if payload is not None:
+                yield f"data: {payload}\n\n"
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -3,7 +3,7 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from datetime import timedelta
 from typing import Optional
-from urllib.parse import quote_plus, unquote_plus, urljoin, urlparse
+from urllib.parse import quote_plus, unquote_plus, urlparse
 
 from pydantic import HttpUrl
 
@@ -11,7 +11,7 @@ from .models import User
 from .security import create_access_token, verify_password
 from .database import get_user
 from .dependencies import ACCESS_TOKEN_COOKIE_NAME, get_current_user_from_cookie
-from .config import get_settings
+from .config import get_settings, get_derived_settings
 
 router = APIRouter(prefix="/moat/auth", tags=["authentication"])
 templates = Jinja2Templates(directory="moat/templates")
@@ -26,17 +26,8 @@ async def authenticate_user(username: str, password: str) -> Optional[User]:
 
 @router.get("/login", response_class=HTMLResponse, name="login_form_page")
 async def login_form(request: Request, redirect_uri: Optional[str] = None):
-    cfg = get_settings()
-    moat_admin_config_path_segment = "/moat/admin/config"
-    full_admin_config_url = ""
-
-    if cfg.moat_base_url:
-        moat_base_str_for_join = str(cfg.moat_base_url).rstrip('/') + '/'
-        full_admin_config_url = urljoin(moat_base_str_for_join, moat_admin_config_path_segment.lstrip('/'))
-    else:
-        print("Warning: moat_base_url not configured, admin redirect might be relative.")
-        full_admin_config_url = moat_admin_config_path_segment
-
+    derived = get_derived_settings()
+    full_admin_config_url = derived.admin_config_url
 
     print(f"GET /login - Request URL: {request.url}")
     actual_redirect_uri_from_query = redirect_uri or request.query_params.get("redirect_uri")
@@ -50,25 +41,24 @@ async def login_form(request: Request, redirect_uri: Optional[str] = None):
 
         if actual_redirect_uri_from_query:
             target_if_already_logged_in = unquote_plus(actual_redirect_uri_from_query)
-        elif request.headers.get("referer") and cfg.moat_base_url:
+        elif request.headers.get("referer"):
             try:
                 referer_url_parsed = urlparse(request.headers.get("referer"))
-                moat_host_from_config = urlparse(str(cfg.moat_base_url)).hostname
-                if referer_url_parsed.hostname == moat_host_from_config and full_admin_config_url:
+                if referer_url_parsed.hostname == derived.moat_hostname:
                     target_if_already_logged_in = full_admin_config_url
             except Exception as e:
-                print(f"GET /login - Error parsing referer or moat_base_url: {e}")
-                target_if_already_logged_in = full_admin_config_url if full_admin_config_url else "/"
-        elif full_admin_config_url:
+                print(f"GET /login - Error parsing referer: {e}")
+                target_if_already_logged_in = full_admin_config_url
+        else:
              target_if_already_logged_in = full_admin_config_url
 
         print(f"GET /login - Redirecting already logged-in user to: {target_if_already_logged_in}")
         return RedirectResponse(url=target_if_already_logged_in, status_code=status.HTTP_303_SEE_OTHER)
     print(f"GET /login - Showing login form. Passing redirect_uri to template: {actual_redirect_uri_from_query}")
     return templates.TemplateResponse(
+        request,
         "login.html",
         {
-            "request": request,
             "redirect_uri": actual_redirect_uri_from_query
         }
     )
@@ -85,17 +75,8 @@ async def login_for_access_token(
 
     user = await authenticate_user(username, password)
     cfg = get_settings()
-
-    if not cfg.moat_base_url:
-        print("CRITICAL ERROR: moat_base_url is not configured in POST /login.")
-        raise HTTPException(status_code=500, detail="Auth service misconfigured.")
-
-    moat_auth_base_str = str(cfg.moat_base_url).rstrip('/')
-    login_path_segment = "moat/auth/login"
-    if not moat_auth_base_str.endswith('/'):
-        moat_auth_base_str += '/'
-    base_login_form_url = urljoin(moat_auth_base_str, login_path_segment.lstrip('/'))
-
+    derived = get_derived_settings()
+    base_login_form_url = derived.login_url
 
     if not user:
         print(f"POST /login - Authentication failed for user: {username}")
@@ -117,14 +98,13 @@ async def login_for_access_token(
     if redirect_uri:
         final_redirect_target_url_after_login = unquote_plus(redirect_uri)
     else:
-        moat_admin_config_path_segment = "/moat/admin/config"
-        final_redirect_target_url_after_login = urljoin(moat_auth_base_str, moat_admin_config_path_segment.lstrip('/'))
+        final_redirect_target_url_after_login = derived.admin_config_url
         print(f"POST /login - No specific redirect_uri from form, defaulting to admin config: {final_redirect_target_url_after_login}")
     
     print(f"POST /login - Preparing to redirect to: {final_redirect_target_url_after_login}")
     successful_login_redirect = RedirectResponse(url=final_redirect_target_url_after_login, status_code=status.HTTP_303_SEE_OTHER)
     
-    cookie_domain_setting = cfg.cookie_domain
+    cookie_domain_setting = derived.cookie_domain
     is_secure_connection_for_cookie = (
         request.url.scheme == "https" or
         request.headers.get("x-forwarded-proto") == "https"
@@ -145,24 +125,15 @@ async def login_for_access_token(
 
 @router.get("/logout", name="logout_user")
 async def logout(request: Request):
-    cfg = get_settings()
+    derived = get_derived_settings()
     print(f"GET /logout - User logging out.")
 
-    if not cfg.moat_base_url:
-        print("CRITICAL ERROR: moat_base_url is not configured in GET /logout.")
-        raise HTTPException(status_code=500, detail="Auth service misconfigured.")
-
-    moat_auth_base_str = str(cfg.moat_base_url).rstrip('/')
-    login_path_segment = "moat/auth/login"
-    if not moat_auth_base_str.endswith('/'):
-        moat_auth_base_str += '/'
-    
-    logout_redirect_target_url = urljoin(moat_auth_base_str, login_path_segment.lstrip('/'))
+    logout_redirect_target_url = derived.login_url
     print(f"GET /logout - Redirecting to: {logout_redirect_target_url} after logout.")
 
     response = RedirectResponse(url=logout_redirect_target_url, status_code=status.HTTP_303_SEE_OTHER)
     
-    cookie_domain_setting = cfg.cookie_domain
+    cookie_domain_setting = derived.cookie_domain
     is_secure_connection_for_cookie_delete = (
         request.url.scheme == "https" or
         request.headers.get("x-forwarded-proto") == "https"
@@ -0,0 +1,141 @@
+import ipaddress
+import re
+from typing import Dict, Iterable, List, Optional, Pattern, Union
+
+from .models import AuthBypassRule
+
+ANY_HOSTNAME = "*"
+
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+def _pattern_to_regex(pattern: str) -> str:
+    """
+    Patterns with * or ? are globs over the whole path ("*" stays within one segment, "**" crosses segments).
+    Anything else is a prefix that matches at a segment boundary: "/public" matches "/public" and "/public/x".
+    """
+    if "*" not in pattern and "?" not in pattern:
+        return re.escape(pattern.rstrip("/")) + "(?:/|$)"
+    parts = []
+    for piece in re.split(r"(\*\*|\*|\?)", pattern):
+        if piece == "**": parts.append(".*")
+        elif piece == "*": parts.append("[^/]*")
+        elif piece == "?": parts.append("[^/]")
+        else: parts.append(re.escape(piece))
+    return "".join(parts) + "$"
+
+def _compile_paths(patterns: Iterable[str]) -> Pattern:
+    return re.compile("|".join(f"(?:{_pattern_to_regex(pattern)})" for pattern in patterns))
+
+def _is_unsafe_path(path: str) -> bool:
+    """Paths a backend might normalise to somewhere else (dot segments, backslashes) are never bypassed."""
+    return "\\" in path or any(segment in (".", "..") for segment in path.split("/"))
+
+
+class _CompiledRule:
+    __slots__ = ("name", "methods", "path_regex")
+
+    def __init__(self, rule: AuthBypassRule):
+        self.name = rule.name
+        self.methods = frozenset(method.upper() for method in rule.methods)
+        self.path_regex = _compile_paths(rule.paths) if rule.paths else None
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods and method not in self.methods: return False
+        return self.path_regex is None or self.path_regex.match(path) is not None
+
+
+class _CidrTrie:
+    """Binary prefix tree over address bits; each node lists the rules whose networks end there."""
+    def __init__(self):
+        self._roots: Dict[int, dict] = {4: {}, 6: {}}
+
+    def insert(self, network: IPNetwork, rule_index: int):
+        node = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for depth in range(network.prefixlen):
+            node = node.setdefault((bits >> (width - 1 - depth)) & 1, {})
+        node.setdefault("rules", []).append(rule_index)
+
+    def lookup(self, address: IPAddress) -> List[int]:
+        """Indexes of every rule with a network containing address, most specific network last."""
+        node = self._roots[address.version]
+        bits = int(address)
+        width = address.max_prefixlen
+        found = list(node.get("rules", ()))
+        for depth in range(width):
+            node = node.get((bits >> (width - 1 - depth)) & 1)
+            if node is None: break
+            found.extend(node.get("rules", ()))
+        return found
+
+
+class _HostMatcher:
+    """
+    Bypass rules for one hostname. Path rules that apply to any method share one compiled regex whose
+    named groups say which rule matched; rules with client_cidrs are found through the CIDR trie.
+    The rest (method-restricted rules without CIDRs) are checked one by one.
+    """
+    def __init__(self, rules: List[AuthBypassRule]):
+        self._rules = [_CompiledRule(rule) for rule in rules]
+        path_groups = []
+        self._other_rules: List[int] = []
+        self._cidr_trie: Optional[_CidrTrie] = None
+        for index, rule in enumerate(rules):
+            if rule.client_cidrs:
+                if self._cidr_trie is None: self._cidr_trie = _CidrTrie()
+                for cidr in rule.client_cidrs:
+                    self._cidr_trie.insert(ipaddress.ip_network(cidr, strict=False), index)
+            elif rule.paths and not rule.methods:
+                path_groups.append(f"(?P<r{index}>{'|'.join(_pattern_to_regex(pattern) for pattern in rule.paths)})")
+            else:
+                self._other_rules.append(index)
+        self._path_regex = re.compile("|".join(path_groups)) if path_groups else None
+
+    def match(self, method: str, path: str, client_address: Optional[IPAddress]) -> Optional[str]:
+        if self._path_regex is not None:
+            found = self._path_regex.match(path)
+            if found is not None: return self._rules[int(found.lastgroup[1:])].name
+        for index in self._other_rules:
+            if self._rules[index].matches(method, path): return self._rules[index].name
+        if self._cidr_trie is not None and client_address is not None:
+            for index in reversed(self._cidr_trie.lookup(client_address)):
+                if self._rules[index].matches(method, path): return self._rules[index].name
+        return None
+
+
+class AuthBypass:
+    """Decides, per request, whether a configured bypass rule lets it skip authentication."""
+    def __init__(self):
+        self._matchers: Dict[str, _HostMatcher] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._matchers)
+
+    def configure(self, rules: Iterable[AuthBypassRule]):
+        by_hostname: Dict[str, List[AuthBypassRule]] = {}
+        for rule in rules:
+            for hostname in rule.hostnames or [ANY_HOSTNAME]:
+                by_hostname.setdefault(hostname, []).append(rule)
+        self._matchers = {hostname: _HostMatcher(host_rules) for hostname, host_rules in by_hostname.items()}
+
+    def match(self, hostname: str, method: str, path: str, client_host: Optional[str]) -> Optional[str]:
+        """Name of the first rule that lets this request through unauthenticated, or None."""
+        if _is_unsafe_path(path): return None
+        client_address = None
+        if client_host:
+            try:
+                client_address = ipaddress.ip_address(client_host)
+                if client_address.version == 6 and client_address.ipv4_mapped: client_address = client_address.ipv4_mapped
+            except ValueError:
+                pass
+        for matcher in (self._matchers.get(hostname), self._matchers.get(ANY_HOSTNAME)):
+            if matcher is None: continue
+            rule_name = matcher.match(method, path, client_address)
+            if rule_name is not None: return rule_name
+        return None
+
+# Global instance
+auth_bypass = AuthBypass()
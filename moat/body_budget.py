@@ -0,0 +1,83 @@
+import asyncio
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from .metrics import metrics_registry, Gauge
+
+class BodyBudget:
+    """
+    Process-wide accounting of proxied body bytes Moat holds in memory. Callers reserve bytes before
+    buffering a body and release them once it has been sent. try_acquire() never waits (responses fall
+    back to streaming when it fails); acquire() queues in FIFO order for up to wait_seconds (request
+    bodies are refused when it fails). With max_total_bytes unset nothing is accounted.
+    """
+    def __init__(self):
+        self.max_total_bytes: Optional[int] = None
+        self.max_body_bytes = 0
+        self.wait_seconds = 0.0
+        self.in_use = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_total_bytes is not None
+
+    def configure(self, max_total_bytes: Optional[int], max_body_bytes: int, wait_seconds: float):
+        self.max_total_bytes = max_total_bytes
+        self.max_body_bytes = min(max_body_bytes, max_total_bytes) if max_total_bytes is not None else max_body_bytes
+        self.wait_seconds = wait_seconds
+        self._wake()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def try_acquire(self, size: int) -> bool:
+        if self.max_total_bytes is None: return True
+        if self._waiters or self.in_use + size > self.max_total_bytes: return False
+        self.in_use += size
+        return True
+
+    async def acquire(self, size: int) -> bool:
+        """Reserves size bytes, waiting behind earlier callers for up to wait_seconds. False if it timed out."""
+        if self.try_acquire(size): return True
+        if self.max_total_bytes is None or size > self.max_total_bytes or self.wait_seconds <= 0: return False
+        waiter = (size, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], self.wait_seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            if waiter[1].done() and not waiter[1].cancelled(): self.release(size) # Granted just as the caller went away
+            raise
+        finally:
+            if not waiter[1].done() or waiter[1].cancelled():
+                try: self._waiters.remove(waiter)
+                except ValueError: pass
+                self._wake()
+
+    def release(self, size: int):
+        if not size: return
+        self.in_use = max(0, self.in_use - size)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            size, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if self.max_total_bytes is not None and self.in_use + size > self.max_total_bytes: return
+            self._waiters.popleft()
+            if self.max_total_bytes is not None: self.in_use += size
+            future.set_result(None)
+
+# Global instance
+body_budget = BodyBudget()
+
+metrics_registry.register(Gauge("moat_body_budget_bytes_in_use", "Proxied request and response body bytes currently buffered in memory.",
+                                value_callback=lambda: body_budget.in_use))
+metrics_registry.register(Gauge("moat_body_budget_waiters", "Requests waiting for body budget before their upload is buffered.",
+                                value_callback=lambda: body_budget.waiting))
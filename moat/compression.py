@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import os
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .metrics import metrics_registry, compressed_responses_total, compression_bytes_total, Gauge
+from .models import CompressionRule
+
+try:
+    import brotli
+except ImportError:
+    try: import brotlicffi as brotli
+    except ImportError: brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+def _gzip(body: bytes) -> bytes:
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) # wbits 31: gzip container
+    return compressor.compress(body) + compressor.flush()
+
+# Encoding -> compress function, in order of preference when the client weighs them equally.
+COMPRESSORS = {}
+if brotli is not None: COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+if zstandard is not None: COMPRESSORS["zstd"] = lambda body: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+COMPRESSORS["gzip"] = _gzip
+
+@lru_cache(maxsize=256)
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks the supported encoding the client weighs highest (RFC 9110 q-values), or None for identity."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        token, *params = [piece.strip() for piece in part.split(";")]
+        if not token: continue
+        weight = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try: weight = float(param[2:])
+                except ValueError: weight = 0.0
+        weights[token] = weight
+    best, best_weight = None, 0.0
+    for encoding in COMPRESSORS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight: best, best_weight = encoding, weight
+    return best
+
+def _find_header(headers: Dict[str, str], name: str) -> Tuple[Optional[str], Optional[str]]:
+    for key, value in headers.items():
+        if key.lower() == name: return key, value
+    return None, None
+
+
+class _Rule:
+    __slots__ = ("enabled", "min_bytes", "exact_types", "type_prefixes")
+
+    def __init__(self, enabled: bool, min_bytes: int, content_types: Iterable[str]):
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        content_types = [content_type.strip().lower() for content_type in content_types]
+        self.exact_types = frozenset(content_type for content_type in content_types if not content_type.endswith("/*"))
+        self.type_prefixes = tuple(content_type[:-1] for content_type in content_types if content_type.endswith("/*"))
+
+    def matches_type(self, content_type: Optional[str]) -> bool:
+        if not content_type: return False
+        mime_type = content_type.split(";", 1)[0].strip().lower()
+        return mime_type in self.exact_types or mime_type.startswith(self.type_prefixes)
+
+
+class ResponseCompressor:
+    """
+    Compresses buffered proxied response bodies for clients that accept it. Bodies over offload_bytes
+    are hashed and compressed on a small worker pool (zlib, brotli and zstd release the GIL), so the
+    event loop never spends milliseconds on them. Compressed variants of identical bodies are kept in
+    an LRU cache bounded by cache_max_bytes, so popular assets are compressed once.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.offload_bytes = 64 * 1024
+        self.cache_max_bytes = 0
+        self._default_rule = _Rule(False, 0, ())
+        self._service_rules: Dict[str, _Rule] = {}
+        # (encoding, body digest) -> compressed body
+        self._cache: "OrderedDict[Tuple[str, bytes], bytes]" = OrderedDict()
+        self.cache_bytes = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def configure(self, enabled: bool, min_bytes: int, content_types: List[str], offload_bytes: int,
+                  cache_max_bytes: int, service_rules: Dict[str, CompressionRule]):
+        self.enabled = enabled
+        self.offload_bytes = offload_bytes
+        self._default_rule = _Rule(enabled, min_bytes, content_types)
+        self._service_rules = {
+            hostname: _Rule(enabled and rule.enabled, rule.min_bytes if rule.min_bytes is not None else min_bytes,
+                            rule.content_types if rule.content_types is not None else content_types)
+            for hostname, rule in service_rules.items()
+        }
+        self.cache_max_bytes = cache_max_bytes
+        self._evict(0)
+
+    def _evict(self, incoming_bytes: int):
+        while self._cache and self.cache_bytes + incoming_bytes > self.cache_max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self.cache_bytes -= len(evicted)
+
+    def _run(self, function, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="moat-compress")
+        return asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def compress_body(self, service: str, accept_encoding: str, status_code: int, headers: Dict[str, str], body: bytes) -> bytes:
+        """
+        Returns the body to send, compressed if the service's rules and the client allow it. Adjusts
+        headers in place: Content-Encoding, Vary: Accept-Encoding, and a strong ETag made weak.
+        """
+        rule = self._service_rules.get(service, self._default_rule)
+        if not rule.enabled or len(body) < rule.min_bytes or status_code < 200 or status_code in (204, 206, 304):
+            return body
+        if _find_header(headers, "content-encoding")[0] or _find_header(headers, "content-range")[0]:
+            return body
+        if "no-transform" in (_find_header(headers, "cache-control")[1] or "").lower():
+            return body
+        if not rule.matches_type(_find_header(headers, "content-type")[1]):
+            return body
+
+        # The representation now depends on Accept-Encoding, whether or not this client gets it compressed.
+        vary_key, vary = _find_header(headers, "vary")
+        if not vary:
+            headers["Vary"] = "Accept-Encoding"
+        elif vary.strip() != "*" and "accept-encoding" not in vary.lower():
+            headers[vary_key] = f"{vary}, Accept-Encoding"
+        encoding = negotiate_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            return body
+
+        compressed, cache_outcome = await self._compressed_variant(encoding, body)
+        if len(compressed) >= len(body):
+            compressed_responses_total.inc(encoding, "not_smaller") # Sent uncompressed
+            return body
+        compressed_responses_total.inc(encoding, cache_outcome)
+        compression_bytes_total.inc("original", amount=len(body))
+        compression_bytes_total.inc("compressed", amount=len(compressed))
+        headers["Content-Encoding"] = encoding
+        etag_key, etag = _find_header(headers, "etag")
+        if etag and not etag.startswith("W/"):
+            headers[etag_key] = f"W/{etag}"
+        return compressed
+
+    async def _compressed_variant(self, encoding: str, body: bytes) -> Tuple[bytes, str]:
+        """Returns (compressed body, variant cache outcome: uncached, cache_hit or cache_miss)."""
+        compress = COMPRESSORS[encoding]
+        offload = len(body) >= self.offload_bytes
+        cacheable = self.cache_max_bytes > 0 and len(body) <= self.cache_max_bytes // 4
+        if not cacheable:
+            return (await self._run(compress, body) if offload else compress(body)), "uncached"
+
+        digest_body = lambda: hashlib.blake2b(body, digest_size=16).digest()
+        key = (encoding, await self._run(digest_body) if offload else digest_body())
+        compressed = self._cache.get(key)
+        if compressed is not None:
+            self._cache.move_to_end(key)
+            return compressed, "cache_hit"
+
+        compressed = await self._run(compress, body) if offload else compress(body)
+        if key not in self._cache:
+            self._evict(len(compressed))
+            self._cache[key] = compressed
+            self.cache_bytes += len(compressed)
+        return compressed, "cache_miss"
+
+    async def stop(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+# Global instance
+response_compressor = ResponseCompressor()
+
+metrics_registry.register(Gauge("moat_compression_cache_bytes", "Bytes of compressed response variants held for reuse.", value_callback=lambda: response_compressor.cache_bytes))
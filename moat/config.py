@@ -1,15 +1,56 @@
 import yaml
 from pathlib import Path
-from .models import MoatSettings
+from .models import MoatSettings, StaticServiceConfig
+from .config_dir import config_directory
+from .access_policy import compile_configured_policies
 import copy
-from typing import Optional
+from typing import Dict, Optional, Set
+from urllib.parse import urljoin, urlparse
 
 CONFIG_FILE_PATH = Path("config.yml")
+ACCESS_TOKEN_COOKIE_NAME = "moat_access_token"
+LOGIN_PATH = "moat/auth/login"
+ADMIN_CONFIG_PATH = "moat/admin/config"
+
+class DerivedSettings:
+    """
+    Values derived from MoatSettings that request handlers would otherwise rebuild on every hit.
+    Built once per config load/save and swapped in together with the settings object.
+    """
+    def __init__(self, settings: MoatSettings):
+        self.moat_base_url = str(settings.moat_base_url).rstrip('/') + '/'
+        parsed_base_url = urlparse(self.moat_base_url)
+        self.moat_hostname = parsed_base_url.hostname
+        self.moat_base_is_https = parsed_base_url.scheme == "https"
+        self.login_url = urljoin(self.moat_base_url, LOGIN_PATH)
+        self.admin_config_url = urljoin(self.moat_base_url, ADMIN_CONFIG_PATH)
+
+        self.cookie_domain = settings.cookie_domain
+        delete_cookie_header = f"{ACCESS_TOKEN_COOKIE_NAME}=; Path=/; Max-Age=0; HttpOnly; SameSite=Lax"
+        if self.moat_base_is_https:
+            delete_cookie_header += "; Secure"
+        if settings.cookie_domain:
+            delete_cookie_header += f"; Domain={settings.cookie_domain}"
+        self.delete_cookie_header = delete_cookie_header
+
+        self.access_policies = compile_configured_policies(settings.access_policies) # hostname -> (users, groups)
+
+def config_dir_path(settings: MoatSettings) -> Optional[Path]:
+    return CONFIG_FILE_PATH.parent / settings.config_dir if settings.config_dir else None
+
+def _with_config_dir_services(settings: MoatSettings) -> MoatSettings:
+    """Appends the static_services defined in config_dir (only changed files there are re-parsed). Blocking."""
+    dir_services = config_directory.configure(config_dir_path(settings), {s.hostname for s in settings.static_services})
+    if not dir_services:
+        return settings
+    return settings.model_copy(update={"static_services": settings.static_services + dir_services})
+
 _settings: Optional[MoatSettings] = None # Renamed to avoid conflict with getter
+_derived_settings: Optional[DerivedSettings] = None
 _config_last_modified_time: Optional[float] = None
 
 def load_config(force_reload: bool = False) -> MoatSettings:
-    global _settings, _config_last_modified_time
+    global _settings, _derived_settings, _config_last_modified_time
     
     if not CONFIG_FILE_PATH.exists():
         raise FileNotFoundError(f"Configuration file {CONFIG_FILE_PATH} not found.")
@@ -26,7 +67,8 @@ def load_config(force_reload: bool = False) -> MoatSettings:
             config_data = {} 
             
     try:
-        new_settings = MoatSettings(**config_data)
+        new_settings = _with_config_dir_services(MoatSettings(**config_data))
+        new_derived_settings = DerivedSettings(new_settings)
     except Exception as e:
         print(f"Config: Error parsing new configuration: {e}")
         if _settings is not None: 
@@ -35,7 +77,7 @@ def load_config(force_reload: bool = False) -> MoatSettings:
         else: 
             raise ValueError(f"Config: Critical error parsing initial configuration: {e}")
 
-    _settings = new_settings
+    _settings, _derived_settings = new_settings, new_derived_settings
     _config_last_modified_time = current_mtime
     print(f"Config: Successfully loaded/reloaded. Docker Monitor: {_settings.docker_monitor_enabled}, Static Services: {len(_settings.static_services)}")
     return _settings
@@ -52,11 +94,17 @@ def get_settings() -> MoatSettings:
              raise RuntimeError(f"Critical error loading initial settings: {e}")
     return _settings
 
+def get_derived_settings() -> DerivedSettings:
+    if _derived_settings is None:
+        get_settings()
+    return _derived_settings
+
 def save_settings(new_settings_data: dict) -> bool:
     """Validates and saves new settings data to config.yml."""
-    global _settings, _config_last_modified_time
+    global _settings, _derived_settings, _config_last_modified_time
     try:
-        validated_settings = MoatSettings(**new_settings_data)
+        validated_settings = _with_config_dir_services(MoatSettings(**new_settings_data))
+        validated_derived_settings = DerivedSettings(validated_settings)
         
         temp_config_path = CONFIG_FILE_PATH.with_suffix(".yml.tmp")
         with open(temp_config_path, 'w') as f:
@@ -64,13 +112,50 @@ def save_settings(new_settings_data: dict) -> bool:
         temp_config_path.rename(CONFIG_FILE_PATH)
         
         print(f"Config: Settings successfully written to {CONFIG_FILE_PATH}")
-        _settings = validated_settings
+        _settings, _derived_settings = validated_settings, validated_derived_settings
         _config_last_modified_time = CONFIG_FILE_PATH.stat().st_mtime
         return True
     except Exception as e:
         print(f"Config: Error validating or saving new settings: {e}")
         return False
 
+def config_file_changed_since_load() -> bool:
+    """False if config.yml is exactly what Moat last loaded or wrote itself (lets the file watcher skip its own writes)."""
+    try: return CONFIG_FILE_PATH.stat().st_mtime != _config_last_modified_time
+    except FileNotFoundError: return True
+
+def update_static_services(upserts: Dict[str, StaticServiceConfig], removals: Set[str]) -> MoatSettings:
+    """
+    Swaps in settings whose static_services have the given entries replaced/added and removed, keeping
+    the existing order. In memory only; persist_static_services() writes them out. Derived settings
+    don't depend on static_services, so they (and the token cache tied to them) are kept.
+    """
+    global _settings
+    current = get_settings()
+    existing_hostnames = set()
+    services = []
+    for service in current.static_services:
+        existing_hostnames.add(service.hostname)
+        if service.hostname in removals: continue
+        services.append(upserts.get(service.hostname, service))
+    services.extend(service for hostname, service in upserts.items() if hostname not in existing_hostnames)
+    _settings = current.model_copy(update={"static_services": services})
+    return _settings
+
+def persist_static_services():
+    """Writes the in-memory static_services (except those from config_dir) to config.yml, leaving the rest of the file as it is. Blocking."""
+    global _config_last_modified_time
+    services = [{"hostname": s.hostname, "target_url": str(s.target_url).rstrip('/')} for s in get_settings().static_services
+                if s.hostname not in config_directory.owners]
+    config_data = get_current_config_as_dict()
+    config_data["static_services"] = services
+    temp_config_path = CONFIG_FILE_PATH.with_suffix(".yml.tmp")
+    with open(temp_config_path, 'w') as f:
+        yaml.dump(config_data, f, sort_keys=False, default_flow_style=False)
+    temp_config_path.replace(CONFIG_FILE_PATH)
+    _config_last_modified_time = CONFIG_FILE_PATH.stat().st_mtime
+    print(f"Config: Wrote {len(services)} static service(s) to {CONFIG_FILE_PATH}")
+
 def get_current_config_as_dict() -> dict:
     """Loads config from file and returns as dict, useful for editing."""
     if CONFIG_FILE_PATH.exists():
@@ -78,8 +163,3 @@ def get_current_config_as_dict() -> dict:
             return yaml.safe_load(f) or {}
     return {}
 
-try:
-    _settings = load_config()
-except (FileNotFoundError, ValueError) as e: # Catch parsing errors too
-    print(f"Warning: Initial config load failed ({e}). Moat may not function correctly until configured.")
-    _settings = None
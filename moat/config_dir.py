@@ -0,0 +1,123 @@
+import asyncio
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import yaml
+
+from .models import StaticServiceConfig
+
+CONFIG_DIR_SUFFIXES = (".yml", ".yaml")
+
+FileStamp = Tuple[int, int] # (mtime_ns, size)
+
+def parse_service_file(path: Path) -> List[StaticServiceConfig]:
+    """
+    Blocking. A file holds one service (a hostname/target_url mapping), a list of services, or a
+    mapping with a static_services list. Raises OSError, yaml.YAMLError, ValueError or TypeError.
+    """
+    with open(path, 'r') as f:
+        data = yaml.safe_load(f)
+    if data is None:
+        return []
+    if isinstance(data, dict) and "static_services" in data:
+        data = data["static_services"] or []
+    entries = [data] if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        raise ValueError("Expected a service, a list of services or a static_services list.")
+    return [StaticServiceConfig(**entry) for entry in entries]
+
+
+class ConfigDirectory:
+    """
+    static_services split across the *.yml files of a conf.d-style directory (config_dir). Each file's
+    validated services are cached with its mtime and size, so a reload only parses files that changed.
+    Hostnames already in config.yml, or in a file earlier in name order, win over later definitions.
+    Parsing is blocking: load_config() runs it on whatever thread loads the config, and reload()
+    runs it in the executor.
+    """
+    def __init__(self):
+        self.path: Optional[Path] = None
+        self._files: Dict[str, Tuple[FileStamp, List[StaticServiceConfig]]] = {}
+        self._services: Dict[str, StaticServiceConfig] = {} # Effective conf.d services, by hostname
+        self.owners: Dict[str, str] = {} # hostname -> file defining it
+        self._lock = threading.Lock() # load_config() and reload() may both run off the event loop
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def configure(self, path: Optional[Path], reserved_hostnames: Iterable[str]) -> List[StaticServiceConfig]:
+        """Blocking. Switches to path (None disables), re-reads changed files and returns the effective services."""
+        with self._lock:
+            if path != self.path:
+                self.path, self._files = path, {}
+            if path is not None:
+                self._refresh(None)
+            self._resolve(set(reserved_hostnames))
+            return list(self._services.values())
+
+    async def reload(self, names: Set[str], reserved_hostnames: Set[str]) -> Tuple[Dict[str, StaticServiceConfig], Set[str]]:
+        """Re-reads the named files off the event loop. Returns (upserts, removed hostnames) of the effective services."""
+        def refresh():
+            with self._lock:
+                if self.path is None: return self._services, self._services
+                old_services = self._services
+                parsed = self._refresh(names)
+                if parsed or any(name not in self._files for name in names):
+                    self._resolve(reserved_hostnames)
+                return old_services, self._services
+        old_services, new_services = await asyncio.get_running_loop().run_in_executor(None, refresh)
+        if old_services is new_services:
+            return {}, set()
+        upserts = {hostname: service for hostname, service in new_services.items() if old_services.get(hostname) != service}
+        return upserts, set(old_services) - set(new_services)
+
+    def _refresh(self, names: Optional[Iterable[str]]) -> int:
+        """Re-stats the named files (every file when None) and parses those whose stamp changed. Returns files parsed."""
+        if names is None:
+            try:
+                names = {entry.name for entry in os.scandir(self.path)
+                         if entry.name.endswith(CONFIG_DIR_SUFFIXES) and not entry.name.startswith(".")} | set(self._files)
+            except FileNotFoundError:
+                print(f"Config Dir: {self.path} does not exist; no services loaded from it.")
+                names = set(self._files)
+        parsed = 0
+        for name in names:
+            file_path = self.path / name
+            try:
+                file_stat = file_path.stat()
+            except FileNotFoundError:
+                if self._files.pop(name, None) is not None: print(f"Config Dir: {name} removed.")
+                continue
+            stamp = (file_stat.st_mtime_ns, file_stat.st_size)
+            cached = self._files.get(name)
+            if cached is not None and cached[0] == stamp:
+                continue
+            try:
+                services = parse_service_file(file_path)
+            except (OSError, yaml.YAMLError, ValueError, TypeError) as e:
+                print(f"Config Dir: Keeping the previous version of {name}; the new one is invalid: {e}")
+                continue
+            self._files[name] = (stamp, services)
+            parsed += 1
+        if parsed:
+            print(f"Config Dir: Parsed {parsed} changed file(s) in {self.path}")
+        return parsed
+
+    def _resolve(self, reserved_hostnames: Set[str]):
+        services: Dict[str, StaticServiceConfig] = {}
+        owners: Dict[str, str] = {}
+        for name in sorted(self._files):
+            for service in self._files[name][1]:
+                if service.hostname in reserved_hostnames or service.hostname in services:
+                    print(f"Config Dir: Ignoring {service.hostname} in {name}; it is already defined in "
+                          f"{owners.get(service.hostname, 'config.yml')}.")
+                    continue
+                services[service.hostname] = service
+                owners[service.hostname] = name
+        self._services, self.owners = services, owners
+
+# Global instance
+config_directory = ConfigDirectory()
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Deque, Dict, List, Optional, Tuple
+
+from .metrics import proxy_requests_total, proxy_request_duration_seconds, proxy_requests_in_flight, UNMATCHED_SERVICE_LABEL
+from .service_registry import registry as global_registry
+from .loop_monitor import loop_monitor
+
+# The dashboard reads the proxy's existing metrics once per second and diffs them, so the request path
+# does no extra work for it. One aggregation task serves every viewer and runs only while someone watches.
+
+DASHBOARD_TICK_SECONDS = 1.0
+DASHBOARD_WINDOW_SECONDS = 10
+DEGRADED_ERROR_RATE = 0.05
+FAILING_ERROR_RATE = 0.5
+
+def _histogram_quantile(quantile: float, bounds: Tuple[float, ...], counts: List[int]) -> Optional[float]:
+    """Estimates a quantile from per-bucket counts (last slot is +Inf), interpolating within the bucket."""
+    total = sum(counts)
+    if not total: return None
+    rank = quantile * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            lower = bounds[index - 1] if index > 0 else 0.0
+            if index >= len(bounds): return lower
+            return lower + (bounds[index] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return bounds[-1]
+
+def _percentiles_ms(bounds: Tuple[float, ...], buckets: List[int]) -> Dict[str, Optional[float]]:
+    result = {}
+    for name, quantile in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+        value = _histogram_quantile(quantile, bounds, buckets) if buckets else None
+        result[name] = round(value * 1000, 1) if value is not None else None
+    return result
+
+def _health(requests: int, error_rate: float) -> str:
+    if not requests: return "idle"
+    if error_rate >= FAILING_ERROR_RATE: return "failing"
+    if error_rate >= DEGRADED_ERROR_RATE: return "degraded"
+    return "ok"
+
+
+class TrafficDashboard:
+    def __init__(self):
+        self.latest_payload: Optional[str] = None
+        self._viewers = 0
+        self._task: Optional[asyncio.Task] = None
+        self._tick = asyncio.Event()
+        # Per tick: service -> (requests, 5xx responses, per-bucket latency counts) during that second
+        self._window: Deque[Dict[str, Tuple[int, int, List[int]]]] = deque(maxlen=DASHBOARD_WINDOW_SECONDS)
+        self._previous: Optional[Dict[str, Tuple[int, int, List[int]]]] = None
+
+    def _read_totals(self) -> Dict[str, Tuple[int, int, List[int]]]:
+        totals: Dict[str, Tuple[int, int, List[int]]] = {}
+        for (service, status), count in proxy_requests_total.values.items():
+            requests, errors, buckets = totals.get(service, (0, 0, []))
+            totals[service] = (requests + int(count), errors + (int(count) if status == "5xx" else 0), buckets)
+        for (service,), (counts, _) in proxy_request_duration_seconds.series.items():
+            requests, errors, _ = totals.get(service, (0, 0, []))
+            totals[service] = (requests, errors, list(counts))
+        return totals
+
+    def _advance_window(self):
+        current = self._read_totals()
+        if self._previous is not None:
+            bucket_slots = len(proxy_request_duration_seconds.buckets) + 1
+            deltas = {}
+            for service, (requests, errors, buckets) in current.items():
+                prev_requests, prev_errors, prev_buckets = self._previous.get(service, (0, 0, []))
+                if requests == prev_requests: continue
+                prev_buckets = prev_buckets or [0] * bucket_slots
+                deltas[service] = (requests - prev_requests, errors - prev_errors,
+                                   [now - before for now, before in zip(buckets or [0] * bucket_slots, prev_buckets)])
+            self._window.append(deltas)
+        self._previous = current
+
+    async def _build_payload(self) -> Dict[str, Any]:
+        window_seconds = max(len(self._window), 1) * DASHBOARD_TICK_SECONDS
+        bounds = proxy_request_duration_seconds.buckets
+        merged: Dict[str, Tuple[int, int, List[int]]] = {}
+        for tick in self._window:
+            for service, (requests, errors, buckets) in tick.items():
+                total_requests, total_errors, total_buckets = merged.get(service, (0, 0, [0] * (len(bounds) + 1)))
+                merged[service] = (total_requests + requests, total_errors + errors, [a + b for a, b in zip(total_buckets, buckets)])
+
+        routes = await global_registry.get_all_services()
+        services = []
+        for service in sorted(set(routes) | set(merged) | set(k[0] for k in proxy_requests_in_flight.values)):
+            requests, errors, buckets = merged.get(service, (0, 0, []))
+            error_rate = errors / requests if requests else 0.0
+            target_url, source_type, _ = routes.get(service, (None, None, None))
+            percentiles = _percentiles_ms(bounds, buckets)
+            services.append({
+                "service": service, "target": target_url, "source": source_type,
+                "rps": round(requests / window_seconds, 2), "error_rate": round(error_rate, 4),
+                **percentiles,
+                "in_flight": int(proxy_requests_in_flight.values.get((service,), 0)),
+                "health": _health(requests, error_rate) if service != UNMATCHED_SERVICE_LABEL else "unrouted",
+            })
+        return {
+            "ts": time.time(), "window_seconds": window_seconds, "services": services,
+            "loop_lag_ms": round(loop_monitor.last_lag_seconds * 1000, 1), "shedding": loop_monitor.shedding,
+        }
+
+    async def _run(self):
+        while True:
+            self._advance_window()
+            try:
+                self.latest_payload = json.dumps(await self._build_payload(), separators=(",", ":"))
+            except Exception as e:
+                print(f"Dashboard: Error aggregating stats: {e}")
+            # Wake every viewer waiting for this tick, then arm a fresh event for the next one.
+            self._tick.set()
+            self._tick = asyncio.Event()
+            await asyncio.sleep(DASHBOARD_TICK_SECONDS)
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """Yields the shared aggregated payload (JSON) once per second until the viewer disconnects."""
+        self._viewers += 1
+        if self._task is None or self._task.done():
+            self._window.clear()
+            self._previous = None
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="TrafficDashboard")
+        try:
+            if self.latest_payload is not None: yield self.latest_payload
+            while True:
+                await self._tick.wait()
+                yield self.latest_payload
+        finally:
+            self._viewers -= 1
+            if self._viewers == 0 and self._task:
+                self._task.cancel()
+                self._task = None
+                self.latest_payload = None
+
+# Global instance
+dashboard = TrafficDashboard()
@@ -1,5 +1,5 @@
 import aiosqlite
-from typing import Optional
+from typing import Dict, FrozenSet, List, Optional, Tuple
 from .models import User, UserInDB
 from .config import get_settings
 from .security import get_password_hash
@@ -20,6 +20,13 @@ async def init_db():
             hashed_password TEXT NOT NULL
         )
     """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_groups (
+            username TEXT NOT NULL,
+            group_name TEXT NOT NULL,
+            PRIMARY KEY (username, group_name)
+        )
+    """)
     await conn.commit()
     await conn.close()
 
@@ -47,4 +54,78 @@ async def create_user_db(user_data: User, password: str) -> UserInDB:
         await conn.close()
         raise ValueError(f"User {user_data.username} already exists")
     await conn.close()
-    return user_in_db
\ No newline at end of file
+    return user_in_db
+
+async def create_users_bulk(users: List[UserInDB], update_existing: bool = False) -> Dict[str, str]:
+    """
+    Inserts already-hashed users in a single transaction. Returns username -> "created", "updated"
+    (update_existing) or "exists" (left untouched).
+    """
+    conn = await get_db_connection()
+    try:
+        cursor = await conn.execute("SELECT username FROM users")
+        existing_usernames = {row[0] for row in await cursor.fetchall()}
+        results = {}
+        new_rows, updated_rows = [], []
+        for user in users:
+            if user.username not in existing_usernames:
+                new_rows.append((user.username, user.hashed_password))
+                results[user.username] = "created"
+            elif update_existing:
+                updated_rows.append((user.hashed_password, user.username))
+                results[user.username] = "updated"
+            else:
+                results[user.username] = "exists"
+        try:
+            await conn.executemany("INSERT INTO users (username, hashed_password) VALUES (?, ?)", new_rows)
+            await conn.executemany("UPDATE users SET hashed_password = ? WHERE username = ?", updated_rows)
+            await conn.commit()
+        except aiosqlite.IntegrityError as e:
+            await conn.rollback()
+            raise ValueError(f"Import conflicted with a concurrent change, nothing was written: {e}")
+        return results
+    finally:
+        await conn.close()
+
+async def get_all_users() -> List[UserInDB]:
+    conn = await get_db_connection()
+    cursor = await conn.execute("SELECT username, hashed_password FROM users ORDER BY username")
+    rows = await cursor.fetchall()
+    await conn.close()
+    return [UserInDB(username=row[0], hashed_password=row[1]) for row in rows]
+
+async def get_user_groups(username: str) -> FrozenSet[str]:
+    conn = await get_db_connection()
+    cursor = await conn.execute("SELECT group_name FROM user_groups WHERE username = ?", (username,))
+    rows = await cursor.fetchall()
+    await conn.close()
+    return frozenset(row[0] for row in rows)
+
+async def add_user_to_group(username: str, group_name: str) -> bool:
+    """Returns False if the user was already a member. Raises ValueError for an unknown user."""
+    conn = await get_db_connection()
+    try:
+        cursor = await conn.execute("SELECT 1 FROM users WHERE username = ?", (username,))
+        if await cursor.fetchone() is None:
+            raise ValueError(f"User {username} does not exist")
+        cursor = await conn.execute("INSERT OR IGNORE INTO user_groups (username, group_name) VALUES (?, ?)", (username, group_name))
+        await conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        await conn.close()
+
+async def remove_user_from_group(username: str, group_name: str) -> bool:
+    """Returns False if the user was not a member."""
+    conn = await get_db_connection()
+    cursor = await conn.execute("DELETE FROM user_groups WHERE username = ? AND group_name = ?", (username, group_name))
+    await conn.commit()
+    await conn.close()
+    return cursor.rowcount > 0
+
+async def get_group_memberships() -> List[Tuple[str, str]]:
+    """All (group_name, username) pairs, sorted."""
+    conn = await get_db_connection()
+    cursor = await conn.execute("SELECT group_name, username FROM user_groups ORDER BY group_name, username")
+    rows = await cursor.fetchall()
+    await conn.close()
+    return [(row[0], row[1]) for row in rows]
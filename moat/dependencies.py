@@ -1,13 +1,45 @@
 from fastapi import Depends, HTTPException, status, Request, Response as FastAPIResponse # Keep FastAPIResponse for manual response construction
-from typing import Optional
-from urllib.parse import quote_plus, urljoin, unquote_plus
+import time
+from typing import Dict, FrozenSet, Optional, Tuple
+from urllib.parse import quote_plus
 
 from .models import User
 from .security import decode_access_token
-from .database import get_user
-from .config import get_settings
+from .database import get_user, get_user_groups
+from .config import get_settings, get_derived_settings, DerivedSettings, ACCESS_TOKEN_COOKIE_NAME
+from .metrics import auth_outcomes_total, auth_token_cache_total, auth_bypass_requests_total
+from .auth_bypass import auth_bypass
+from .access_policy import access_policies
 
-ACCESS_TOKEN_COOKIE_NAME = "moat_access_token"
+AUTH_TOKEN_CACHE_MAX_ENTRIES = 10000
+# token -> (username, monotonic expiry, the user's groups). Tied to the DerivedSettings it was filled under,
+# so a config reload (e.g. a new secret_key) starts from an empty cache. Group changes apply within the TTL.
+_token_cache: Dict[str, Tuple[str, float, FrozenSet[str]]] = {}
+_token_cache_settings: Optional[DerivedSettings] = None
+
+def _get_cached_session(token: str) -> Optional[Tuple[str, float, FrozenSet[str]]]:
+    global _token_cache_settings
+    derived = get_derived_settings()
+    if _token_cache_settings is not derived:
+        _token_cache.clear()
+        _token_cache_settings = derived
+    cached = _token_cache.get(token)
+    if cached is None:
+        return None
+    if cached[1] <= time.monotonic():
+        del _token_cache[token]
+        return None
+    return cached
+
+def _cache_validated_token(token: str, username: str, groups: FrozenSet[str], payload: dict):
+    ttl_seconds = get_settings().auth_cache_ttl_seconds
+    if ttl_seconds <= 0: return
+    token_expires_in = payload.get("exp", 0) - time.time()
+    ttl_seconds = min(ttl_seconds, token_expires_in)
+    if ttl_seconds <= 0: return
+    if len(_token_cache) >= AUTH_TOKEN_CACHE_MAX_ENTRIES:
+        del _token_cache[next(iter(_token_cache))]
+    _token_cache[token] = (username, time.monotonic() + ttl_seconds, groups)
 
 async def get_current_user_from_cookie(request: Request) -> Optional[User]:
     print(f"--- Cookie Auth Debug ---")
@@ -18,6 +50,7 @@ async def get_current_user_from_cookie(request: Request) -> Optional[User]:
     if not token:
         print(f"Cookie '{ACCESS_TOKEN_COOKIE_NAME}' not found in request.")
         print(f"-------------------------")
+        auth_outcomes_total.inc("missing_cookie")
         return None
     
     if not isinstance(token, str):
@@ -27,10 +60,21 @@ async def get_current_user_from_cookie(request: Request) -> Optional[User]:
 
     print(f"Found token: {token[:30]}...{token[-30:] if len(token) > 60 else token[30:]}")
 
+    cached_session = _get_cached_session(token)
+    if cached_session is not None:
+        cached_username, _, request.state.moat_user_groups = cached_session
+        auth_token_cache_total.inc("hit")
+        auth_outcomes_total.inc("authenticated")
+        print(f"Token found in validated-token cache for user: {cached_username}")
+        print(f"-------------------------")
+        return User(username=cached_username)
+    auth_token_cache_total.inc("miss")
+
     payload = decode_access_token(token)
     if payload is None:
         print(f"Token decoding failed or token is invalid (decode_access_token returned None).")
         print(f"-------------------------")
+        auth_outcomes_total.inc("invalid_token")
         return None
     print(f"Token payload successfully decoded: {payload}")
 
@@ -38,6 +82,7 @@ async def get_current_user_from_cookie(request: Request) -> Optional[User]:
     if username_from_payload is None:
         print(f"'sub' (username) not found in token payload.")
         print(f"-------------------------")
+        auth_outcomes_total.inc("invalid_token")
         return None
     print(f"Username from token payload: {username_from_payload}")
 
@@ -45,34 +90,27 @@ async def get_current_user_from_cookie(request: Request) -> Optional[User]:
     if user_in_db_obj is None:
         print(f"User '{username_from_payload}' (from token) not found in database.")
         print(f"-------------------------")
+        auth_outcomes_total.inc("unknown_user")
         return None
     
     print(f"Successfully authenticated user from cookie: {user_in_db_obj.username}")
     print(f"-------------------------")
+    auth_outcomes_total.inc("authenticated")
+    request.state.moat_user_groups = await get_user_groups(user_in_db_obj.username)
+    _cache_validated_token(token, user_in_db_obj.username, request.state.moat_user_groups, payload)
     return User(username=user_in_db_obj.username)
 
 
 async def get_current_user_or_redirect(request: Request) -> User:
     print(f"--- Auth Check for: {request.url} (Effective scheme via x-forwarded-proto: {request.headers.get('x-forwarded-proto', request.url.scheme)}) ---")
+    auth_started = time.perf_counter()
     user = await get_current_user_from_cookie(request)
+    request.state.moat_auth_started = auth_started
+    request.state.moat_auth_seconds = time.perf_counter() - auth_started
     
     if user is None:
         print(f"User is None (authentication failed or no cookie), preparing to redirect to login for: {request.url}")
-        cfg = get_settings()
-        
-        if not cfg.moat_base_url:
-            # This case should ideally not happen if config is validated properly at startup.
-            print("CRITICAL ERROR: moat_base_url is not configured. Cannot form login redirect.")
-            raise HTTPException(status_code=500, detail="Authentication service misconfigured: missing base URL.")
-
-        moat_auth_base_str = str(cfg.moat_base_url).rstrip('/')
-        
-        login_path_segment = "moat/auth/login"
-
-        if not moat_auth_base_str.endswith('/'):
-            moat_auth_base_str += '/'
-        
-        base_login_url = urljoin(moat_auth_base_str, login_path_segment)
+        derived = get_derived_settings()
         original_url_str = str(request.url)
         final_redirect_uri_for_login = original_url_str
         current_effective_scheme = request.headers.get("x-forwarded-proto", request.url.scheme)
@@ -81,17 +119,11 @@ async def get_current_user_or_redirect(request: Request) -> User:
             final_redirect_uri_for_login = original_url_str.replace("http://", "https://", 1)
             print(f"DEBUG: Upgraded redirect_uri for login form from '{original_url_str}' to '{final_redirect_uri_for_login}' due to effective scheme being HTTPS.")
         
-        login_url_with_redirect = f"{base_login_url}?redirect_uri={quote_plus(final_redirect_uri_for_login)}"
+        login_url_with_redirect = f"{derived.login_url}?redirect_uri={quote_plus(final_redirect_uri_for_login)}"
         
         print(f"Redirecting unauthenticated user to: {login_url_with_redirect}")
         
-        headers = {"Location": login_url_with_redirect}
-        delete_cookie_header_val = f"{ACCESS_TOKEN_COOKIE_NAME}=; Path=/; Max-Age=0; HttpOnly; SameSite=Lax"
-        if cfg.moat_base_url.scheme == "https": # moat_base_url is HttpUrl type
-            delete_cookie_header_val += "; Secure"
-        if cfg.cookie_domain: # Add domain if configured for deletion
-            delete_cookie_header_val += f"; Domain={cfg.cookie_domain}"
-        headers["Set-Cookie"] = delete_cookie_header_val
+        headers = {"Location": login_url_with_redirect, "Set-Cookie": derived.delete_cookie_header}
 
         raise HTTPException(
             status_code=status.HTTP_307_TEMPORARY_REDIRECT,
@@ -100,4 +132,36 @@ async def get_current_user_or_redirect(request: Request) -> User:
         )
         
     print(f"User '{user.username}' authenticated successfully for {request.url}, proceeding with request.")
+    request.state.moat_username = user.username
+    return user
+
+
+async def get_current_user_or_bypass(request: Request) -> Optional[User]:
+    """
+    For proxied routes: None if an auth bypass rule covers the request; otherwise the logged-in user
+    (as get_current_user_or_redirect), checked against the service's access policy (403 if not allowed).
+    """
+    if auth_bypass.enabled:
+        rule_name = auth_bypass.match(request.headers.get("host", "").split(":")[0], request.method, request.url.path,
+                                      request.client.host if request.client else None)
+        if rule_name is not None:
+            auth_bypass_requests_total.inc(rule_name)
+            return None
+    user = await get_current_user_or_redirect(request)
+    if access_policies.enabled:
+        hostname = request.headers.get("host", "").split(":")[0]
+        if not access_policies.allows(hostname, user.username, getattr(request.state, "moat_user_groups", frozenset())):
+            print(f"User '{user.username}' is not allowed to access {hostname}.")
+            auth_outcomes_total.inc("forbidden")
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You don't have access to this service.")
+    return user
+
+
+async def get_current_admin_or_redirect(request: Request) -> User:
+    """For Moat's admin pages: the logged-in user (as get_current_user_or_redirect) if they are in admin_group, else 403."""
+    user = await get_current_user_or_redirect(request)
+    if get_settings().admin_group not in getattr(request.state, "moat_user_groups", frozenset()):
+        print(f"User '{user.username}' is not in the admin group; refusing {request.url.path}.")
+        auth_outcomes_total.inc("forbidden")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Moat administration is limited to the admin group.")
     return user
@@ -0,0 +1,108 @@
+import asyncio
+import socket
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiohttp.abc import AbstractResolver, ResolveResult
+from aiohttp.resolver import ThreadedResolver
+
+DEFAULT_DNS_CACHE_TTL_SECONDS = 60
+
+class CachingResolver(AbstractResolver):
+    """
+    aiohttp resolver with a shared, TTL-based cache.
+
+    Hostnames registered with set_watched_hostnames (the hosts in static target_urls) are refreshed
+    by a background task before they expire, so proxied requests to them never wait on DNS.
+    Other hostnames are resolved on first use and afterwards served from cache; an expired entry is
+    returned as-is while a refresh runs in the background. Resolution failures keep the last good answer.
+    """
+    def __init__(self, ttl_seconds: float = DEFAULT_DNS_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        # (hostname, family) -> (expires_at, results)
+        self._cache: Dict[Tuple[str, int], Tuple[float, List[ResolveResult]]] = {}
+        self._watched_hostnames: Set[str] = set()
+        self._refreshing: Dict[Tuple[str, int], asyncio.Task] = {}
+        self._resolver: Optional[ThreadedResolver] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _get_resolver(self) -> ThreadedResolver:
+        if self._resolver is None:
+            self._resolver = ThreadedResolver()
+        return self._resolver
+
+    async def _lookup(self, host: str, family: int) -> List[ResolveResult]:
+        results = await self._get_resolver().resolve(host, 0, family=family)
+        self._cache[(host, family)] = (asyncio.get_running_loop().time() + self.ttl_seconds, results)
+        return results
+
+    async def _refresh(self, host: str, family: int):
+        try:
+            await self._lookup(host, family)
+        except OSError as e:
+            print(f"DNS Cache: Refresh failed for '{host}', keeping previous answer: {e!r}")
+
+    def _start_refresh(self, host: str, family: int) -> asyncio.Task:
+        """Background lookup of (host, family); joins the one already running for it, if any."""
+        key = (host, family)
+        task = self._refreshing.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._refresh(host, family))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        return task
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_UNSPEC) -> List[ResolveResult]:
+        key = (host, family)
+        entry = self._cache.get(key)
+        if entry is None and key in self._refreshing:
+            await asyncio.shield(self._refreshing[key]) # e.g. a just-watched host whose first lookup is underway
+            entry = self._cache.get(key)
+        if entry is None:
+            results = await self._lookup(host, family)
+        else:
+            expires_at, results = entry
+            if expires_at <= asyncio.get_running_loop().time():
+                self._start_refresh(host, family)
+        return [{**r, "hostname": host, "port": port} for r in results]
+
+    async def close(self) -> None:
+        # Connectors do not own this resolver; it lives for the whole process (see stop()).
+        pass
+
+    def set_watched_hostnames(self, hostnames: Set[str]):
+        """Replaces the watched set; newly watched hosts are resolved right away, not on the refresher's next pass."""
+        self._watched_hostnames = set(hostnames)
+        cached_hosts = {cached_host for cached_host, _ in self._cache}
+        for host in self._watched_hostnames - cached_hosts:
+            self._start_refresh(host, socket.AF_UNSPEC)
+        for key in [k for k in self._cache if k[0] not in self._watched_hostnames]:
+            expires_at, _ = self._cache[key]
+            if expires_at + self.ttl_seconds <= asyncio.get_running_loop().time():
+                del self._cache[key]
+
+    async def _refresh_loop(self):
+        while True:
+            for host in list(self._watched_hostnames):
+                # aiohttp's TCPConnector resolves with AF_UNSPEC unless told otherwise.
+                families = {family for cached_host, family in self._cache if cached_host == host} or {socket.AF_UNSPEC}
+                for family in families:
+                    await self._start_refresh(host, family)
+            await asyncio.sleep(max(1.0, self.ttl_seconds / 2))
+
+    def start(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop(), name="DNSCacheRefresher")
+
+    async def stop(self):
+        if self._refresh_task and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            try: await self._refresh_task
+            except asyncio.CancelledError: pass
+        self._refresh_task = None
+        for task in list(self._refreshing.values()): task.cancel()
+        if self._resolver is not None:
+            await self._resolver.close()
+            self._resolver = None
+
+# Global instance
+dns_cache = CachingResolver()
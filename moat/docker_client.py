@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+DEFAULT_DOCKER_SOCKET_PATH = "/var/run/docker.sock"
+
+class DockerEngineError(Exception):
+    """Raised when the Docker Engine API returns an error or cannot be reached."""
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class DockerNotFoundError(DockerEngineError):
+    pass
+
+
+class AsyncDockerClient:
+    """
+    Minimal asyncio client for the Docker Engine API. Talks HTTP over the engine's unix socket
+    (or a plain tcp:// DOCKER_HOST) with aiohttp, so streaming events and inspecting containers
+    never needs a thread.
+    """
+    def __init__(self, socket_path: Optional[str] = None, base_url: Optional[str] = None):
+        self.socket_path = socket_path
+        self.base_url = (base_url or "http://docker").rstrip('/')
+        # Timestamp ("seconds.nanoseconds") of the last event seen, used to resume the stream with since=.
+        self.last_event_since: Optional[str] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_env(cls) -> "AsyncDockerClient":
+        docker_host = os.environ.get("DOCKER_HOST", "")
+        if not docker_host:
+            return cls(socket_path=DEFAULT_DOCKER_SOCKET_PATH)
+        parsed = urlparse(docker_host)
+        if parsed.scheme == "unix":
+            return cls(socket_path=parsed.path or DEFAULT_DOCKER_SOCKET_PATH)
+        if parsed.scheme in ("tcp", "http"):
+            return cls(base_url=f"http://{parsed.netloc}")
+        raise DockerEngineError(f"Unsupported DOCKER_HOST '{docker_host}'. Use unix:// or tcp://.")
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.UnixConnector(path=self.socket_path) if self.socket_path else aiohttp.TCPConnector()
+            timeout = aiohttp.ClientTimeout(total=None, connect=10, sock_connect=10, sock_read=None)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _get_json(self, path: str, params: Optional[Dict[str, str]] = None) -> Any:
+        try:
+            async with self._get_session().get(f"{self.base_url}{path}", params=params) as resp:
+                if resp.status == 404:
+                    raise DockerNotFoundError(f"Not found: {path}", status=404)
+                if resp.status >= 400:
+                    raise DockerEngineError(f"Docker API error {resp.status} for {path}: {await resp.text()}", status=resp.status)
+                return await resp.json(content_type=None)
+        except aiohttp.ClientError as e:
+            raise DockerEngineError(f"Error connecting to Docker Engine: {e!r}") from e
+
+    async def ping(self) -> bool:
+        try:
+            async with self._get_session().get(f"{self.base_url}/_ping") as resp:
+                return resp.status == 200
+        except aiohttp.ClientError:
+            return False
+
+    async def list_containers(self, filters: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
+        params = {"filters": json.dumps(filters)} if filters else None
+        return await self._get_json("/containers/json", params=params)
+
+    async def inspect_container(self, container_id: str) -> Dict[str, Any]:
+        return await self._get_json(f"/containers/{container_id}/json")
+
+    async def events(self, filters: Optional[Dict[str, List[str]]] = None, since: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams decoded events from /events until the engine closes the connection.
+        Every event updates last_event_since, so a caller that reconnects with
+        since=client.last_event_since does not lose events emitted while it was disconnected.
+        The engine's since= is inclusive, so the last event before a disconnect may be seen twice.
+        """
+        params: Dict[str, str] = {}
+        if filters: params["filters"] = json.dumps(filters)
+        if since: params["since"] = since
+        try:
+            async with self._get_session().get(f"{self.base_url}/events", params=params) as resp:
+                if resp.status >= 400:
+                    raise DockerEngineError(f"Docker API error {resp.status} for /events: {await resp.text()}", status=resp.status)
+                async for line in resp.content:
+                    line = line.strip()
+                    if not line: continue
+                    try: event = json.loads(line)
+                    except ValueError:
+                        print(f"Docker Client: Skipping undecodable event line: {line[:200]!r}")
+                        continue
+                    time_nano = event.get("timeNano")
+                    if time_nano:
+                        self.last_event_since = f"{int(time_nano) // 1_000_000_000}.{int(time_nano) % 1_000_000_000:09d}"
+                    elif event.get("time"):
+                        self.last_event_since = str(event["time"])
+                    yield event
+        except (aiohttp.ClientError, asyncio.IncompleteReadError) as e:
+            raise DockerEngineError(f"Docker event stream interrupted: {e!r}") from e
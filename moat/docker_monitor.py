@@ -1,16 +1,37 @@
 import asyncio
-import docker # type: ignore
-from docker.errors import NotFound, APIError # type: ignore
-from typing import Optional, Any
-import functools
+import contextlib
+import os
+import time
+from typing import Optional, Any, Dict, List, Set, Tuple
 
 from .service_registry import registry as global_registry
+from .access_policy import access_policies, parse_label_list
 from .config import get_settings
+from .docker_client import AsyncDockerClient, DockerEngineError, DockerNotFoundError
+from .metrics import metrics_registry, Gauge, docker_events_total, docker_events_applied_total, docker_event_lag_seconds
 
 _monitor_task_should_stop = asyncio.Event()
 _monitor_task_active = False
 _event_processing_task_ref: Optional[asyncio.Task] = None
 _event_listener_manager_task_ref: Optional[asyncio.Task] = None
+_event_queue_ref: Optional[asyncio.Queue] = None
+
+# A container's events are coalesced until it has been quiet this long; only the last one is applied.
+EVENT_DEBOUNCE_SECONDS = 0.3
+# ...but a container that never goes quiet (crash loop) is still applied this long after its first pending event.
+EVENT_DEBOUNCE_MAX_SECONDS = 2.0
+# Events older than the last one applied for their container are ignored; applied times are kept this long.
+EVENT_REORDER_WINDOW_SECONDS = 60.0
+# Backoff between reconnect attempts of the event stream (doubles up to the max).
+EVENT_STREAM_RECONNECT_INITIAL_DELAY = 0.5
+EVENT_STREAM_RECONNECT_MAX_DELAY = 10.0
+
+# Docker networks Moat's own container is attached to (empty when Moat runs on the host).
+_moat_container_networks: Set[str] = set()
+
+metrics_registry.register(Gauge(
+    "moat_docker_event_queue_depth", "Docker events waiting to be processed.",
+    value_callback=lambda: _event_queue_ref.qsize() if _event_queue_ref is not None else 0))
 
 async def stop_docker_monitor_task():
     global _monitor_task_should_stop, _monitor_task_active
@@ -64,158 +85,337 @@ async def is_docker_monitor_running() -> bool:
             return False
     return False
 
-async def process_container_labels(container_obj, action: str):
+def _parse_moat_labels(labels: Dict[str, str], prefix: str, container_name: str) -> Optional[Tuple[str, int, str]]:
+    """Returns (hostname, internal_port, scheme) if the labels enable Moat for this container, else None."""
+    if labels.get(f"{prefix}.enable") != "true":
+        return None
+
+    hostname_val = labels.get(f"{prefix}.hostname")
+    port_val_str = labels.get(f"{prefix}.port")
+    scheme_val = labels.get(f"{prefix}.scheme", "http").lower()
+
+    if not (hostname_val and port_val_str):
+        print(f"Docker Monitor: {container_name} enabled but missing required labels. Ensuring removal. Labels: {labels}")
+        return None
+
+    if scheme_val not in ["http", "https"]: scheme_val = "http"
+
+    try: internal_container_port = int(port_val_str)
+    except ValueError:
+        print(f"Docker Monitor: Invalid port '{port_val_str}' for {container_name}. Ensuring removal.")
+        return None
+
+    return hostname_val, internal_container_port, scheme_val
+
+
+def _network_ips(network_settings: Dict[str, Any]) -> Dict[str, str]:
+    """Maps network name -> container address on that network, from NetworkSettings.Networks."""
+    ips: Dict[str, str] = {}
+    for network_name, endpoint in (network_settings.get("Networks") or {}).items():
+        endpoint = endpoint or {}
+        if endpoint.get("IPAddress"):
+            ips[network_name] = endpoint["IPAddress"]
+        elif endpoint.get("GlobalIPv6Address"):
+            ips[network_name] = f"[{endpoint['GlobalIPv6Address']}]"
+    return ips
+
+
+def container_from_inspect(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalizes a GET /containers/{id}/json response into the shape process_container_labels expects."""
+    network_settings = attrs.get("NetworkSettings") or {}
+    return {
+        "id": attrs.get("Id", ""),
+        "name": (attrs.get("Name") or "").lstrip('/'),
+        "labels": (attrs.get("Config") or {}).get("Labels") or {},
+        "ports": network_settings.get("Ports") or {},
+        "networks": _network_ips(network_settings),
+    }
+
+
+def container_from_summary(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalizes a GET /containers/json list entry. The list endpoint already carries labels and
+    published ports, so the initial scan needs no per-container inspect call.
+    """
+    ports: Dict[str, List[Dict[str, str]]] = {}
+    for p in summary.get("Ports") or []:
+        if p.get("PublicPort") is None: continue
+        ports.setdefault(f"{p.get('PrivatePort')}/{p.get('Type', 'tcp')}", []).append(
+            {"HostIp": p.get("IP", ""), "HostPort": str(p["PublicPort"])}
+        )
+    names = summary.get("Names") or []
+    return {
+        "id": summary.get("Id", ""),
+        "name": names[0].lstrip('/') if names else summary.get("Id", "")[:12],
+        "labels": summary.get("Labels") or {},
+        "ports": ports,
+        "networks": _network_ips(summary.get("NetworkSettings") or {}),
+    }
+
+
+def _select_container_ip(container: Dict[str, Any], preferred_network: Optional[str]) -> Optional[str]:
+    """
+    Picks the address Moat should dial for an unpublished port: the network named by the
+    <prefix>.network label, else a network shared with Moat's own container, else (Moat on the
+    host) the container's first network. Returns None if no reachable address is known.
+    """
+    networks: Dict[str, str] = container.get("networks") or {}
+    if preferred_network:
+        if preferred_network in networks:
+            return networks[preferred_network]
+        print(f"Docker Monitor: {container['name']} is not attached to preferred network '{preferred_network}'. Networks: {list(networks)}")
+    for network_name in sorted(networks):
+        if network_name in _moat_container_networks:
+            return networks[network_name]
+    if not _moat_container_networks and networks:
+        return networks[sorted(networks)[0]]
+    return None
+
+
+async def _discover_moat_container_networks(docker_client: AsyncDockerClient):
+    """If Moat itself runs in a container, remember its networks so targets prefer a shared one."""
+    global _moat_container_networks
+    own_container_id = os.environ.get("HOSTNAME", "")
+    _moat_container_networks = set()
+    if not own_container_id: return
+    try:
+        own_attrs = await docker_client.inspect_container(own_container_id)
+        _moat_container_networks = set(((own_attrs.get("NetworkSettings") or {}).get("Networks") or {}).keys())
+        print(f"Docker Monitor: Moat is running in a container attached to networks: {sorted(_moat_container_networks)}")
+    except DockerEngineError:
+        pass
+
+
+def _determine_target_url(container: Dict[str, Any], internal_container_port: int, scheme_val: str, preferred_network: Optional[str]) -> str:
+    container_name, container_id = container["name"], container["id"]
+    published_bindings = container["ports"].get(f"{internal_container_port}/tcp")
+
+    if published_bindings and isinstance(published_bindings, list):
+        host_ip_to_use = "127.0.0.1"; host_port_to_use_str = None
+        for b in published_bindings:
+            if b.get("HostIp") == "127.0.0.1": host_port_to_use_str = b.get("HostPort"); break
+        if not host_port_to_use_str:
+            for b in published_bindings:
+                if b.get("HostIp") == "0.0.0.0": host_port_to_use_str = b.get("HostPort"); break
+        if not host_port_to_use_str and published_bindings: host_port_to_use_str = published_bindings[0].get("HostPort")
+        if host_port_to_use_str:
+            try:
+                int(host_port_to_use_str)
+                target_url_determined = f"{scheme_val}://{host_ip_to_use}:{host_port_to_use_str}"
+                print(f"Docker Monitor: Using published port for {container_name} ({container_id[:12]}): {target_url_determined}")
+                return target_url_determined
+            except ValueError: print(f"Docker Monitor: Invalid HostPort '{host_port_to_use_str}'. Fallback.")
+
+    # Target the container's IP directly so proxied requests skip Docker's embedded DNS.
+    container_ip = _select_container_ip(container, preferred_network)
+    if container_ip:
+        return f"{scheme_val}://{container_ip}:{internal_container_port}"
+    return f"{scheme_val}://{container_name}:{internal_container_port}"
+
+
+async def process_container_labels(container: Dict[str, Any], action: str):
+    """Applies a normalized container (see container_from_inspect/container_from_summary) to the registry."""
     cfg = get_settings()
     prefix = cfg.moat_label_prefix
     
-    container_id = container_obj.id
-    container_name = container_obj.name
-    labels = container_obj.labels
-
-    try:
-        live_container_attrs = container_obj.attrs 
-    except Exception as e:
-        print(f"Docker Monitor: Error accessing attributes for {container_name} ({container_id[:12]}): {e}. Skipping.")
-        if action in ["start", "unpause"]:
-            await global_registry.remove_services_by_container_id(container_id)
-        return
+    container_id = container["id"]
+    container_name = container["name"]
+    labels = container["labels"]
 
     if action in ["stop", "die", "pause"]:
         await global_registry.remove_services_by_container_id(container_id)
+        access_policies.remove_container(container_id)
         return
 
     if action in ["start", "unpause"]:
-        enable_label_key = f"{prefix}.enable"
-        if labels.get(enable_label_key) != "true":
+        parsed_labels = _parse_moat_labels(labels, prefix, container_name)
+        if not parsed_labels:
             await global_registry.remove_services_by_container_id(container_id)
+            access_policies.remove_container(container_id)
             return
 
-        hostname_val = labels.get(f"{prefix}.hostname")
-        port_val_str = labels.get(f"{prefix}.port")
-        scheme_val = labels.get(f"{prefix}.scheme", "http").lower()
+        hostname_val, internal_container_port, scheme_val = parsed_labels
+        target_url_determined = _determine_target_url(container, internal_container_port, scheme_val, labels.get(f"{prefix}.network"))
+        # Policy first, so the route is never reachable without it.
+        access_policies.set_docker_policy(hostname_val, container_id, parse_label_list(labels.get(f"{prefix}.allowed_users")),
+                                          parse_label_list(labels.get(f"{prefix}.allowed_groups")))
+        await global_registry.add_service(hostname_val, target_url_determined, "docker", container_id)
 
-        if not (hostname_val and port_val_str):
-            print(f"Docker Monitor: {container_name} enabled but missing required labels. Ensuring removal. Labels: {labels}")
-            await global_registry.remove_services_by_container_id(container_id)
-            return
-        
-        if scheme_val not in ["http", "https"]: scheme_val = "http"
 
-        try: internal_container_port = int(port_val_str)
-        except ValueError:
-            print(f"Docker Monitor: Invalid port '{port_val_str}' for {container_name}. Ensuring removal.")
-            await global_registry.remove_services_by_container_id(container_id)
-            return
+async def _apply_container_event(container_id: str, action: str, attributes: Dict[str, str], docker_client: AsyncDockerClient):
+    """
+    Applies the final coalesced state of a container. Docker merges the container's labels
+    and name into Actor.Attributes, so the enable/hostname/port decision is made from the event
+    itself; the container is only inspected when its port bindings are actually needed.
+    """
+    if action in ["stop", "die", "pause"]:
+        await global_registry.remove_services_by_container_id(container_id)
+        access_policies.remove_container(container_id)
+        return
 
-        target_url_determined: Optional[str] = None
-        network_settings = live_container_attrs.get("NetworkSettings", {})
-        container_ports_info = network_settings.get("Ports", {})
-        published_bindings = container_ports_info.get(f"{internal_container_port}/tcp")
+    container_name = attributes.get("name", container_id[:12])
+    if not _parse_moat_labels(attributes, get_settings().moat_label_prefix, container_name):
+        await global_registry.remove_services_by_container_id(container_id)
+        access_policies.remove_container(container_id)
+        return
 
-        if published_bindings and isinstance(published_bindings, list):
-            host_ip_to_use = "127.0.0.1"; host_port_to_use_str = None
-            for b in published_bindings:
-                if b.get("HostIp") == "127.0.0.1": host_port_to_use_str = b.get("HostPort"); break
-            if not host_port_to_use_str:
-                for b in published_bindings:
-                    if b.get("HostIp") == "0.0.0.0": host_port_to_use_str = b.get("HostPort"); break
-            if not host_port_to_use_str and published_bindings: host_port_to_use_str = published_bindings[0].get("HostPort")
-            if host_port_to_use_str:
-                try:
-                    int(host_port_to_use_str)
-                    target_url_determined = f"{scheme_val}://{host_ip_to_use}:{host_port_to_use_str}"
-                    print(f"Docker Monitor: Using published port for {container_name} ({container_id[:12]}): {target_url_determined}")
-                except ValueError: print(f"Docker Monitor: Invalid HostPort '{host_port_to_use_str}'. Fallback.")
-        
-        if not target_url_determined:
-            target_url_determined = f"{scheme_val}://{container_name}:{internal_container_port}"
-        
-        if target_url_determined:
-            await global_registry.add_service(hostname_val, target_url_determined, "docker", container_id)
-        else:
-            print(f"Docker Monitor: Could not determine target_url for {container_name}. Ensuring removal.")
-            await global_registry.remove_services_by_container_id(container_id)
+    try:
+        container_attrs = await docker_client.inspect_container(container_id)
+        await process_container_labels(container_from_inspect(container_attrs), action)
+    except DockerNotFoundError:
+        await global_registry.remove_services_by_container_id(container_id)
+        access_policies.remove_container(container_id)
+    except DockerEngineError as e: print(f"Docker Monitor (Async Processor): Engine error getting container {container_id[:12]}: {e}")
+    except Exception as e: print(f"Docker Monitor (Async Processor): Error processing labels for {container_id[:12]}: {e}")
 
 
-async def initial_scan_containers(loop: asyncio.AbstractEventLoop, docker_client: Any):
-    if not get_settings().docker_monitor_enabled: return
+async def initial_scan_containers(docker_client: AsyncDockerClient) -> bool:
+    """Routes every running container and drops docker routes of the others. False if the scan didn't finish."""
+    if not get_settings().docker_monitor_enabled: return True
     print("Docker Monitor: Performing initial scan...")
     try:
-        running_containers = await loop.run_in_executor(None, functools.partial(docker_client.containers.list, filters={"status": "running"}))
-        for container in running_containers:
-            if _monitor_task_should_stop.is_set(): print("Docker Monitor: Initial scan aborted."); return
+        running_containers = await docker_client.list_containers(filters={"status": ["running"]})
+        seen_container_ids = []
+        for summary in running_containers:
+            if _monitor_task_should_stop.is_set(): print("Docker Monitor: Initial scan aborted."); return False
+            container = container_from_summary(summary)
+            seen_container_ids.append(container["id"])
             await process_container_labels(container, "start")
-    except APIError as e: print(f"Docker Monitor: Docker APIError during initial scan: {e}.")
-    except Exception as e: print(f"Docker Monitor: Error during initial scan: {e}.")
+        # Entries restored from a registry snapshot whose containers are gone are dropped here.
+        await global_registry.retain_docker_containers(seen_container_ids)
+    except DockerEngineError as e:
+        print(f"Docker Monitor: Docker Engine error during initial scan: {e}.")
+        return False
+    except Exception as e:
+        print(f"Docker Monitor: Error during initial scan: {e}.")
+        return False
     print("Docker Monitor: Initial scan complete.")
-
-
-def _listen_for_docker_events_thread(queue: asyncio.Queue, stop_event: asyncio.Event, loop: asyncio.AbstractEventLoop):
-    print("Docker Monitor (Thread): Listener started.")
-    docker_client_thread = None
+    return True
+
+
+async def _listen_for_docker_events(docker_client: AsyncDockerClient, queue: asyncio.Queue, needs_scan: bool = False):
+    """
+    Streams container events into the queue. If the engine connection drops, reconnects with
+    since= set to the last event's timestamp so nothing emitted in between is lost.
+    With needs_scan (the initial scan failed, e.g. Docker was unreachable at startup), the full scan
+    is retried before connecting, so routes restored from a snapshot for containers that died while
+    Moat was down are still dropped once the engine is reachable.
+    """
+    print("Docker Monitor (Listener): Listener started.")
+    reconnect_delay = EVENT_STREAM_RECONNECT_INITIAL_DELAY
     try:
-        docker_client_thread = docker.from_env()
-        for event_data in docker_client_thread.events(decode=True):
-            if stop_event.is_set(): break
-            try: asyncio.run_coroutine_threadsafe(queue.put(event_data), loop).result(timeout=1.0)
-            except asyncio.TimeoutError:
-                print("Docker Monitor (Thread): Timeout putting event on queue.")
-                if stop_event.is_set(): break 
-            except Exception as e: print(f"Docker Monitor (Thread): Error putting event: {e}"); break
-    except APIError as e: print(f"Docker Monitor (Thread): Docker APIError: {e}. Thread stopping.")
-    except Exception as e: print(f"Docker Monitor (Thread): Unexpected error: {e}. Thread stopping.")
+        while not _monitor_task_should_stop.is_set():
+            if needs_scan:
+                # No event has been received yet, so the stream can resume from just before this scan.
+                docker_client.last_event_since = f"{time.time():.9f}"
+                await _discover_moat_container_networks(docker_client)
+                needs_scan = not await initial_scan_containers(docker_client)
+                if needs_scan:
+                    if _monitor_task_should_stop.is_set(): break
+                    print(f"Docker Monitor (Listener): Retrying the initial scan in {reconnect_delay:.1f}s.")
+                    await asyncio.sleep(reconnect_delay)
+                    reconnect_delay = min(reconnect_delay * 2, EVENT_STREAM_RECONNECT_MAX_DELAY)
+                    continue
+            try:
+                # aclosing: on break or cancellation the stream's HTTP response is closed right away, not at GC.
+                async with contextlib.aclosing(docker_client.events(filters={"type": ["container"]}, since=docker_client.last_event_since)) as events:
+                    async for event_data in events:
+                        reconnect_delay = EVENT_STREAM_RECONNECT_INITIAL_DELAY
+                        await queue.put(event_data)
+                        if _monitor_task_should_stop.is_set(): break
+                    else:
+                        print("Docker Monitor (Listener): Event stream closed by engine. Reconnecting...")
+            except DockerEngineError as e:
+                print(f"Docker Monitor (Listener): {e}. Reconnecting in {reconnect_delay:.1f}s (since={docker_client.last_event_since}).")
+            if _monitor_task_should_stop.is_set(): break
+            await asyncio.sleep(reconnect_delay)
+            reconnect_delay = min(reconnect_delay * 2, EVENT_STREAM_RECONNECT_MAX_DELAY)
     finally:
-        if docker_client_thread:
-            try: docker_client_thread.close()
-            except: pass
-        try: asyncio.run_coroutine_threadsafe(queue.put(None), loop).result(timeout=1.0)
-        except: print("Docker Monitor (Thread): Error putting sentinel.")
-        print("Docker Monitor (Thread): Listener stopped.")
-
-
-async def _process_event_queue(queue: asyncio.Queue, loop: asyncio.AbstractEventLoop, docker_client: Any):
+        try: queue.put_nowait(None)
+        except asyncio.QueueFull: print("Docker Monitor (Listener): Queue full, could not put sentinel.")
+        print("Docker Monitor (Listener): Listener stopped.")
+
+
+async def _flush_pending_events(pending: Dict[str, Tuple[float, str, Dict[str, str], float, float]], applied_event_times: Dict[str, float],
+                                docker_client: AsyncDockerClient, flush_all: bool = False):
+    now = asyncio.get_running_loop().time()
+    due = [cid for cid, entry in pending.items() if flush_all or entry[0] <= now]
+    for container_id in due:
+        _, action, attributes, event_time, _ = pending.pop(container_id)
+        await _apply_container_event(container_id, action, attributes, docker_client)
+        docker_events_applied_total.inc()
+        if event_time:
+            applied_event_times[container_id] = event_time
+            docker_event_lag_seconds.observe(max(0.0, time.time() - event_time))
+
+def _forget_old_applied_event_times(applied_event_times: Dict[str, float]):
+    cutoff = time.time() - EVENT_REORDER_WINDOW_SECONDS
+    for container_id in [cid for cid, event_time in applied_event_times.items() if event_time < cutoff]:
+        del applied_event_times[container_id]
+
+
+async def _process_event_queue(queue: asyncio.Queue, docker_client: AsyncDockerClient):
+    """
+    Consumes raw Docker events and coalesces them per container. Each event replaces the pending action
+    and pushes its apply deadline to EVENT_DEBOUNCE_SECONDS from now (capped at EVENT_DEBOUNCE_MAX_SECONDS
+    after the first pending event), so a burst of die/start pairs collapses into one registry update.
+    Events older (by timeNano) than the container's pending or last applied event are ignored, so
+    reordered events cannot roll a container back to an earlier state.
+    """
     print("Docker Monitor (Async Processor): Processor started.")
+    loop = asyncio.get_running_loop()
+    # container_id -> (apply_deadline, latest_action, latest_attributes, latest_event_unix_time, first_pending_loop_time)
+    pending: Dict[str, Tuple[float, str, Dict[str, str], float, float]] = {}
+    # container_id -> event time of the last state applied, within EVENT_REORDER_WINDOW_SECONDS
+    applied_event_times: Dict[str, float] = {}
     while True:
         if _monitor_task_should_stop.is_set() and queue.empty(): break
-        try: event_data = await asyncio.wait_for(queue.get(), timeout=1.0)
-        except asyncio.TimeoutError:
-            if _monitor_task_should_stop.is_set(): break
+        wait_timeout = 1.0
+        if pending:
+            wait_timeout = max(0.0, min(entry[0] for entry in pending.values()) - loop.time())
+        try:
+            if wait_timeout <= 0: event_data = queue.get_nowait()
+            else: event_data = await asyncio.wait_for(queue.get(), timeout=wait_timeout)
+        except (asyncio.TimeoutError, asyncio.QueueEmpty):
+            await _flush_pending_events(pending, applied_event_times, docker_client)
+            if not pending: _forget_old_applied_event_times(applied_event_times)
+            if _monitor_task_should_stop.is_set() and not pending: break
             continue
-        if event_data is None: break 
+        if event_data is None:
+            queue.task_done()
+            break
 
         try:
             event_type, action = event_data.get("Type"), event_data.get("Action")
-            container_id = event_data.get("Actor", {}).get("ID")
+            actor = event_data.get("Actor", {}) or {}
+            container_id = actor.get("ID")
             if event_type != "container" or not container_id or action not in ["start", "stop", "die", "pause", "unpause"]:
-                queue.task_done(); continue
-            try:
-                container_obj = await loop.run_in_executor(None, functools.partial(docker_client.containers.get, container_id))
-                await process_container_labels(container_obj, action)
-            except NotFound:
-                if action in ["stop", "die"]: await global_registry.remove_services_by_container_id(container_id)
-            except APIError as e: print(f"Docker Monitor (Async Processor): APIError getting container {container_id[:12]}: {e}")
-            except Exception as e: print(f"Docker Monitor (Async Processor): Error processing labels for {container_id[:12]}: {e}")
+                continue
+            docker_events_total.inc(action)
+            attributes = actor.get("Attributes", {}) or {}
+            event_time = int(event_data["timeNano"]) / 1e9 if event_data.get("timeNano") else float(event_data.get("time") or 0)
+            # Older than the state pending or last applied (delivered out of order): keep the newer one.
+            if event_time < applied_event_times.get(container_id, 0.0): continue
+            now = loop.time()
+            first_pending = now
+            if container_id in pending:
+                _, _, _, pending_event_time, first_pending = pending[container_id]
+                if event_time < pending_event_time: continue
+            deadline = min(now + EVENT_DEBOUNCE_SECONDS, first_pending + EVENT_DEBOUNCE_MAX_SECONDS)
+            pending[container_id] = (deadline, action, attributes, event_time, first_pending)
         except Exception as e: print(f"Docker Monitor (Async Processor): Error with event data: {e}")
         finally: queue.task_done()
-    print("Docker Monitor (Async Processor): Processor stopped.")
 
+        await _flush_pending_events(pending, applied_event_times, docker_client)
 
-async def _run_listener_thread_wrapper(loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, stop_event: asyncio.Event):
-    """Async wrapper to run the blocking listener thread in an executor."""
-    try:
-        await loop.run_in_executor(None, _listen_for_docker_events_thread, queue, stop_event, loop)
-    except asyncio.CancelledError:
-        stop_event.set() 
-        raise
-    except Exception as e:
-        print(f"Docker Monitor (_run_listener_thread_wrapper): Exception in listener executor: {e}")
-        stop_event.set()
-        raise
+    if pending:
+        await _flush_pending_events(pending, applied_event_times, docker_client, flush_all=True)
+    print("Docker Monitor (Async Processor): Processor stopped.")
 
 
 async def watch_docker_events():
     global _monitor_task_should_stop, _monitor_task_active
-    global _event_processing_task_ref, _event_listener_manager_task_ref
+    global _event_processing_task_ref, _event_listener_manager_task_ref, _event_queue_ref
 
     loop = asyncio.get_running_loop()
 
@@ -231,39 +431,33 @@ async def watch_docker_events():
         print("Docker Monitor: Disabled by configuration.")
         _monitor_task_active = False; return
 
-    docker_client_main = None
+    docker_client_main: Optional[AsyncDockerClient] = None
     try:
-        docker_client_main = await loop.run_in_executor(None, docker.from_env)
-        await initial_scan_containers(loop, docker_client_main)
+        docker_client_main = AsyncDockerClient.from_env()
+        # Resume point for the event stream: anything that happens during the initial scan is replayed.
+        docker_client_main.last_event_since = f"{time.time():.9f}"
+        await _discover_moat_container_networks(docker_client_main)
+        scan_complete = await initial_scan_containers(docker_client_main)
 
         if _monitor_task_should_stop.is_set():
             print("Docker Monitor: Stopping after initial scan due to signal.")
             _monitor_task_active = False
-            if docker_client_main: await loop.run_in_executor(None, docker_client_main.close)
             return
 
         event_queue = asyncio.Queue(maxsize=100)
+        _event_queue_ref = event_queue
 
         _event_listener_manager_task_ref = loop.create_task(
-            _run_listener_thread_wrapper(loop, event_queue, _monitor_task_should_stop),
-            name="DockerEventListenerManager"
+            _listen_for_docker_events(docker_client_main, event_queue, needs_scan=not scan_complete),
+            name="DockerEventListener"
         )
         _event_processing_task_ref = loop.create_task(
-            _process_event_queue(event_queue, loop, docker_client_main),
+            _process_event_queue(event_queue, docker_client_main),
             name="DockerEventProcessor"
         )
         print("Docker Monitor: Listener and processor tasks started.")
 
-        current_tasks = []
-        if _event_listener_manager_task_ref: current_tasks.append(_event_listener_manager_task_ref)
-        if _event_processing_task_ref: current_tasks.append(_event_processing_task_ref)
-        
-        if not current_tasks:
-            print("Docker Monitor: No tasks to wait for. Exiting manager.")
-            _monitor_task_active = False
-            if docker_client_main: await loop.run_in_executor(None, docker_client_main.close)
-            return
-
+        current_tasks = [_event_listener_manager_task_ref, _event_processing_task_ref]
         done, pending = await asyncio.wait(current_tasks, return_when=asyncio.FIRST_COMPLETED)
         
         _monitor_task_should_stop.set() 
@@ -275,10 +469,10 @@ async def watch_docker_events():
                 except: pass 
 
         for task in done:
-            if task.exception() and not isinstance(task.exception(), asyncio.CancelledError):
+            if not task.cancelled() and task.exception():
                 print(f"Docker Monitor: Monitored sub-task {task.get_name()} failed: {task.exception()}")
 
-    except APIError as e: print(f"Docker Monitor: Critical Docker APIError in watcher setup: {e}.")
+    except DockerEngineError as e: print(f"Docker Monitor: Critical Docker Engine error in watcher setup: {e}.")
     except Exception as e: print(f"Docker Monitor: Critical unexpected error in watcher manager: {e}")
     finally:
         print("Docker Monitor: Watcher manager finishing...")
@@ -298,8 +492,9 @@ async def watch_docker_events():
         
         _event_listener_manager_task_ref = None
         _event_processing_task_ref = None
+        _event_queue_ref = None
 
         if docker_client_main:
-            try: await loop.run_in_executor(None, docker_client_main.close)
+            try: await docker_client_main.close()
             except: pass
         print("Docker Monitor: Watcher manager fully stopped.")
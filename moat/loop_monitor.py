@@ -0,0 +1,132 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Iterable, Optional, Set, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from .config import get_derived_settings
+from .metrics import metrics_registry, event_loop_lag_seconds, event_loop_stalls_total, load_shed_requests_total, Gauge
+
+# Shedding starts when, within this window, at least two lag samples were over the threshold and together
+# cover half the window (the loop was stuck at least half the time); it stops once the window has none.
+LOAD_SHED_WINDOW_SECONDS = 2.0
+MOAT_PATH_PREFIX = "/moat/"
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag as the extra delay of a periodic sleep. Stalls over stall_threshold are
+    counted and logged. With capture_stacks, a watchdog thread records what the loop thread was
+    running while it was blocked (best effort: a C call holding the GIL delays the capture until it returns).
+    """
+    def __init__(self):
+        self.sample_interval_seconds = 0.1
+        self.stall_threshold_seconds = 0.1
+        self.capture_stacks = False
+        self.shed_threshold_seconds: Optional[float] = None
+        self.shed_exempt_hostnames: Set[str] = set()
+        self.shedding = False
+        self.last_lag_seconds = 0.0
+        self._recent_lagged_samples: Deque[Tuple[float, float]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._last_tick = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._watchdog_stop = threading.Event()
+        self._captured_stack: Optional[str] = None
+
+    def configure(self, sample_interval_ms: int, stall_threshold_ms: int, capture_stacks: bool,
+                  shed_threshold_ms: Optional[int], shed_exempt_hostnames: Iterable[str]):
+        self.sample_interval_seconds = sample_interval_ms / 1000
+        self.stall_threshold_seconds = stall_threshold_ms / 1000
+        self.capture_stacks = capture_stacks
+        self.shed_threshold_seconds = shed_threshold_ms / 1000 if shed_threshold_ms else None
+        self.shed_exempt_hostnames = set(shed_exempt_hostnames)
+        if self.shed_threshold_seconds is None or self.sample_interval_seconds <= 0:
+            self.shedding = False
+            self._recent_lagged_samples.clear()
+
+    def start(self):
+        if self.sample_interval_seconds <= 0:
+            if self._task: self._task.cancel()
+            self._task = None
+        elif not self._task or self._task.done():
+            self._loop_thread_id = threading.get_ident()
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="LoopLagMonitor")
+        if self.capture_stacks and self._task:
+            self._watchdog_stop.clear()
+            if not (self._watchdog and self._watchdog.is_alive()):
+                self._watchdog = threading.Thread(target=self._watch_for_stalls, name="moat-loop-watchdog", daemon=True)
+                self._watchdog.start()
+        else:
+            self._watchdog_stop.set()
+
+    async def stop(self):
+        self._watchdog_stop.set()
+        if self._task:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            self._task = None
+        self.shedding = False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            interval = self.sample_interval_seconds
+            self._last_tick = time.monotonic()
+            started = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - started - interval)
+            self.last_lag_seconds = lag
+            event_loop_lag_seconds.observe(lag)
+            if lag >= self.stall_threshold_seconds:
+                event_loop_stalls_total.inc()
+                stack, self._captured_stack = self._captured_stack, None
+                print(f"Loop Monitor: Event loop blocked for {lag * 1000:.0f} ms" + (f"; blocking stack:\n{stack}" if stack else ""))
+            self._update_shedding(time.monotonic(), lag)
+
+    def _update_shedding(self, now: float, lag: float):
+        if self.shed_threshold_seconds is None: return
+        recent = self._recent_lagged_samples
+        if lag >= self.shed_threshold_seconds: recent.append((now, lag))
+        while recent and recent[0][0] < now - LOAD_SHED_WINDOW_SECONDS: recent.popleft()
+        if not self.shedding and len(recent) >= 2 and sum(l for _, l in recent) >= LOAD_SHED_WINDOW_SECONDS / 2:
+            self.shedding = True
+            print(f"Loop Monitor: Sustained event loop lag ({lag * 1000:.0f} ms); shedding proxied traffic with 503s.")
+        elif self.shedding and not recent:
+            self.shedding = False
+            print("Loop Monitor: Event loop lag recovered; no longer shedding traffic.")
+
+    def _watch_for_stalls(self):
+        """Watchdog thread: snapshots the loop thread's stack once per stall."""
+        captured_for_tick = None
+        while not self._watchdog_stop.wait(max(self.stall_threshold_seconds / 2, 0.01)):
+            tick = self._last_tick
+            overdue = time.monotonic() - tick - self.sample_interval_seconds
+            if overdue < self.stall_threshold_seconds or captured_for_tick == tick: continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None: continue
+            self._captured_stack = "".join(traceback.format_stack(frame))
+            captured_for_tick = tick
+
+# Global instance
+loop_monitor = LoopLagMonitor()
+
+metrics_registry.register(Gauge("moat_load_shedding", "1 while proxied traffic is being shed because of event loop lag.", value_callback=lambda: int(loop_monitor.shedding)))
+
+async def reject_when_overloaded(request: Request):
+    """
+    Dependency for proxied routes: while the loop is overloaded, answer with a fast 503 before doing
+    any auth or upstream work. Moat's own host and /moat/ pages, and exempt hostnames, are always served.
+    """
+    if not loop_monitor.shedding: return
+    if request.url.path.startswith(MOAT_PATH_PREFIX): return
+    hostname = request.headers.get("host", "").split(":")[0]
+    if hostname in loop_monitor.shed_exempt_hostnames or hostname == get_derived_settings().moat_hostname: return
+    load_shed_requests_total.inc()
+    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Moat is overloaded; try again shortly.",
+                        headers={"Retry-After": "1"})
@@ -1,24 +1,34 @@
 import typer
-import uvicorn
 import asyncio
 from pathlib import Path
 import yaml
-import docker 
-from docker.errors import NotFound as DockerNotFound # type: ignore
 from typing import Optional
 
-from moat import server, config, database, models
+# Commands import what they need inside their bodies: pulling in the server (FastAPI, aiohttp,
+# watchdog, jinja2...) or even pydantic at module level would make every CLI command pay for it.
+# benchmarks/import_time.py guards this.
 app_cli = typer.Typer()
 
 # Helper for CLI to load config.yml as dict
 def _load_config_yaml_dict() -> dict:
+    from moat import config
     if config.CONFIG_FILE_PATH.exists():
         with open(config.CONFIG_FILE_PATH, 'r') as f:
             return yaml.safe_load(f) or {} # return empty dict if file is empty
     return {}
 
+# Helper for CLI commands that need the loaded settings (e.g. for the database URL); exits if config.yml can't be loaded
+def _require_settings():
+    from moat import config
+    try:
+        return config.get_settings()
+    except (RuntimeError, FileNotFoundError) as e:
+        typer.secho(f"Error: Moat configuration (config.yml) not found or improperly loaded: {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+
 # Helper for CLI to save config.yml from dict
 def _save_config_yaml_dict(config_data: dict):
+    from moat import config
     with open(config.CONFIG_FILE_PATH, 'w') as f:
         yaml.dump(config_data, f, sort_keys=False, default_flow_style=False)
     typer.secho(f"Configuration updated in {config.CONFIG_FILE_PATH}", fg=typer.colors.CYAN)
@@ -32,15 +42,18 @@ def run(
     reload: bool = typer.Option(False, "--reload", help="Enable uvicorn auto-reload (for development of Moat code itself).")
 ):
     """Run the Moat server. Hot-reloads config.yml changes for some settings."""
+    import uvicorn
+    from moat import config
     try:
         if not config.CONFIG_FILE_PATH.exists():
              typer.secho(f"Error: Moat configuration file '{config.CONFIG_FILE_PATH}' not found.", fg=typer.colors.RED)
              typer.secho("Try running `moat init-config` first.", fg=typer.colors.YELLOW)
              raise typer.Exit(code=1)
         
-        cfg_for_run = config.get_settings()
+        # Loaded once here; the server reuses the cached settings when uvicorn imports it in-process.
+        cfg_for_run = config.load_config()
 
-    except RuntimeError as e: 
+    except (RuntimeError, ValueError) as e: 
         typer.secho(f"Error loading Moat configuration: {e}", fg=typer.colors.RED)
         typer.secho("Ensure 'config.yml' is valid or try `moat init-config`.", fg=typer.colors.YELLOW)
         raise typer.Exit(code=1)
@@ -53,26 +66,27 @@ def run(
         host=final_host,
         port=final_port,
         reload=reload, 
-        forwarded_allow_ips='*'
+        forwarded_allow_ips=cfg_for_run.trusted_proxies # Only these peers may set the client address (auth bypass client_cidrs rely on it)
     )
 
 @app_cli.command()
 def add_user(
     username: str = typer.Option(..., prompt=True),
-    password: str = typer.Option(..., prompt=True, confirmation_prompt=True, hide_input=True)
+    password: str = typer.Option(..., prompt=True, confirmation_prompt=True, hide_input=True),
+    admin: bool = typer.Option(False, "--admin", help="Also add the user to admin_group, so they can use Moat's admin pages.")
 ):
     """Add a new user to the Moat database."""
-    try:
-        config.get_settings() 
-    except (RuntimeError, FileNotFoundError) as e:
-        typer.secho(f"Error: Moat configuration (config.yml) not found or improperly loaded: {e}", fg=typer.colors.RED)
-        raise typer.Exit(code=1)
+    from moat import database, models
+    cfg = _require_settings()
 
     async def _add_user():
         await database.init_db() 
         try:
             user_in_db = await database.create_user_db(models.User(username=username), password)
             typer.secho(f"User '{user_in_db.username}' added successfully.", fg=typer.colors.GREEN)
+            if admin:
+                await database.add_user_to_group(user_in_db.username, cfg.admin_group)
+                typer.secho(f"User '{user_in_db.username}' added to the admin group '{cfg.admin_group}'.", fg=typer.colors.GREEN)
         except ValueError as e: 
             typer.secho(f"Error: {e}", fg=typer.colors.RED)
         except Exception as e:
@@ -80,6 +94,198 @@ def add_user(
 
     asyncio.run(_add_user())
 
+def _user_file_format(path: Path, file_format: Optional[str]) -> str:
+    chosen = (file_format or path.suffix.lstrip(".")).lower()
+    if chosen == "ndjson": chosen = "jsonl"
+    if chosen not in ("csv", "jsonl"):
+        typer.secho("Error: Can't tell the file format; use a .csv or .jsonl file or pass --format csv|jsonl.", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    return chosen
+
+def _read_user_rows(path: Path, file_format: str) -> list:
+    """Returns [(row number, dict or error string)]. Row numbers match the file's line numbers."""
+    import csv
+    import json
+    rows = []
+    with open(path, newline="") as f:
+        if file_format == "csv":
+            reader = csv.DictReader(f)
+            for record in reader:
+                rows.append((reader.line_num, record))
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip(): continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    rows.append((line_number, f"Invalid JSON: {e}"))
+                    continue
+                rows.append((line_number, record if isinstance(record, dict) else "Expected a JSON object."))
+    return rows
+
+@app_cli.command("users:import")
+def import_users(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="CSV (with a header row) or JSONL file of users."),
+    file_format: Optional[str] = typer.Option(None, "--format", help="csv or jsonl. Default: from the file extension."),
+    update_existing: bool = typer.Option(False, "--update-existing", help="Replace the password of users that already exist instead of skipping them."),
+    strict: bool = typer.Option(False, "--strict", help="Write nothing if any row has an error."),
+    workers: Optional[int] = typer.Option(None, help="Processes used for password hashing. Default: all CPU cores."),
+):
+    """
+    Imports users from a file with `username` and either `password` (plain text, hashed here) or
+    `hashed_password` (an existing bcrypt hash). All valid rows are written in one transaction.
+    """
+    import time
+    from moat import database, models, security
+    _require_settings()
+
+    chosen_format = _user_file_format(path, file_format)
+    errors = [] # (row number, username, message)
+    seen_usernames = set()
+    valid_rows = [] # (row number, username, plain password or None, bcrypt hash or None)
+    for row_number, record in _read_user_rows(path, chosen_format):
+        if isinstance(record, str):
+            errors.append((row_number, None, record))
+            continue
+        username = str(record.get("username") or "").strip()
+        password = record.get("password") or None
+        hashed_password = record.get("hashed_password") or None
+        if not username:
+            errors.append((row_number, None, "Missing username."))
+        elif username in seen_usernames:
+            errors.append((row_number, username, "Username appears more than once in the file."))
+        elif bool(password) == bool(hashed_password):
+            errors.append((row_number, username, "Give exactly one of password or hashed_password."))
+        elif hashed_password and not security.is_bcrypt_hash(str(hashed_password)):
+            errors.append((row_number, username, "hashed_password is not a bcrypt hash."))
+        else:
+            valid_rows.append((row_number, username, str(password) if password else None, hashed_password))
+        if username: seen_usernames.add(username)
+
+    to_hash = [(index, password) for index, (_, _, password, _) in enumerate(valid_rows) if password is not None]
+    hashed_by_index = {}
+    if to_hash:
+        typer.secho(f"Hashing {len(to_hash)} password(s)...", fg=typer.colors.BLUE)
+        started = time.perf_counter()
+        hash_results = security.hash_passwords_in_parallel([password for _, password in to_hash], workers)
+        for (index, _), (password_hash, error) in zip(to_hash, hash_results):
+            if error:
+                row_number, username, _, _ = valid_rows[index]
+                errors.append((row_number, username, f"Could not hash password: {error}"))
+            else:
+                hashed_by_index[index] = password_hash
+        typer.secho(f"Hashed in {time.perf_counter() - started:.1f}s.", fg=typer.colors.BLUE)
+
+    users = []
+    for index, (_, username, password, hashed_password) in enumerate(valid_rows):
+        password_hash = hashed_password if password is None else hashed_by_index.get(index)
+        if password_hash: users.append(models.UserInDB(username=username, hashed_password=password_hash))
+
+    if errors and strict:
+        users = []
+    results = {}
+    if users:
+        async def _import_users():
+            await database.init_db()
+            return await database.create_users_bulk(users, update_existing=update_existing)
+        try:
+            results = asyncio.run(_import_users())
+        except ValueError as e:
+            typer.secho(f"Error: {e}", fg=typer.colors.RED)
+            raise typer.Exit(code=1)
+
+    username_rows = {username: row_number for row_number, username, _, _ in valid_rows}
+    for username, outcome in results.items():
+        if outcome == "exists":
+            errors.append((username_rows[username], username, "User already exists (use --update-existing to replace the password)."))
+    for row_number, username, message in sorted(errors, key=lambda error: error[0]):
+        typer.secho(f"Row {row_number}{f' ({username})' if username else ''}: {message}", fg=typer.colors.RED)
+
+    created = sum(1 for outcome in results.values() if outcome == "created")
+    updated = sum(1 for outcome in results.values() if outcome == "updated")
+    if errors and strict:
+        typer.secho(f"{len(errors)} row(s) had errors; nothing was imported (--strict).", fg=typer.colors.RED)
+    else:
+        typer.secho(f"Imported users: {created} created, {updated} updated, {len(errors)} row(s) with errors.",
+                    fg=typer.colors.YELLOW if errors else typer.colors.GREEN)
+    if errors:
+        raise typer.Exit(code=1)
+
+@app_cli.command("users:export")
+def export_users(
+    path: Path = typer.Argument(..., help="Output file (.csv or .jsonl), or - for stdout."),
+    file_format: Optional[str] = typer.Option(None, "--format", help="csv or jsonl. Default: from the file extension (jsonl for stdout)."),
+):
+    """Exports all users with their bcrypt password hashes, in a format `users:import` reads back."""
+    import csv
+    import json
+    import sys
+    from moat import database
+    _require_settings()
+
+    to_stdout = str(path) == "-"
+    chosen_format = _user_file_format(path, file_format or ("jsonl" if to_stdout else None))
+
+    async def _get_users():
+        await database.init_db()
+        return await database.get_all_users()
+
+    users = asyncio.run(_get_users())
+    f = sys.stdout if to_stdout else open(path, "w", newline="")
+    try:
+        if chosen_format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(["username", "hashed_password"])
+            writer.writerows((user.username, user.hashed_password) for user in users)
+        else:
+            for user in users:
+                f.write(json.dumps({"username": user.username, "hashed_password": user.hashed_password}) + "\n")
+    finally:
+        if not to_stdout: f.close()
+    if not to_stdout:
+        typer.secho(f"Exported {len(users)} user(s) to {path}. The file contains password hashes; keep it private.", fg=typer.colors.GREEN)
+
+def _run_group_command(coroutine_function):
+    from moat import database
+    _require_settings()
+
+    async def _run():
+        await database.init_db()
+        return await coroutine_function(database)
+    try:
+        return asyncio.run(_run())
+    except ValueError as e:
+        typer.secho(f"Error: {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+
+@app_cli.command("groups:add-user")
+def add_user_to_group(username: str = typer.Argument(...), group: str = typer.Argument(...)):
+    """Adds a user to a group (groups are used by access_policies and the allowed_groups Docker label)."""
+    if _run_group_command(lambda database: database.add_user_to_group(username, group)):
+        typer.secho(f"User '{username}' added to group '{group}'.", fg=typer.colors.GREEN)
+    else:
+        typer.secho(f"User '{username}' is already in group '{group}'.", fg=typer.colors.YELLOW)
+    typer.secho("Running servers pick up the change once cached sessions expire (auth_cache_ttl_seconds).", fg=typer.colors.YELLOW)
+
+@app_cli.command("groups:remove-user")
+def remove_user_from_group(username: str = typer.Argument(...), group: str = typer.Argument(...)):
+    """Removes a user from a group."""
+    if _run_group_command(lambda database: database.remove_user_from_group(username, group)):
+        typer.secho(f"User '{username}' removed from group '{group}'.", fg=typer.colors.GREEN)
+    else:
+        typer.secho(f"User '{username}' is not in group '{group}'.", fg=typer.colors.YELLOW)
+
+@app_cli.command("groups:list")
+def list_groups():
+    """Lists groups and their members."""
+    members_by_group = {}
+    for group, username in _run_group_command(lambda database: database.get_group_memberships()):
+        members_by_group.setdefault(group, []).append(username)
+    if not members_by_group:
+        typer.secho("No groups yet. Add members with `groups:add-user <username> <group>`.", fg=typer.colors.YELLOW)
+    for group, usernames in members_by_group.items():
+        typer.echo(f"{group}: {', '.join(usernames)}")
+
 @app_cli.command()
 def init_config(force: bool = typer.Option(False, "--force", "-f", help="Overwrite existing config.yml.")):
     """Initialize a sample config.yml in the current directory."""
@@ -91,6 +297,8 @@ def init_config(force: bool = typer.Option(False, "--force", "-f", help="Overwri
     default_config_content = f"""
 listen_host: "0.0.0.0"
 listen_port: 8000
+# Reverse proxies/tunnels whose X-Forwarded-For is trusted (IPs or CIDRs, e.g. "172.18.0.0/16" for a Docker network)
+trusted_proxies: ["127.0.0.1"]
 secret_key: "YOUR_VERY_SECRET_KEY_CHANGE_THIS_NOW_PLEASE" # Generate with: openssl rand -hex 32
 access_token_expire_minutes: 60
 database_url: "sqlite+aiosqlite:///./moat.db"
@@ -103,6 +311,9 @@ moat_base_url: null
 # Ensure this matches how your applications are accessed.
 cookie_domain: null
 
+# Members of this group may use Moat's admin pages (add-user --admin, or groups:add-user <username> admins)
+admin_group: "admins"
+
 # Docker label monitoring settings
 docker_monitor_enabled: true
 moat_label_prefix: "moat" # e.g., moat.enable, moat.hostname
@@ -127,6 +338,7 @@ def add_static_service(
     target_url: str = typer.Option(..., prompt="Target URL for the backend service (e.g., http://localhost:3000 or http://container_name:port)")
 ):
     """Adds a new static service definition to config.yml."""
+    from moat import config
     if not config.CONFIG_FILE_PATH.exists():
         typer.secho(f"Error: {config.CONFIG_FILE_PATH} not found. Run `moat init-config` first.", fg=typer.colors.RED)
         raise typer.Exit(code=1)
@@ -180,31 +392,42 @@ def docker_bind_container(
     to config.yml. Moat will then proxy requests for that hostname to the container.
     This command creates a static entry in config.yml, not using dynamic Docker labels.
     """
+    from moat import config
+    from moat.docker_client import AsyncDockerClient, DockerEngineError, DockerNotFoundError
     if not config.CONFIG_FILE_PATH.exists():
         typer.secho(f"Error: {config.CONFIG_FILE_PATH} not found. Run `moat init-config` first.", fg=typer.colors.RED)
         raise typer.Exit(code=1)
 
+    async def _inspect_container() -> dict:
+        client = AsyncDockerClient.from_env()
+        try:
+            return await client.inspect_container(container_name_or_id)
+        finally:
+            await client.close()
+
     try:
-        client = docker.from_env()
-        container = client.containers.get(container_name_or_id)
-    except DockerNotFound:
+        container_attrs = asyncio.run(_inspect_container())
+    except DockerNotFoundError:
         typer.secho(f"Error: Docker container '{container_name_or_id}' not found.", fg=typer.colors.RED)
         raise typer.Exit(code=1)
-    except docker.errors.DockerException as e:
+    except DockerEngineError as e:
         typer.secho(f"Error connecting to Docker: {e}. Is Docker running and accessible?", fg=typer.colors.RED)
         raise typer.Exit(code=1)
 
-    if container.status != "running":
-        typer.secho(f"Error: Container '{container.name}' is not running (status: {container.status}).", fg=typer.colors.RED)
+    container_name = (container_attrs.get('Name') or container_name_or_id).lstrip('/')
+    container_short_id = container_attrs.get('Id', '')[:12]
+    container_status = (container_attrs.get('State') or {}).get('Status')
+    if container_status != "running":
+        typer.secho(f"Error: Container '{container_name}' is not running (status: {container_status}).", fg=typer.colors.RED)
         raise typer.Exit(code=1)
 
     container_internal_port_to_target = None
     if target_port_override:
         container_internal_port_to_target = target_port_override
     else:
-        exposed_ports_config = container.attrs['Config'].get('ExposedPorts', {}) # e.g. {"80/tcp": {}}
+        exposed_ports_config = (container_attrs.get('Config') or {}).get('ExposedPorts') or {} # e.g. {"80/tcp": {}}
         if not exposed_ports_config:
-            typer.secho(f"Error: Container '{container.name}' has no exposed ports in its image config.", fg=typer.colors.RED)
+            typer.secho(f"Error: Container '{container_name}' has no exposed ports in its image config.", fg=typer.colors.RED)
             typer.secho("Use --target-port-override or ensure the Docker image EXPOSEs a port.", fg=typer.colors.YELLOW)
             raise typer.Exit(code=1)
 
@@ -225,7 +448,7 @@ def docker_bind_container(
         raise typer.Exit(code=1)
 
     internal_port_tcp_str = f"{container_internal_port_to_target}/tcp"
-    port_mappings = container.attrs['NetworkSettings']['Ports'].get(internal_port_tcp_str) # More reliable for published ports
+    port_mappings = ((container_attrs.get('NetworkSettings') or {}).get('Ports') or {}).get(internal_port_tcp_str) # More reliable for published ports
 
     target_host_for_url: str
     target_port_for_url: int
@@ -243,18 +466,18 @@ def docker_bind_container(
 
         target_host_for_url = "127.0.0.1"
         target_port_for_url = int(host_port_str)
-        typer.secho(f"Info: Container '{container.name}' port {internal_port_tcp_str} is published to host as {target_host_for_url}:{target_port_for_url}.", fg=typer.colors.BLUE)
+        typer.secho(f"Info: Container '{container_name}' port {internal_port_tcp_str} is published to host as {target_host_for_url}:{target_port_for_url}.", fg=typer.colors.BLUE)
     else:
         # Port is exposed but not published. Target by container name.
-        target_host_for_url = container.name
+        target_host_for_url = container_name
         target_port_for_url = container_internal_port_to_target
-        typer.secho(f"Info: Container '{container.name}' port {internal_port_tcp_str} is exposed. "
+        typer.secho(f"Info: Container '{container_name}' port {internal_port_tcp_str} is exposed. "
                     f"Targeting by container name: '{target_host_for_url}:{target_port_for_url}'. "
                     "This requires Moat and the container to be on a shared Docker network for resolution.", fg=typer.colors.BLUE)
 
     final_target_url = f"{target_scheme}://{target_host_for_url}:{target_port_for_url}"
     
-    typer.secho(f"Proposed static service: Hostname '{public_hostname}' -> Target '{final_target_url}' (for container '{container.name}')", fg=typer.colors.CYAN)
+    typer.secho(f"Proposed static service: Hostname '{public_hostname}' -> Target '{final_target_url}' (for container '{container_name}')", fg=typer.colors.CYAN)
 
     cfg_dict = _load_config_yaml_dict()
     if 'static_services' not in cfg_dict or cfg_dict['static_services'] is None:
@@ -270,7 +493,7 @@ def docker_bind_container(
         typer.secho(f"Static service for hostname '{public_hostname}' already exists (target: {cfg_dict['static_services'][existing_service_idx].get('target_url')}).", fg=typer.colors.YELLOW)
         if typer.confirm(f"Update its target_url to '{final_target_url}'?"):
             cfg_dict['static_services'][existing_service_idx]['target_url'] = final_target_url
-            cfg_dict['static_services'][existing_service_idx]['_comment'] = f"Bound to Docker container: {container.name} (ID: {container.short_id}) via docker:bind"
+            cfg_dict['static_services'][existing_service_idx]['_comment'] = f"Bound to Docker container: {container_name} (ID: {container_short_id}) via docker:bind"
             _save_config_yaml_dict(cfg_dict)
             typer.secho(f"Static service '{public_hostname}' updated.", fg=typer.colors.GREEN)
         else:
@@ -280,12 +503,12 @@ def docker_bind_container(
     new_service_entry = {
         "hostname": public_hostname,
         "target_url": final_target_url,
-        "_comment": f"Bound to Docker container: {container.name} (ID: {container.short_id}) via docker:bind"
+        "_comment": f"Bound to Docker container: {container_name} (ID: {container_short_id}) via docker:bind"
     }
     cfg_dict['static_services'].append(new_service_entry)
     
     _save_config_yaml_dict(cfg_dict)
-    typer.secho(f"Static service '{public_hostname}' -> '{final_target_url}' added for container '{container.name}'.", fg=typer.colors.GREEN)
+    typer.secho(f"Static service '{public_hostname}' -> '{final_target_url}' added for container '{container_name}'.", fg=typer.colors.GREEN)
 
 if __name__ == "__main__":
     app_cli()
@@ -0,0 +1,157 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Moat runs on a single event loop, so metric updates are plain dict/list operations with no locks.
+# Histograms use fixed buckets: observe() is one bisect plus two additions.
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label_value(str(value))}"' for name, value in zip(labelnames, labelvalues)]
+    if extra: parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        self.values[labelvalues] = self.values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """A gauge that is either set directly or, if value_callback is given, read at scrape time."""
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), value_callback: Optional[Callable[[], float]] = None):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.value_callback = value_callback
+
+    def set(self, value: float, *labelvalues: str):
+        self.values[labelvalues] = value
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        self.values[labelvalues] = self.values.get(labelvalues, 0.0) + amount
+
+    def dec(self, *labelvalues: str, amount: float = 1.0):
+        self.values[labelvalues] = self.values.get(labelvalues, 0.0) - amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        if self.value_callback is not None:
+            try: lines.append(f"{self.name} {_format_value(self.value_callback())}")
+            except Exception as e: print(f"Metrics: Error reading gauge {self.name}: {e}")
+            return lines
+        for labelvalues, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [per-bucket counts (last slot is +Inf), sum of observations]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        series = self.series.get(labelvalues)
+        if series is None:
+            series = self.series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labelvalues, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labelvalues)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Global instance
+metrics_registry = MetricsRegistry()
+
+# Label value used for requests whose Host matched no service, to keep label cardinality bounded.
+UNMATCHED_SERVICE_LABEL = "_unmatched"
+
+proxy_requests_total = metrics_registry.register(Counter(
+    "moat_proxy_requests_total", "Proxied requests by service and response status class.", ("service", "status_class")))
+proxy_request_duration_seconds = metrics_registry.register(Histogram(
+    "moat_proxy_request_duration_seconds", "Total time spent proxying a request, per service.", ("service",)))
+proxy_requests_in_flight = metrics_registry.register(Gauge(
+    "moat_proxy_requests_in_flight", "Proxied requests currently waiting on their upstream, per service.", ("service",)))
+upstream_connect_seconds = metrics_registry.register(Histogram(
+    "moat_upstream_connect_seconds", "Time to establish a new upstream connection (DNS + TCP/TLS), per service.", ("service",)))
+upstream_ttfb_seconds = metrics_registry.register(Histogram(
+    "moat_upstream_ttfb_seconds", "Time from sending the upstream request (including any connect) to receiving response headers, per service.", ("service",)))
+auth_outcomes_total = metrics_registry.register(Counter(
+    "moat_auth_outcomes_total", "Cookie authentication results.", ("outcome",)))
+auth_token_cache_total = metrics_registry.register(Counter(
+    "moat_auth_token_cache_total", "Lookups in the validated-token cache.", ("result",)))
+auth_bypass_requests_total = metrics_registry.register(Counter(
+    "moat_auth_bypass_requests_total", "Proxied requests let through without authentication, by bypass rule.", ("rule",)))
+docker_events_total = metrics_registry.register(Counter(
+    "moat_docker_events_total", "Docker container events received, by action.", ("action",)))
+docker_events_applied_total = metrics_registry.register(Counter(
+    "moat_docker_events_applied_total", "Coalesced container states applied to the registry."))
+docker_event_lag_seconds = metrics_registry.register(Histogram(
+    "moat_docker_event_lag_seconds", "Time from the engine emitting an event to Moat applying it (includes debounce).",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)))
+access_log_records_total = metrics_registry.register(Counter(
+    "moat_access_log_records_total", "Access log records written, or dropped because the writer fell behind.", ("outcome",)))
+event_loop_lag_seconds = metrics_registry.register(Histogram(
+    "moat_event_loop_lag_seconds", "Extra delay of the loop monitor's periodic wakeup; time the loop spent busy or blocked.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)))
+event_loop_stalls_total = metrics_registry.register(Counter(
+    "moat_event_loop_stalls_total", "Loop lag samples over loop_stall_threshold_ms."))
+load_shed_requests_total = metrics_registry.register(Counter(
+    "moat_load_shed_requests_total", "Proxied requests answered with 503 because the event loop was overloaded."))
+trace_spans_total = metrics_registry.register(Counter(
+    "moat_trace_spans_total", "Sampled trace spans exported, or dropped because the export queue was full or the export failed.", ("outcome",)))
+compressed_responses_total = metrics_registry.register(Counter(
+    "moat_compressed_responses_total", "Proxied responses Moat compressed, by encoding and variant cache outcome (not_smaller: compressed but sent as is).", ("encoding", "outcome")))
+compression_bytes_total = metrics_registry.register(Counter(
+    "moat_compression_bytes_total", "Body bytes of compressed responses before (original) and after (compressed) compression.", ("stage",)))
+buffered_bodies_total = metrics_registry.register(Counter(
+    "moat_buffered_bodies_total", "Proxied request/response bodies by how the body budget handled them (buffered, streamed or refused).", ("direction", "outcome")))
+mirror_requests_total = metrics_registry.register(Counter(
+    "moat_mirror_requests_total", "Request copies sent to a service's mirror, by comparison with the primary response.", ("service", "outcome")))
+mirror_duration_seconds = metrics_registry.register(Histogram(
+    "moat_mirror_duration_seconds", "Time from sending a request copy to receiving the mirror's response headers, per service.", ("service",)))
+
+def status_class(status_code: int) -> str:
+    return f"{status_code // 100}xx"
@@ -0,0 +1,204 @@
+import asyncio
+import random
+import time
+from collections import Counter as CounterDict, deque
+from typing import Any, Deque, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+
+from .body_budget import body_budget
+from .dns_cache import dns_cache
+from .metrics import metrics_registry, mirror_requests_total, mirror_duration_seconds, Gauge
+from .models import MirrorConfig
+
+MIRROR_HEADER = "X-Moat-Mirror"
+MIRROR_LATENCY_SAMPLES = 1000 # Per service, for the comparison report
+MIRROR_READ_CHUNK_BYTES = 64 * 1024
+
+class _MirrorJob:
+    __slots__ = ("service", "method", "url", "headers", "body", "primary_status", "primary_seconds")
+
+    def __init__(self, service, method, url, headers, body, primary_status, primary_seconds):
+        self.service, self.method, self.url, self.headers, self.body = service, method, url, headers, body
+        self.primary_status, self.primary_seconds = primary_status, primary_seconds
+
+
+class _MirrorStats:
+    """Primary vs. mirror comparison for one service since the mirror was configured. Latencies are time to response headers."""
+    def __init__(self):
+        self.sent = 0
+        self.status_matches = 0
+        self.errors = 0
+        self.dropped = 0
+        self.status_pairs: CounterDict = CounterDict() # (primary status, mirror status) for mismatches
+        self.latencies: Deque[Tuple[float, float]] = deque(maxlen=MIRROR_LATENCY_SAMPLES) # (primary, mirror) seconds
+
+    def report(self) -> Dict[str, Any]:
+        def percentile(values: List[float], quantile: float) -> Optional[float]:
+            if not values: return None
+            return round(sorted(values)[min(len(values) - 1, int(quantile * len(values)))] * 1000, 1)
+        primary = [p for p, _ in self.latencies]
+        mirror = [m for _, m in self.latencies]
+        return {
+            "sent": self.sent, "errors": self.errors, "dropped": self.dropped,
+            "status_match_rate": round(self.status_matches / self.sent, 4) if self.sent else None,
+            "status_mismatches": [{"primary": p, "mirror": m, "count": count} for (p, m), count in self.status_pairs.most_common(20)],
+            "latency_ms": {
+                "samples": len(self.latencies),
+                "primary_p50": percentile(primary, 0.5), "mirror_p50": percentile(mirror, 0.5),
+                "primary_p95": percentile(primary, 0.95), "mirror_p95": percentile(mirror, 0.95),
+                "median_difference": percentile([m - p for p, m in self.latencies], 0.5),
+            },
+        }
+
+
+class TrafficMirror:
+    """
+    Sends copies of sampled proxied requests to a per-service shadow upstream and compares its status and
+    latency with the primary's. submit() only appends to a bounded queue and never awaits, so the primary
+    path is unaffected by the mirror; when the queue is full the copy is dropped and counted. A fixed number
+    of workers with their own connection pool and timeout send the copies and discard the responses.
+    """
+    def __init__(self):
+        self._mirrors: Dict[str, MirrorConfig] = {}
+        self._methods: Dict[str, frozenset] = {}
+        self.max_queued = 1000
+        self.concurrency = 8
+        self.timeout_seconds = 10.0
+        self.stats: Dict[str, _MirrorStats] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._mirrors)
+
+    def configure(self, mirrors: Mapping[str, MirrorConfig], max_queued: int, concurrency: int, timeout_seconds: float):
+        self._mirrors = dict(mirrors)
+        self._methods = {hostname: frozenset(method.upper() for method in mirror.methods) for hostname, mirror in mirrors.items()}
+        self.stats = {hostname: self.stats.get(hostname) or _MirrorStats() for hostname in mirrors}
+        if (max_queued, concurrency, timeout_seconds) != (self.max_queued, self.concurrency, self.timeout_seconds):
+            self._close_session_later(self._stop_workers()) # The session's pool size and timeout are the old ones
+        self.max_queued, self.concurrency, self.timeout_seconds = max_queued, concurrency, timeout_seconds
+
+    def start(self):
+        if not self._mirrors:
+            self._close_session_later(self._stop_workers())
+            return
+        if self._workers: return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._run_worker(), name=f"TrafficMirror-{i}") for i in range(self.concurrency)]
+
+    def _stop_workers(self) -> Optional[aiohttp.ClientSession]:
+        """Cancels the workers, counts still-queued copies as dropped and detaches the session (returned, for closing)."""
+        for worker in self._workers: worker.cancel()
+        self._workers = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                job = self._queue.get_nowait()
+                if job.body: body_budget.release(len(job.body))
+                self._count_dropped(job.service)
+        self._queue = None
+        session, self._session = self._session, None
+        return session
+
+    @staticmethod
+    def _close_session_later(session: Optional[aiohttp.ClientSession]):
+        if session is not None and not session.closed:
+            asyncio.get_running_loop().create_task(session.close())
+
+    def wants(self, service: str, method: str) -> bool:
+        mirror = self._mirrors.get(service)
+        if mirror is None or self._queue is None: return False
+        methods = self._methods[service]
+        return (not methods or method in methods) and random.random() < mirror.sample_rate
+
+    def submit(self, service: str, method: str, path_and_query: str, backend_headers: Dict[str, str], body: Optional[bytes],
+               primary_status: int, primary_seconds: float):
+        """Queues a copy of a request whose primary response headers have arrived (call wants() first). Never blocks."""
+        target = str(self._mirrors[service].target_url)
+        url = urljoin(target if target.endswith("/") else target + "/", path_and_query.lstrip("/"))
+        parsed = urlparse(url)
+        headers = {k: v for k, v in backend_headers.items() if k.lower() != "traceparent"}
+        headers["Host"] = parsed.netloc
+        headers[MIRROR_HEADER] = "1"
+        # A queued copy keeps its body after the primary request is done, so the body stays reserved in the budget.
+        if body and not body_budget.try_acquire(len(body)):
+            self._count_dropped(service)
+            return
+        try:
+            self._queue.put_nowait(_MirrorJob(service, method, url, headers, body, primary_status, primary_seconds))
+        except asyncio.QueueFull:
+            if body: body_budget.release(len(body))
+            self._count_dropped(service)
+
+    def _count_dropped(self, service: str):
+        stats = self.stats.get(service)
+        if stats is not None: stats.dropped += 1
+        mirror_requests_total.inc(service, "dropped")
+
+    async def _run_worker(self):
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            try:
+                await self._send(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Traffic Mirror: Unexpected error mirroring {job.method} {job.url}: {e!r}")
+            finally:
+                if job.body: body_budget.release(len(job.body))
+
+    async def _send(self, job: _MirrorJob):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency, resolver=dns_cache),
+                timeout=aiohttp.ClientTimeout(total=self.timeout_seconds), auto_decompress=False,
+            )
+        stats = self.stats.get(job.service)
+        if stats is None: return # Mirror removed since the job was queued
+        stats.sent += 1
+        started = time.perf_counter()
+        try:
+            async with self._session.request(job.method, job.url, headers=job.headers, data=job.body, allow_redirects=False) as response:
+                mirror_seconds = time.perf_counter() - started
+                mirror_status = response.status
+                while await response.content.read(MIRROR_READ_CHUNK_BYTES): pass
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            stats.errors += 1
+            mirror_requests_total.inc(job.service, "error")
+            print(f"Traffic Mirror: {job.method} {job.url} failed: {e!r}")
+            return
+        mirror_duration_seconds.observe(mirror_seconds, job.service)
+        stats.latencies.append((job.primary_seconds, mirror_seconds))
+        if mirror_status == job.primary_status:
+            stats.status_matches += 1
+            mirror_requests_total.inc(job.service, "status_match")
+        else:
+            stats.status_pairs[(job.primary_status, mirror_status)] += 1
+            mirror_requests_total.inc(job.service, "status_mismatch")
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "services": {hostname: {"target": str(self._mirrors[hostname].target_url), "sample_rate": self._mirrors[hostname].sample_rate,
+                                    **stats.report()} for hostname, stats in self.stats.items()},
+        }
+
+    async def stop(self):
+        workers = self._workers
+        session = self._stop_workers()
+        for worker in workers:
+            try: await worker
+            except asyncio.CancelledError: pass
+        if session is not None and not session.closed: await session.close()
+
+# Global instance
+traffic_mirror = TrafficMirror()
+
+metrics_registry.register(Gauge("moat_mirror_queued_requests", "Mirrored request copies waiting to be sent.",
+                                value_callback=lambda: traffic_mirror._queue.qsize() if traffic_mirror._queue else 0))
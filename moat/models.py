@@ -1,4 +1,5 @@
-from pydantic import BaseModel, HttpUrl, field_validator # Import field_validator
+from pydantic import BaseModel, HttpUrl, field_validator, model_validator # Import field_validator
+import ipaddress
 from typing import Optional, Dict, List
 
 class Token(BaseModel):
@@ -18,9 +19,59 @@ class StaticServiceConfig(BaseModel):
     hostname: str
     target_url: HttpUrl
 
+class StaticMountConfig(BaseModel):
+    hostname: str
+    path_prefix: str = "/" # Requests under this path are served from directory (the prefix is stripped)
+    directory: str
+    index_file: str = "index.html" # Served for directory paths
+    spa_fallback: bool = False # Serve index_file for missing paths without a file extension (client-side routing)
+    cache_control: Optional[str] = None # e.g. "public, max-age=31536000, immutable" for fingerprinted assets
+
+class CompressionRule(BaseModel):
+    enabled: bool = True
+    min_bytes: Optional[int] = None # Defaults to compression_min_bytes
+    content_types: Optional[List[str]] = None # Defaults to compression_content_types
+
+class MirrorConfig(BaseModel):
+    target_url: HttpUrl # Shadow upstream that receives copies; its responses are discarded
+    sample_rate: float = 1.0 # Fraction of the service's requests copied
+    methods: List[str] = ["GET", "HEAD"] # Only these methods are copied (writes are replayed only if listed); empty means any
+
+    @field_validator('sample_rate')
+    @classmethod
+    def validate_sample_rate(cls, value: float):
+        if not 0.0 <= value <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        return value
+
+class AccessPolicyConfig(BaseModel):
+    allowed_users: List[str] = []
+    allowed_groups: List[str] = [] # Groups are managed with the groups:* CLI commands
+
+class AuthBypassRule(BaseModel):
+    name: str # Label on moat_auth_bypass_requests_total
+    hostnames: List[str] = [] # Services the rule applies to; empty means all
+    paths: List[str] = [] # Prefixes ("/healthz", "/public") or globs ("/hooks/*/github", "/assets/**.js")
+    methods: List[str] = [] # Empty means any method
+    client_cidrs: List[str] = [] # Client networks, e.g. "192.168.1.0/24"; combined with paths if both are given
+
+    @field_validator('client_cidrs')
+    @classmethod
+    def validate_client_cidrs(cls, value: List[str]):
+        for cidr in value:
+            ipaddress.ip_network(cidr, strict=False) # Raises ValueError for a malformed network
+        return value
+
+    @model_validator(mode='after')
+    def require_paths_or_networks(self):
+        if not self.paths and not self.client_cidrs:
+            raise ValueError(f"Auth bypass rule '{self.name}' needs paths or client_cidrs; it would otherwise open the whole service.")
+        return self
+
 class MoatSettings(BaseModel):
     listen_host: str = "0.0.0.0"
     listen_port: int = 8000
+    trusted_proxies: List[str] = ["127.0.0.1"] # Peers (IPs or CIDRs) whose X-Forwarded-For/-Proto `moat run` believes; the client is the rightmost hop not listed
     secret_key: str
     access_token_expire_minutes: int = 30
     database_url: str = "sqlite+aiosqlite:///./moat.db"
@@ -32,6 +83,67 @@ class MoatSettings(BaseModel):
     docker_monitor_enabled: bool = True
     moat_label_prefix: str = "moat"
     static_services: List[StaticServiceConfig] = []
+    config_dir: Optional[str] = None # e.g. "conf.d": more static_services, one *.yml file per service or group (relative to config.yml)
+    static_mounts: List[StaticMountConfig] = [] # Served from local directories by Moat itself (after the usual auth check)
+
+    access_policies: Dict[str, AccessPolicyConfig] = {} # hostname -> who may use it; services without a policy allow every user
+    auth_bypass_rules: List[AuthBypassRule] = [] # Requests matching a rule are proxied without authentication
+
+    admin_group: str = "admins" # Only members (see groups:add-user) may use Moat's admin pages; other users get 403
+    admin_api_token: Optional[str] = None # Lets automation call /moat/admin/api with "Authorization: Bearer <token>" instead of a login cookie
+    metrics_bearer_token: Optional[str] = None # Lets scrapers read /moat/metrics with "Authorization: Bearer <token>" instead of a login cookie
+    server_timing_users: List[str] = [] # Users who get a Server-Timing header (auth/lookup/connect/upstream/body) on proxied responses
+    slow_request_threshold_ms: Optional[int] = 2000 # Proxied requests slower than this are logged with a phase breakdown; null disables
+    auth_cache_ttl_seconds: int = 30 # Validated session tokens skip JWT decode and the user lookup for this long; 0 disables
+    dns_cache_ttl_seconds: int = 60 # How long resolved upstream hostnames are cached before a background refresh
+
+    compression_enabled: bool = True # Compress proxied responses with gzip (or brotli/zstd if installed) when the client accepts it
+    compression_min_bytes: int = 1024 # Smaller bodies are sent as-is
+    compression_content_types: List[str] = [
+        "text/*", "application/json", "application/javascript", "application/xml", "application/manifest+json",
+        "application/ld+json", "application/wasm", "image/svg+xml",
+    ] # Exact types, or "type/*"
+    compression_offload_bytes: int = 64 * 1024 # Bodies at least this large are compressed on a worker thread
+    compression_cache_bytes: int = 16 * 1024 * 1024 # Compressed variants of repeated identical bodies kept for reuse; 0 disables
+    compression_service_rules: Dict[str, CompressionRule] = {} # Per-hostname overrides, e.g. {"media.example.com": {"enabled": false}}
+
+    traffic_mirrors: Dict[str, MirrorConfig] = {} # Per-hostname shadow upstream, e.g. {"app.example.com": {"target_url": "http://app-v2:8080", "sample_rate": 0.1}}
+    mirror_max_queued_requests: int = 1000 # Copies waiting for a mirror beyond this are dropped and counted
+    mirror_concurrency: int = 16 # Copies in flight at once, across all mirrors
+    mirror_timeout_seconds: float = 10.0
+
+    body_budget_bytes: Optional[int] = 256 * 1024 * 1024 # Proxied body bytes buffered in memory at once, across all requests; null disables
+    body_buffer_max_bytes: int = 16 * 1024 * 1024 # Larger bodies (and uploads of unknown size) are streamed instead of buffered
+    body_budget_wait_seconds: float = 5.0 # How long an upload waits for budget before it is refused with 503
+
+    registry_snapshot_path: Optional[str] = "./moat-registry.json" # Docker-discovered routes are restored from here on startup; null disables
+    registry_snapshot_interval_seconds: int = 15
+
+    access_log_path: Optional[str] = "./moat-access.log" # One JSON line per proxied request; null disables
+    access_log_max_bytes: int = 10 * 1024 * 1024 # Rotate when the file would grow past this; 0 disables size rotation
+    access_log_rotate_seconds: int = 86400 # Rotate files older than this; 0 disables time rotation
+    access_log_backup_count: int = 5 # Rotated files kept as <path>.1 .. <path>.N
+    access_log_buffer_records: int = 10000 # Records held in memory for the writer; beyond this new records are dropped and counted
+    access_log_flush_interval_seconds: float = 1.0
+
+    loop_lag_sample_interval_ms: int = 100 # How often event loop lag is sampled; 0 disables the monitor (and load shedding)
+    loop_stall_threshold_ms: int = 100 # Lag samples over this are counted and logged as stalls
+    loop_stall_capture_stacks: bool = False # Log the stack that blocked the loop (runs a watchdog thread)
+    load_shed_lag_threshold_ms: Optional[int] = 500 # Sustained lag over this sheds proxied requests with 503s; null disables
+    load_shed_exempt_hostnames: List[str] = [] # Services that are never shed
+
+    tracing_enabled: bool = False # Continue/start W3C traces (traceparent) on proxied requests and forward them upstream
+    tracing_sample_rate: float = 0.01 # Fraction of new traces whose spans are exported; a caller's sampled flag is always honoured
+    tracing_export_path: Optional[str] = "./moat-traces.jsonl" # Spans are appended here as OTLP/JSON batches, one per line
+    tracing_otlp_endpoint: Optional[str] = None # If set, batches are POSTed here instead (e.g. http://localhost:4318/v1/traces)
+    tracing_max_queued_spans: int = 20000 # Spans waiting for export beyond this are dropped and counted
+
+    @field_validator('trusted_proxies')
+    @classmethod
+    def validate_trusted_proxies(cls, value: List[str]):
+        for proxy in value:
+            ipaddress.ip_network(proxy, strict=False) # Raises ValueError; "*" is refused since it lets any client pick its address
+        return value
 
     @field_validator('moat_base_url', mode='before')
     @classmethod
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter as _FrameCounter
+from typing import Dict, List, Optional, Tuple
+
+# On-demand profiling of the running server. Nothing here runs until an admin starts a profile:
+# the CPU sampler is a thread that exists only for the profile's duration, and tracemalloc is
+# stopped again afterwards (unless something else had already started it).
+
+MAX_PROFILE_SECONDS = 120
+_profile_lock = asyncio.Lock()
+
+class ProfileInProgressError(RuntimeError):
+    pass
+
+def _frame_label(code, labels: Dict[object, str]) -> str:
+    label = labels.get(code)
+    if label is None:
+        filename = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+        label = labels[code] = f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})"
+    return label
+
+def _is_idle_frame(frame) -> bool:
+    """
+    True if the event loop thread is waiting for I/O rather than running Python code: blocked in the
+    selector (asyncio's own loop), or with nothing above asyncio.run's frame (uvloop, whose loop is C).
+    """
+    code = frame.f_code
+    filename = code.co_filename.replace("\\", "/")
+    if code.co_name in ("select", "poll") and filename.endswith("selectors.py"): return True
+    return filename.endswith("asyncio/runners.py")
+
+
+class _StackSampler(threading.Thread):
+    def __init__(self, target_thread_id: int, interval_seconds: float, include_idle: bool):
+        super().__init__(name="moat-cpu-profiler", daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval_seconds = interval_seconds
+        self.include_idle = include_idle
+        self.stacks: _FrameCounter = _FrameCounter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._labels: Dict[object, str] = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None: continue
+            self.samples += 1
+            if _is_idle_frame(frame):
+                self.idle_samples += 1
+                if not self.include_idle: continue
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code, self._labels))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+
+
+async def sample_cpu_profile(seconds: float, interval_ms: float = 5.0, include_idle: bool = False) -> Tuple[str, Dict[str, int]]:
+    """
+    Samples the event loop thread's stack every interval_ms for the given time while Moat keeps serving.
+    Returns (collapsed stacks, one "frame;frame;frame count" line per unique stack, as read by
+    flamegraph.pl and speedscope; sample counts).
+    """
+    if _profile_lock.locked(): raise ProfileInProgressError("A profile is already running.")
+    async with _profile_lock:
+        loop = asyncio.get_running_loop()
+        sampler = _StackSampler(threading.get_ident(), interval_ms / 1000, include_idle)
+        print(f"Profiler: Sampling CPU for {seconds}s every {interval_ms}ms")
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+            await loop.run_in_executor(None, sampler.join)
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in sampler.stacks.most_common())
+        counts = {"samples": sampler.samples, "idle_samples": sampler.idle_samples}
+        print(f"Profiler: CPU profile finished ({sampler.samples} samples, {sampler.idle_samples} idle)")
+        return collapsed + "\n", counts
+
+
+def _format_memory_diff(stats: List[tracemalloc.StatisticDiff], top: int, seconds: float, peak_bytes: Optional[int]) -> str:
+    growth = sum(stat.size_diff for stat in stats)
+    lines = [f"# tracemalloc diff over {seconds}s: net {growth / 1024:+.1f} KiB across {len(stats)} allocation sites"]
+    if peak_bytes is not None: lines.append(f"# peak traced memory during the window: {peak_bytes / 1024:.1f} KiB")
+    lines.append(f"# top {min(top, len(stats))} by size change")
+    for stat in stats[:top]:
+        lines.append("")
+        lines.append(f"{stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks), now {stat.size / 1024:.1f} KiB in {stat.count} blocks")
+        lines.extend(f"    {line}" for line in stat.traceback.format())
+    return "\n".join(lines) + "\n"
+
+async def memory_snapshot_diff(seconds: float, top: int = 50, frames: int = 1) -> str:
+    """Traces allocations for the given time and returns the top allocation sites by growth, as text."""
+    if _profile_lock.locked(): raise ProfileInProgressError("A profile is already running.")
+    async with _profile_lock:
+        loop = asyncio.get_running_loop()
+        started_here = not tracemalloc.is_tracing()
+        if started_here: tracemalloc.start(frames)
+        print(f"Profiler: Tracing allocations for {seconds}s ({frames} frame(s) per trace)")
+        try:
+            before = await loop.run_in_executor(None, tracemalloc.take_snapshot)
+            tracemalloc.reset_peak()
+            await asyncio.sleep(seconds)
+            after = await loop.run_in_executor(None, tracemalloc.take_snapshot)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            if started_here: tracemalloc.stop()
+
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+        key_type = "traceback" if frames > 1 else "lineno"
+        stats = await loop.run_in_executor(
+            None, lambda: after.filter_traces(ignore).compare_to(before.filter_traces(ignore), key_type))
+        print(f"Profiler: Memory diff finished ({len(stats)} allocation sites)")
+        return _format_memory_diff(stats, top, seconds, peak_bytes)
+
+def profile_filename(kind: str, extension: str) -> str:
+    return f"moat-{kind}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.{extension}"
@@ -1,12 +1,26 @@
 import aiohttp
 import asyncio 
+import time
 from fastapi import Request, Response as FastAPIResponse
 from starlette.responses import StreamingResponse
 from urllib.parse import urljoin, urlparse
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
 
 from .service_registry import registry as global_registry
 from .config import get_settings
+from .dns_cache import dns_cache
+from .access_log import access_log
+from .static_mounts import static_mounts
+from .compression import response_compressor
+from .mirroring import traffic_mirror
+from .body_budget import body_budget
+from .tracing import (
+    TraceContext, start_trace, make_span, new_span_id, span_exporter, SPAN_KIND_INTERNAL, SPAN_KIND_SERVER, SPAN_KIND_CLIENT
+)
+from .metrics import (
+    proxy_requests_total, proxy_request_duration_seconds, proxy_requests_in_flight, upstream_connect_seconds, upstream_ttfb_seconds,
+    buffered_bodies_total, status_class, UNMATCHED_SERVICE_LABEL
+)
 
 HOP_BY_HOP_HEADERS_AND_HOST = [
     'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
@@ -14,6 +28,9 @@ HOP_BY_HOP_HEADERS_AND_HOST = [
     'host'
 ]
 
+NO_REQUEST_BODY_METHODS = ("GET", "HEAD", "DELETE", "OPTIONS") # Request bodies of these methods are not forwarded
+BODY_READ_CHUNK_BYTES = 64 * 1024 # Upstream bodies are read (and reserved in the body budget) in pieces of at most this size
+
 RESPONSE_HOP_BY_HOP_HEADERS = [
     'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
     'te', 'trailers', 'transfer-encoding', 'upgrade',
@@ -21,6 +38,123 @@ RESPONSE_HOP_BY_HOP_HEADERS = [
     'content-length'    
 ]
 
+class ProxyRequestInfo:
+    """What reverse_proxy learned about one request; passed to aiohttp as trace_request_ctx."""
+    __slots__ = (
+        "service", "target_url", "username", "trace",
+        "started", "auth_started", "lookup_started", "upstream_started",
+        "auth_seconds", "lookup_seconds", "connect_started", "connect_seconds", "ttfb_seconds", "body_seconds",
+    )
+
+    def __init__(self):
+        self.service = UNMATCHED_SERVICE_LABEL
+        self.target_url = None
+        self.username = None
+        self.trace: Optional[TraceContext] = None
+        # perf_counter() timestamps of each phase's start, for trace spans
+        self.started = 0.0
+        self.auth_started = None
+        self.lookup_started = None
+        self.upstream_started = None
+        self.auth_seconds = None
+        self.lookup_seconds = None
+        self.connect_started = 0.0
+        self.connect_seconds = None
+        self.ttfb_seconds = None
+        self.body_seconds = None
+
+    def phase_timings(self, total_seconds: float) -> List[Tuple[str, float]]:
+        """(phase, seconds) pairs for the phases this request went through; 'upstream' excludes connecting."""
+        phases = []
+        if self.auth_seconds is not None: phases.append(("auth", self.auth_seconds))
+        if self.lookup_seconds is not None: phases.append(("lookup", self.lookup_seconds))
+        if self.connect_seconds is not None: phases.append(("connect", self.connect_seconds))
+        if self.ttfb_seconds is not None: phases.append(("upstream", self.ttfb_seconds - (self.connect_seconds or 0.0)))
+        if self.body_seconds is not None: phases.append(("body", self.body_seconds))
+        phases.append(("total", total_seconds))
+        return phases
+
+async def _on_connection_create_start(session, trace_config_ctx, params):
+    trace_config_ctx.trace_request_ctx.connect_started = time.perf_counter()
+
+async def _on_connection_create_end(session, trace_config_ctx, params):
+    info = trace_config_ctx.trace_request_ctx
+    info.connect_seconds = time.perf_counter() - info.connect_started
+
+_upstream_trace_config = aiohttp.TraceConfig()
+_upstream_trace_config.on_connection_create_start.append(_on_connection_create_start)
+_upstream_trace_config.on_connection_create_end.append(_on_connection_create_end)
+
+def build_backend_url(target_base_url_str: str, request: Request) -> str:
+    backend_request_path = request.url.path
+    if request.url.query:
+        backend_request_path += f"?{request.url.query}"
+    
+    base_for_join = target_base_url_str if target_base_url_str.endswith('/') else target_base_url_str + '/'
+    path_for_join = backend_request_path.lstrip('/')
+    return urljoin(base_for_join, path_for_join)
+
+def build_backend_headers(request: Request, raw_host_header: str, full_target_url_for_request: str) -> Dict[str, str]:
+    """Request headers to send upstream: hop-by-hop headers dropped, Host rewritten, X-Forwarded-* added.
+    Raises ValueError if no hostname can be taken from the target URL."""
+    backend_headers = {
+        k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS_AND_HOST
+    }
+
+    parsed_target_url = urlparse(full_target_url_for_request)
+    target_actual_hostname_for_header = parsed_target_url.hostname
+    if not target_actual_hostname_for_header:
+        raise ValueError(f"Could not extract hostname from parsed URL object: {parsed_target_url}")
+    if parsed_target_url.port and \
+       not (parsed_target_url.scheme == 'http' and parsed_target_url.port == 80) and \
+       not (parsed_target_url.scheme == 'https' and parsed_target_url.port == 443):
+        target_actual_hostname_for_header += f":{parsed_target_url.port}"
+    backend_headers["Host"] = target_actual_hostname_for_header
+
+    client_host_ip = request.client.host if request.client else "unknown"
+    backend_headers["X-Forwarded-For"] = request.headers.get("x-forwarded-for", client_host_ip)
+    x_forwarded_proto_header = request.headers.get("x-forwarded-proto")
+    effective_scheme = x_forwarded_proto_header if x_forwarded_proto_header else request.url.scheme
+    backend_headers["X-Forwarded-Proto"] = effective_scheme
+    backend_headers["X-Forwarded-Host"] = request.headers.get("x-forwarded-host", raw_host_header)
+    x_fwd_host_val = backend_headers["X-Forwarded-Host"]
+    if ':' in x_fwd_host_val:
+        original_port_str = x_fwd_host_val.split(':')[-1]
+    else:
+        original_port_str = str(request.url.port or (80 if effective_scheme == 'http' else 443))
+    backend_headers["X-Forwarded-Port"] = request.headers.get("x-forwarded-port", original_port_str)
+    backend_headers["X-Real-IP"] = request.headers.get("x-real-ip", client_host_ip)
+    return backend_headers
+
+def filter_response_headers(response_headers_from_backend: Dict[str, str]) -> Dict[str, str]:
+    return {
+        k: v for k, v in response_headers_from_backend.items() if k.lower() not in RESPONSE_HOP_BY_HOP_HEADERS
+    }
+
+async def _read_body_within_budget(backend_response: aiohttp.ClientResponse) -> Tuple[List[bytes], int, bool]:
+    """
+    Reads the upstream body while it fits the per-response ceiling and the global body budget.
+    Returns (chunks read, bytes reserved for them, whether the body is complete).
+    """
+    chunks: List[bytes] = []
+    reserved = 0
+    try:
+        while True:
+            # Reserve before reading, so every buffered byte is accounted for; the unused part is handed back.
+            size = min(BODY_READ_CHUNK_BYTES, body_budget.max_body_bytes - reserved)
+            if size <= 0 or not body_budget.try_acquire(size):
+                return chunks, reserved, False
+            reserved += size
+            chunk = await backend_response.content.read(size)
+            body_budget.release(size - len(chunk))
+            reserved -= size - len(chunk)
+            if not chunk:
+                return chunks, reserved, True
+            chunks.append(chunk)
+    except BaseException:
+        body_budget.release(reserved)
+        raise
+
 async def _stream_aiohttp_response_content( 
     backend_response: aiohttp.ClientResponse,
     request_url_for_log: str 
@@ -39,92 +173,271 @@ async def _stream_aiohttp_response_content(
         if not backend_response.closed:
             backend_response.release()
 
+
+class _UpstreamStreamingResponse(StreamingResponse):
+    """
+    Streams an upstream body that did not fit the body budget, starting with the chunks already read.
+    Owns the upstream response and its session, and closes them once sent (or once sending fails).
+    """
+    def __init__(self, backend_response: aiohttp.ClientResponse, session: aiohttp.ClientSession,
+                 buffered_chunks: List[bytes], reserved_bytes: int, **kwargs):
+        self.backend_response, self.session, self.reserved_bytes = backend_response, session, reserved_bytes
+        self.bytes_sent = 0
+        self.access_log_record: Optional[Dict[str, Any]] = None # Written once the body has been sent, with its size
+        super().__init__(self._body(buffered_chunks), **kwargs)
+
+    async def _body(self, buffered_chunks: List[bytes]) -> AsyncGenerator[bytes, None]:
+        while buffered_chunks:
+            chunk = buffered_chunks.pop(0)
+            self.bytes_sent += len(chunk)
+            yield chunk
+        body_budget.release(self.reserved_bytes)
+        self.reserved_bytes = 0
+        async for chunk in _stream_aiohttp_response_content(self.backend_response, str(self.backend_response.url)):
+            self.bytes_sent += len(chunk)
+            yield chunk
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            body_budget.release(self.reserved_bytes)
+            self.reserved_bytes = 0
+            self.backend_response.release()
+            await self.session.close()
+            if self.access_log_record is not None:
+                self.access_log_record["bytes"] = self.bytes_sent
+                access_log.log(self.access_log_record)
+
+
+class _BufferedResponse(FastAPIResponse):
+    """A buffered proxied response whose body stays reserved in the body budget until it has been sent."""
+    reserved_bytes = 0
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            body_budget.release(self.reserved_bytes)
+            self.reserved_bytes = 0
+
+
+def _request_spans(request: Request, response: FastAPIResponse, info: ProxyRequestInfo, proxy_seconds: float) -> List[Dict[str, Any]]:
+    """Moat's server span for the request, with auth/lookup/upstream (and connect) children, in OTLP/JSON form."""
+    trace = info.trace
+    now_ns, now_perf = time.time_ns(), time.perf_counter()
+    def unix_nano(perf_timestamp: float) -> int:
+        return now_ns - int((now_perf - perf_timestamp) * 1e9)
+
+    ended = info.started + proxy_seconds
+    spans = [make_span(
+        trace, trace.span_id, trace.parent_span_id, "moat.proxy", SPAN_KIND_SERVER,
+        unix_nano(info.auth_started if info.auth_started is not None else info.started), unix_nano(ended),
+        {"http.request.method": request.method, "server.address": request.headers.get("host"), "url.path": request.url.path,
+         "http.response.status_code": response.status_code, "enduser.id": info.username, "moat.service": info.service},
+        error=response.status_code >= 500,
+    )]
+    if info.auth_started is not None and info.auth_seconds is not None:
+        spans.append(make_span(trace, new_span_id(), trace.span_id, "moat.auth", SPAN_KIND_INTERNAL,
+                               unix_nano(info.auth_started), unix_nano(info.auth_started + info.auth_seconds)))
+    if info.lookup_started is not None and info.lookup_seconds is not None:
+        spans.append(make_span(trace, new_span_id(), trace.span_id, "moat.lookup", SPAN_KIND_INTERNAL,
+                               unix_nano(info.lookup_started), unix_nano(info.lookup_started + info.lookup_seconds),
+                               {"moat.upstream": info.target_url}))
+    if info.upstream_started is not None:
+        upstream_ended = ended
+        if info.ttfb_seconds is not None:
+            upstream_ended = info.upstream_started + info.ttfb_seconds + (info.body_seconds or 0.0)
+        spans.append(make_span(trace, trace.upstream_span_id, trace.span_id, "moat.upstream", SPAN_KIND_CLIENT,
+                               unix_nano(info.upstream_started), unix_nano(upstream_ended),
+                               {"http.request.method": request.method, "moat.upstream": info.target_url,
+                                "http.response.status_code": response.status_code if info.ttfb_seconds is not None else None},
+                               error=info.ttfb_seconds is None))
+        if info.connect_seconds is not None:
+            spans.append(make_span(trace, new_span_id(), trace.upstream_span_id, "moat.connect", SPAN_KIND_INTERNAL,
+                                   unix_nano(info.connect_started), unix_nano(info.connect_started + info.connect_seconds)))
+    return spans
+
+def _record_request_timings(request: Request, response: FastAPIResponse, info: ProxyRequestInfo, proxy_seconds: float):
+    proxy_requests_total.inc(info.service, status_class(response.status_code))
+    proxy_request_duration_seconds.observe(proxy_seconds, info.service)
+    if info.connect_seconds is not None:
+        upstream_connect_seconds.observe(info.connect_seconds, info.service)
+    if info.ttfb_seconds is not None:
+        upstream_ttfb_seconds.observe(info.ttfb_seconds, info.service)
+    if info.trace is not None and info.trace.sampled:
+        span_exporter.add_spans(_request_spans(request, response, info, proxy_seconds))
+
+    cfg = get_settings()
+    if not (access_log.enabled or cfg.server_timing_users or cfg.slow_request_threshold_ms is not None):
+        return
+    total_seconds = proxy_seconds + (info.auth_seconds or 0.0)
+    phases = info.phase_timings(total_seconds)
+    if access_log.enabled:
+        record = {
+            "ts": round(time.time(), 3),
+            "client": request.client.host if request.client else None,
+            "user": info.username,
+            "method": request.method,
+            "host": request.headers.get("host"),
+            "path": request.url.path,
+            "status": response.status_code,
+            "bytes": len(response.body) if hasattr(response, "body") else int(response.headers.get("content-length", 0)),
+            "upstream": info.target_url,
+            "ms": {name: round(seconds * 1000, 2) for name, seconds in phases},
+            "trace_id": info.trace.trace_id if info.trace is not None else None,
+        }
+        if isinstance(response, _UpstreamStreamingResponse):
+            response.access_log_record = record # Its size is only known once streamed
+        else:
+            access_log.log(record)
+    if info.username and info.username in cfg.server_timing_users:
+        response.headers["Server-Timing"] = ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in phases)
+    if cfg.slow_request_threshold_ms is not None and total_seconds * 1000 >= cfg.slow_request_threshold_ms:
+        phase_summary = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in phases)
+        print(f"Slow Request: {request.method} {info.service}{request.url.path} status={response.status_code} "
+              f"user={info.username} target={info.target_url} {phase_summary}")
+
 async def reverse_proxy(request: Request):
+    started = time.perf_counter()
+    info = ProxyRequestInfo()
+    info.started = started
+    info.auth_started = getattr(request.state, "moat_auth_started", None)
+    info.auth_seconds = getattr(request.state, "moat_auth_seconds", None)
+    info.username = getattr(request.state, "moat_username", None)
+    if span_exporter.enabled:
+        info.trace = start_trace(request.headers.get("traceparent"), span_exporter.sample_rate)
+    try:
+        response = await _proxy_request(request, info)
+    finally:
+        if info.service != UNMATCHED_SERVICE_LABEL:
+            proxy_requests_in_flight.dec(info.service)
+    _record_request_timings(request, response, info, time.perf_counter() - started)
+    return response
+
+async def _proxy_request(request: Request, info: ProxyRequestInfo):
     raw_host_header = request.headers.get("host")
     if not raw_host_header:
         return FastAPIResponse("Host header missing", status_code=400)
 
     lookup_hostname = raw_host_header.split(":")[0]
 
+    info.lookup_started = time.perf_counter()
+    mount = static_mounts.match(lookup_hostname, request.url.path)
+    if mount is not None:
+        info.lookup_seconds = time.perf_counter() - info.lookup_started
+        info.service = lookup_hostname
+        proxy_requests_in_flight.inc(info.service)
+        info.target_url = f"file://{mount.root}"
+        return await static_mounts.serve(request, mount)
     target_base_url_str = await global_registry.get_target_url(lookup_hostname)
+    info.lookup_seconds = time.perf_counter() - info.lookup_started
     if not target_base_url_str:
         print(f"Proxy Error: No target for '{lookup_hostname}'. Registry: {await global_registry.get_all_services()}")
         return FastAPIResponse(f"Service not found for hostname: {lookup_hostname}", status_code=404)
+    info.service = lookup_hostname
+    proxy_requests_in_flight.inc(info.service)
+    info.target_url = target_base_url_str
 
-    backend_headers = {
-        k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS_AND_HOST
-    }
-
-    backend_request_path = request.url.path
-    if request.url.query:
-        backend_request_path += f"?{request.url.query}"
-    
-    base_for_join = target_base_url_str if target_base_url_str.endswith('/') else target_base_url_str + '/'
-    path_for_join = backend_request_path.lstrip('/')
-    full_target_url_for_request = urljoin(base_for_join, path_for_join)
-
+    full_target_url_for_request = build_backend_url(target_base_url_str, request)
     try:
-        parsed_target_url = urlparse(full_target_url_for_request)
-        target_actual_hostname_for_header = parsed_target_url.hostname
-        if parsed_target_url.port and \
-           not (parsed_target_url.scheme == 'http' and parsed_target_url.port == 80) and \
-           not (parsed_target_url.scheme == 'https' and parsed_target_url.port == 443):
-            target_actual_hostname_for_header += f":{parsed_target_url.port}"
-        
-        if not target_actual_hostname_for_header:
-            raise ValueError(f"Could not extract hostname from parsed URL object: {parsed_target_url}")
-        backend_headers["Host"] = target_actual_hostname_for_header
+        backend_headers = build_backend_headers(request, raw_host_header, full_target_url_for_request)
     except Exception as e:
         print(f"Proxy Error: Could not parse target hostname from '{full_target_url_for_request}': {e!r}")
         return FastAPIResponse("Invalid backend target URL configuration.", status_code=502)
-
-    client_host_ip = request.client.host if request.client else "unknown"
-    backend_headers["X-Forwarded-For"] = request.headers.get("x-forwarded-for", client_host_ip)
-    x_forwarded_proto_header = request.headers.get("x-forwarded-proto")
-    effective_scheme = x_forwarded_proto_header if x_forwarded_proto_header else request.url.scheme
-    backend_headers["X-Forwarded-Proto"] = effective_scheme
-    backend_headers["X-Forwarded-Host"] = request.headers.get("x-forwarded-host", raw_host_header)
-    x_fwd_host_val = backend_headers["X-Forwarded-Host"]
-    if ':' in x_fwd_host_val:
-        original_port_str = x_fwd_host_val.split(':')[-1]
-    else:
-        original_port_str = str(request.url.port or (80 if effective_scheme == 'http' else 443))
-    backend_headers["X-Forwarded-Port"] = request.headers.get("x-forwarded-port", original_port_str)
-    backend_headers["X-Real-IP"] = request.headers.get("x-real-ip", client_host_ip)
+    if info.trace is not None:
+        backend_headers["traceparent"] = info.trace.upstream_traceparent()
 
     timeout = aiohttp.ClientTimeout(total=None, connect=10, sock_connect=10, sock_read=300)
 
-    async with aiohttp.ClientSession(timeout=timeout) as session:
+    data_to_send = None
+    buffer_request_body = False
+    request_body_reserved = 0
+    if request.method not in NO_REQUEST_BODY_METHODS:
+        if not body_budget.enabled:
+            buffer_request_body = True
+        else:
+            content_length = request.headers.get("content-length", "")
+            if not content_length.isdigit() or int(content_length) > body_budget.max_body_bytes:
+                data_to_send = request.stream() # Unknown or large size: passed through without buffering
+                buffered_bodies_total.inc("request", "streamed")
+            elif await body_budget.acquire(int(content_length)):
+                request_body_reserved = int(content_length)
+                buffer_request_body = True
+                buffered_bodies_total.inc("request", "buffered")
+            else:
+                buffered_bodies_total.inc("request", "refused")
+                return FastAPIResponse("Moat is buffering too many request bodies; retry shortly.", status_code=503, headers={"Retry-After": "1"})
+
+    session = aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(resolver=dns_cache), trace_configs=[_upstream_trace_config])
+    streaming = False # Once an _UpstreamStreamingResponse is returned, it owns the session and upstream response
+    try:
         try:
-            request_body_bytes = await request.body()
-            data_to_send = request_body_bytes if request.method not in ["GET", "HEAD", "DELETE", "OPTIONS"] else None
-            async with session.request(
+            if buffer_request_body:
+                data_to_send = await request.body()
+            info.upstream_started = time.perf_counter()
+            backend_aiohttp_response = await session.request(
                 request.method,
                 full_target_url_for_request,
                 headers=backend_headers,
                 data=data_to_send,
-                allow_redirects=False 
-            ) as backend_aiohttp_response:
+                allow_redirects=False,
+                trace_request_ctx=info
+            )
+            try:
+                info.ttfb_seconds = time.perf_counter() - info.upstream_started
+                if traffic_mirror.enabled and not isinstance(data_to_send, AsyncIterator) and traffic_mirror.wants(info.service, request.method):
+                    path_and_query = f"{request.url.path}?{request.url.query}" if request.url.query else request.url.path
+                    traffic_mirror.submit(info.service, request.method, path_and_query, backend_headers, data_to_send,
+                                          backend_aiohttp_response.status, info.ttfb_seconds)
                 response_headers_from_backend = dict(backend_aiohttp_response.headers)
-                client_response_headers = {
-                    k: v for k, v in response_headers_from_backend.items() if k.lower() not in RESPONSE_HOP_BY_HOP_HEADERS
-                }
+                client_response_headers = filter_response_headers(response_headers_from_backend)
                 
                 if backend_aiohttp_response.status in [204, 304]:
                     return FastAPIResponse(status_code=backend_aiohttp_response.status, headers=client_response_headers)
                 try:
-                    full_body = await backend_aiohttp_response.read()
-                    return FastAPIResponse(
-                        content=full_body,
-                        status_code=backend_aiohttp_response.status,
-                        headers=client_response_headers, 
-                        media_type=response_headers_from_backend.get("Content-Type")
-                    )
+                    body_started = time.perf_counter()
+                    if not body_budget.enabled:
+                        full_body = await backend_aiohttp_response.read()
+                        response_body_reserved = 0
+                    else:
+                        chunks, response_body_reserved, complete = await _read_body_within_budget(backend_aiohttp_response)
+                        if not complete:
+                            buffered_bodies_total.inc("response", "streamed")
+                            streaming = True
+                            return _UpstreamStreamingResponse(
+                                backend_aiohttp_response, session, chunks, response_body_reserved,
+                                status_code=backend_aiohttp_response.status,
+                                headers=client_response_headers,
+                                media_type=response_headers_from_backend.get("Content-Type")
+                            )
+                        buffered_bodies_total.inc("response", "buffered")
+                        full_body = b"".join(chunks)
+                    info.body_seconds = time.perf_counter() - body_started
+                    try:
+                        if response_compressor.enabled:
+                            full_body = await response_compressor.compress_body(
+                                info.service, request.headers.get("accept-encoding", ""), backend_aiohttp_response.status,
+                                client_response_headers, full_body)
+                        response = _BufferedResponse(
+                            content=full_body,
+                            status_code=backend_aiohttp_response.status,
+                            headers=client_response_headers, 
+                            media_type=response_headers_from_backend.get("Content-Type")
+                        )
+                    except BaseException:
+                        body_budget.release(response_body_reserved)
+                        raise
+                    response.reserved_bytes = response_body_reserved
+                    return response
                 except aiohttp.ClientError as e_read: 
                     print(f"ERROR AIOHTTP Proxy: ClientError during backend_aiohttp_response.read() for {backend_aiohttp_response.url}: {e_read!r}")
                     if not backend_aiohttp_response.closed:
                         backend_aiohttp_response.release()
                     return FastAPIResponse("Error reading from upstream service.", status_code=502)
+            finally:
+                if not streaming:
+                    backend_aiohttp_response.release()
 
         except aiohttp.ClientConnectorError as e:
             print(f"Proxy Error (AIOHTTP ClientConnectorError) to '{full_target_url_for_request}': {e!r}")
@@ -144,3 +457,7 @@ async def reverse_proxy(request: Request):
         except Exception as e:
             print(f"Proxy Error (Unexpected) while proxying with AIOHTTP to '{full_target_url_for_request}': {type(e).__name__} - {e!r}")
             return FastAPIResponse(f"General proxy error for {lookup_hostname}", status_code=500)
+    finally:
+        body_budget.release(request_body_reserved)
+        if not streaming:
+            await session.close()
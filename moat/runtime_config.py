@@ -1,12 +1,35 @@
 import asyncio
-from typing import Optional
+import ipaddress
+from typing import Optional, Set
+from urllib.parse import urlparse
 
-from .config import MoatSettings
+from .config import MoatSettings, get_settings, get_derived_settings, update_static_services
+from .config_dir import config_directory
 from .service_registry import registry as global_registry
 from .docker_monitor import watch_docker_events, stop_docker_monitor_task, is_docker_monitor_running
+from .dns_cache import dns_cache
+from .access_log import access_log
+from .loop_monitor import loop_monitor
+from .tracing import span_exporter
+from .static_mounts import static_mounts
+from .compression import response_compressor
+from .auth_bypass import auth_bypass
+from .access_policy import access_policies
+from .mirroring import traffic_mirror
+from .body_budget import body_budget
 
 _runtime_docker_monitor_task: Optional[asyncio.Task] = None
 
+def static_target_hostnames(settings: MoatSettings) -> set:
+    """Hostnames (not IP literals) used by static target_urls; these are kept warm in the DNS cache."""
+    hostnames = set()
+    for service_conf in settings.static_services or []:
+        target_host = urlparse(str(service_conf.target_url)).hostname
+        if not target_host: continue
+        try: ipaddress.ip_address(target_host)
+        except ValueError: hostnames.add(target_host)
+    return hostnames
+
 async def apply_settings_changes_to_runtime(
     old_settings: Optional[MoatSettings],
     new_settings: MoatSettings,
@@ -15,6 +38,8 @@ async def apply_settings_changes_to_runtime(
     """Applies changes between old and new settings to the running application's state."""
     global _runtime_docker_monitor_task
     print("RuntimeConfig: Applying settings changes...")
+    # Policies before routes, so a newly added static route is never reachable without its policy.
+    access_policies.configure(get_derived_settings().access_policies) # Derived settings are swapped in with new_settings
 
     current_services_in_registry = await global_registry.get_all_services()
     
@@ -44,6 +69,40 @@ async def apply_settings_changes_to_runtime(
                 source_type="static"
             )
 
+    auth_bypass.configure(new_settings.auth_bypass_rules)
+    static_mounts.configure(new_settings.static_mounts)
+    response_compressor.configure(
+        new_settings.compression_enabled, new_settings.compression_min_bytes, new_settings.compression_content_types,
+        new_settings.compression_offload_bytes, new_settings.compression_cache_bytes, new_settings.compression_service_rules
+    )
+    traffic_mirror.configure(
+        new_settings.traffic_mirrors, new_settings.mirror_max_queued_requests, new_settings.mirror_concurrency, new_settings.mirror_timeout_seconds
+    )
+    traffic_mirror.start()
+    body_budget.configure(new_settings.body_budget_bytes, new_settings.body_buffer_max_bytes, new_settings.body_budget_wait_seconds)
+
+    dns_cache.ttl_seconds = new_settings.dns_cache_ttl_seconds
+    dns_cache.set_watched_hostnames(static_target_hostnames(new_settings))
+    dns_cache.start()
+
+    access_log.configure(
+        new_settings.access_log_path, new_settings.access_log_max_bytes, new_settings.access_log_rotate_seconds,
+        new_settings.access_log_backup_count, new_settings.access_log_buffer_records, new_settings.access_log_flush_interval_seconds
+    )
+    access_log.start()
+
+    loop_monitor.configure(
+        new_settings.loop_lag_sample_interval_ms, new_settings.loop_stall_threshold_ms, new_settings.loop_stall_capture_stacks,
+        new_settings.load_shed_lag_threshold_ms, new_settings.load_shed_exempt_hostnames
+    )
+    loop_monitor.start()
+
+    span_exporter.configure(
+        new_settings.tracing_enabled, new_settings.tracing_sample_rate, new_settings.tracing_export_path,
+        new_settings.tracing_otlp_endpoint, new_settings.tracing_max_queued_spans
+    )
+    span_exporter.start()
+
     docker_settings_changed = False
     if old_settings:
         if (old_settings.docker_monitor_enabled != new_settings.docker_monitor_enabled or
@@ -75,6 +134,25 @@ async def apply_settings_changes_to_runtime(
     
     print("RuntimeConfig: Settings changes applied.")
 
+async def apply_config_dir_changes(names: Set[str]):
+    """
+    Applies edits to the named config_dir files: only those files are re-parsed (off the event loop), and only
+    the hostnames whose definition changed are pushed to the registry, as one generation.
+    """
+    reserved = {s.hostname for s in get_settings().static_services if s.hostname not in config_directory.owners}
+    upserts, removals = await config_directory.reload(names, reserved)
+    if not upserts and not removals:
+        return
+    new_settings = update_static_services(upserts, removals)
+    # The files' services always leave static_services; registry entries only if still static (not since taken over by Docker).
+    current_services = await global_registry.get_all_services()
+    registry_removals = {hostname for hostname in removals if current_services.get(hostname, (None, None, None))[1] == "static"}
+    await global_registry.apply_changes(
+        {hostname: (str(service.target_url).rstrip('/'), "static", None) for hostname, service in upserts.items()}, registry_removals
+    )
+    dns_cache.set_watched_hostnames(static_target_hostnames(new_settings))
+    print(f"RuntimeConfig: Config dir change applied: {len(upserts)} service(s) added/updated, {len(removals)} removed.")
+
 async def get_runtime_docker_monitor_task() -> Optional[asyncio.Task]:
     """Returns the current docker monitor task instance managed by this module."""
     global _runtime_docker_monitor_task
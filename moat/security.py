@@ -1,5 +1,8 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -8,12 +11,36 @@ from .config import get_settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Modular crypt format of a bcrypt hash: $2b$<cost>$<22 char salt><31 char digest>
+_BCRYPT_HASH_RE = re.compile(r"^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$")
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+def is_bcrypt_hash(value: str) -> bool:
+    return bool(_BCRYPT_HASH_RE.match(value))
+
+def _hash_password_or_error(password: str) -> Tuple[Optional[str], Optional[str]]:
+    try:
+        return get_password_hash(password), None
+    except (ValueError, TypeError) as e:
+        return None, str(e)
+
+def hash_passwords_in_parallel(passwords: List[str], workers: Optional[int] = None) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Hashes many passwords with bcrypt in a process pool (bcrypt is CPU-bound, so threads would share one GIL).
+    Returns (hash, None) or (None, error) per password, in order.
+    """
+    if not passwords: return []
+    workers = min(workers or os.cpu_count() or 1, len(passwords))
+    if workers == 1:
+        return [_hash_password_or_error(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_hash_password_or_error, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     cfg = get_settings()
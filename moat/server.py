@@ -1,21 +1,33 @@
 from fastapi import FastAPI, Request, Depends
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, PlainTextResponse
 import asyncio
+import functools
+import hmac
 from watchdog.observers import Observer # type: ignore
 from watchdog.events import FileSystemEventHandler # type: ignore
 from pathlib import Path
-from typing import Optional
-from urllib.parse import urlparse, quote_plus, urljoin 
+from typing import Optional, Set
+from urllib.parse import quote_plus
 
 from .auth import router as auth_router
 from .proxy import reverse_proxy
-from .dependencies import get_current_user_or_redirect, User, get_current_user_from_cookie # Added get_current_user_from_cookie
+from .dependencies import get_current_user_or_redirect, get_current_admin_or_redirect, get_current_user_or_bypass, User, get_current_user_from_cookie # Added get_current_user_from_cookie
 from .database import init_db
+from .dns_cache import dns_cache
+from .access_log import access_log
+from .loop_monitor import loop_monitor, reject_when_overloaded
+from .tracing import span_exporter
+from .compression import response_compressor
+from .mirroring import traffic_mirror
+from .service_registry import registry as global_registry
+from .metrics import metrics_registry
 from .docker_monitor import stop_docker_monitor_task, is_docker_monitor_running # For health check & shutdown
-from .config import get_settings, load_config, CONFIG_FILE_PATH, MoatSettings
+from .config import get_settings, get_derived_settings, load_config, config_file_changed_since_load, config_dir_path, CONFIG_FILE_PATH, MoatSettings
+from .config_dir import CONFIG_DIR_SUFFIXES
 from .admin_ui import router as admin_ui_router
-from .runtime_config import apply_settings_changes_to_runtime, get_runtime_docker_monitor_task, set_runtime_docker_monitor_task
+from .admin_api import router as admin_api_router, flush_pending_route_changes
+from .runtime_config import apply_settings_changes_to_runtime, apply_config_dir_changes, get_runtime_docker_monitor_task, set_runtime_docker_monitor_task
 
 app = FastAPI(title="Moat Security Gateway")
 
@@ -25,9 +37,13 @@ app.mount("/moat/static", StaticFiles(directory="moat/static"), name="static")
 # Include authentication routes
 app.include_router(auth_router)
 app.include_router(admin_ui_router)
+app.include_router(admin_api_router)
 
 # --- Config Hot Reloading Logic ---
 _config_observer_instance: Optional[Observer] = None # Store observer instance per app lifecycle
+_registry_snapshot_task: Optional[asyncio.Task] = None
+_config_dir_watch = None # (path, watchdog ObservedWatch) of the watched config_dir
+CONFIG_DIR_EVENT_TYPES = {"created", "modified", "deleted", "moved", "closed"}
 
 class ConfigFileChangeHandler(FileSystemEventHandler):
     def __init__(self, loop: asyncio.AbstractEventLoop):
@@ -49,12 +65,17 @@ class ConfigFileChangeHandler(FileSystemEventHandler):
 
     async def handle_config_reload(self):
         await asyncio.sleep(0.5) 
+        if not config_file_changed_since_load():
+            print("Config Watcher: File matches what Moat last loaded or wrote; nothing to reload.")
+            return
         try:
             old_settings = get_settings() 
-            new_settings = load_config(force_reload=True) 
+            # Parsing (config.yml and any changed config_dir files) is blocking; keep it off the event loop.
+            new_settings = await self.loop.run_in_executor(None, functools.partial(load_config, force_reload=True))
 
             print("Config Watcher: Reloading and applying configuration...")
             await apply_settings_changes_to_runtime(old_settings, new_settings, loop=self.loop)
+            _watch_config_dir(self.loop)
             print("Config Watcher: Configuration reloaded and applied.")
         except FileNotFoundError:
             print("Config Watcher: config.yml deleted? Cannot reload.")
@@ -62,9 +83,63 @@ class ConfigFileChangeHandler(FileSystemEventHandler):
             print(f"Config Watcher: Error during config reload: {e}")
 
 
+class ConfigDirChangeHandler(FileSystemEventHandler):
+    """Collects the names of changed config_dir files and applies them in one batch once edits settle."""
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.debounce_period = 0.3
+        self._pending_names: Set[str] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._apply_lock = asyncio.Lock() # Batches are applied in the order their files changed
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in CONFIG_DIR_EVENT_TYPES:
+            return
+        names = {Path(path).name for path in (event.src_path, getattr(event, "dest_path", "")) if path}
+        names = {name for name in names if name.endswith(CONFIG_DIR_SUFFIXES) and not name.startswith(".")}
+        if names:
+            self.loop.call_soon_threadsafe(self._queue_names, names)
+
+    def _queue_names(self, names: Set[str]):
+        self._pending_names |= names
+        if self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.debounce_period, self._flush)
+
+    def _flush(self):
+        names, self._pending_names, self._flush_handle = self._pending_names, set(), None
+        print(f"Config Watcher: Detected changes to {', '.join(sorted(names))} in the config dir")
+        self.loop.create_task(self._apply(names))
+
+    async def _apply(self, names: Set[str]):
+        async with self._apply_lock:
+            try:
+                await apply_config_dir_changes(names)
+            except Exception as e:
+                print(f"Config Watcher: Error applying config dir changes: {e}")
+
+
+def _watch_config_dir(loop: asyncio.AbstractEventLoop):
+    """(Re)schedules the config_dir watch on the config observer when config_dir changes."""
+    global _config_dir_watch
+    if _config_observer_instance is None: return
+    path = config_dir_path(get_settings())
+    watched_path = _config_dir_watch[0] if _config_dir_watch else None
+    if path == watched_path: return
+    if _config_dir_watch:
+        _config_observer_instance.unschedule(_config_dir_watch[1])
+        _config_dir_watch = None
+        print(f"Config Watcher: Stopped monitoring {watched_path}")
+    if path is None: return
+    if not path.is_dir():
+        print(f"Config Watcher: Config dir {path} does not exist; it is not monitored until config.yml is reloaded.")
+        return
+    _config_dir_watch = (path, _config_observer_instance.schedule(ConfigDirChangeHandler(loop), path=str(path.resolve()), recursive=False))
+    print(f"Config Watcher: Started monitoring config dir {path} for changes.")
+
+
 @app.on_event("startup")
 async def startup_event():
-    global _config_observer_instance
+    global _config_observer_instance, _registry_snapshot_task
     print("Moat starting up...")
     loop = asyncio.get_event_loop() 
 
@@ -72,6 +147,14 @@ async def startup_event():
     print("Database initialized.")
 
     cfg = get_settings() 
+    if cfg.registry_snapshot_path:
+        # Serve last known Docker routes immediately; the monitor's initial scan reconciles them.
+        if cfg.docker_monitor_enabled:
+            await global_registry.load_snapshot(Path(cfg.registry_snapshot_path))
+        _registry_snapshot_task = loop.create_task(
+            global_registry.run_snapshot_loop(Path(cfg.registry_snapshot_path), cfg.registry_snapshot_interval_seconds),
+            name="RegistrySnapshotWriter"
+        )
     await apply_settings_changes_to_runtime(None, cfg, loop=loop)
 
     if _config_observer_instance is None or not _config_observer_instance.is_alive():
@@ -82,6 +165,7 @@ async def startup_event():
         try:
             _config_observer_instance.start()
             print(f"Config Watcher: Started monitoring {CONFIG_FILE_PATH} in {config_file_parent_dir} for changes.")
+            _watch_config_dir(loop)
         except Exception as e:
             print(f"Config Watcher: Failed to start observer: {e}. Hot-reloading of config.yml might not work.")
             if _config_observer_instance and _config_observer_instance.is_alive():
@@ -95,7 +179,7 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    global _config_observer_instance
+    global _config_observer_instance, _registry_snapshot_task, _config_dir_watch
     print("Moat shutting down...")
 
     if _config_observer_instance and _config_observer_instance.is_alive():
@@ -104,6 +188,7 @@ async def shutdown_event():
         _config_observer_instance.join(timeout=2.0)
         print("Config Watcher: Observer stopped." if not _config_observer_instance.is_alive() else "Config Watcher: Observer thread did not terminate in time.")
     _config_observer_instance = None
+    _config_dir_watch = None
 
     docker_monitor_task_ref = await get_runtime_docker_monitor_task()
     if docker_monitor_task_ref and not docker_monitor_task_ref.done():
@@ -117,33 +202,34 @@ async def shutdown_event():
             print(f"Server Shutdown: Error stopping Docker monitor task: {e}")
     await set_runtime_docker_monitor_task(None) 
 
+    await dns_cache.stop()
+    await access_log.stop()
+    await loop_monitor.stop()
+    await span_exporter.stop()
+    await response_compressor.stop()
+    await traffic_mirror.stop()
+    await flush_pending_route_changes()
+
+    if _registry_snapshot_task and not _registry_snapshot_task.done():
+        _registry_snapshot_task.cancel()
+        try: await _registry_snapshot_task
+        except asyncio.CancelledError: pass
+        cfg = get_settings()
+        if cfg.registry_snapshot_path:
+            try: await global_registry.write_snapshot(Path(cfg.registry_snapshot_path))
+            except OSError as e: print(f"Server Shutdown: Error writing registry snapshot: {e}")
+    _registry_snapshot_task = None
+
     print("Moat shutdown complete.")
 
 
 @app.get("/")
 async def handle_moat_root(request: Request):
-    cfg = get_settings()
-    moat_admin_config_path_segment = "/moat/admin/config" 
-
-    full_admin_config_url = ""
-    moat_base_str_for_join = ""
-
-    if cfg.moat_base_url:
-        moat_base_str_for_join = str(cfg.moat_base_url).rstrip('/') + '/'
-        full_admin_config_url = urljoin(moat_base_str_for_join, moat_admin_config_path_segment.lstrip('/'))
-    else:
-        # Fallback if moat_base_url is not set (should not happen in a proper setup)
-        print("WARNING: moat_base_url not set. Root redirect logic might be unreliable if Moat is proxied complexly.")
-        full_admin_config_url = request.url_for("view_config_form") # 'view_config_form' is the name of the admin route function.
-                                                                   # This assumes admin_ui router is named. Let's use the path.
-        full_admin_config_url = str(request.base_url).rstrip('/') + moat_admin_config_path_segment
-
+    derived = get_derived_settings()
+    full_admin_config_url = derived.admin_config_url
 
     request_host = request.headers.get("host", "").split(":")[0]
-    moat_configured_host = ""
-    if cfg.moat_base_url:
-        parsed_moat_base = urlparse(str(cfg.moat_base_url))
-        moat_configured_host = parsed_moat_base.hostname
+    moat_configured_host = derived.moat_hostname
 
     print(f"DEBUG: Root path access. Request host: '{request_host}', Moat configured host: '{moat_configured_host}'")
 
@@ -155,28 +241,33 @@ async def handle_moat_root(request: Request):
             print(f"DEBUG: User '{current_user.username}' authenticated. Redirecting to admin config: {full_admin_config_url}")
             return RedirectResponse(url=full_admin_config_url)
         else:
-            login_path_segment = "moat/auth/login"
-            # Use moat_base_str_for_join if available, otherwise construct from request
-            base_login_url_base = moat_base_str_for_join if moat_base_str_for_join else str(request.base_url).rstrip('/') + '/'
-            base_login_url = urljoin(base_login_url_base, login_path_segment.lstrip('/'))
-            
-            login_redirect_target = full_admin_config_url
-            
-            final_login_url = f"{base_login_url}?redirect_uri={quote_plus(login_redirect_target)}"
+            final_login_url = f"{derived.login_url}?redirect_uri={quote_plus(full_admin_config_url)}"
             print(f"DEBUG: User not authenticated. Redirecting to login for admin access: {final_login_url}")
             return RedirectResponse(url=final_login_url)
     else:
-        # Host doesn't match Moat's configured hostname, or moat_base_url is not set up correctly.
-        # This means it's a root request for a proxied app OR moat_base_url is missing/misconfigured.
-        print(f"DEBUG: Root path request for a different host ('{request_host}') or moat_base_url check failed. Passing to proxy.")
-        user_for_proxy = await get_current_user_or_redirect(request) 
+        # Host doesn't match Moat's configured hostname.
+        # This means it's a root request for a proxied app.
+        print(f"DEBUG: Root path request for a different host ('{request_host}'). Passing to proxy.")
+        await reject_when_overloaded(request)
+        user_for_proxy = await get_current_user_or_bypass(request)
         return await reverse_proxy(request)
 
 
+@app.get("/moat/metrics", tags=["system"])
+async def metrics_endpoint(request: Request):
+    """Prometheus text exposition. Needs an admin's login cookie or the configured metrics_bearer_token."""
+    cfg = get_settings()
+    authorization_header = request.headers.get("authorization", "")
+    if not (cfg.metrics_bearer_token and hmac.compare_digest(authorization_header, f"Bearer {cfg.metrics_bearer_token}")):
+        await get_current_admin_or_redirect(request) # Per-service traffic, like the dashboard
+    return PlainTextResponse(metrics_registry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
 async def catch_all_proxy_route(
     request: Request,
-    user_dependency: User = Depends(get_current_user_or_redirect) 
+    overload_check: None = Depends(reject_when_overloaded),
+    user_dependency: Optional[User] = Depends(get_current_user_or_bypass)
 ):
     return await reverse_proxy(request) 
 
@@ -1,5 +1,13 @@
 import asyncio
-from typing import Dict, Optional, Tuple
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from .metrics import metrics_registry, Gauge
+from .access_policy import access_policies
+
+SNAPSHOT_FORMAT_VERSION = 1
 
 class ServiceRegistry:
     def __init__(self):
@@ -8,16 +16,20 @@ class ServiceRegistry:
         # optional_id can be container_id for docker services
         self._services: Dict[str, Tuple[str, str, Optional[str]]] = {}
         self._lock = asyncio.Lock()
+        # Incremented on every change; lets the snapshot writer skip unchanged registries.
+        self.generation = 0
 
     async def add_service(self, hostname: str, target_url: str, source_type: str = "static", container_id: Optional[str] = None):
         async with self._lock:
             self._services[hostname] = (target_url, source_type, container_id)
+            self.generation += 1
             print(f"Service Registry: Added/Updated {hostname} -> {target_url} (source: {source_type})")
 
     async def remove_service(self, hostname: str):
         async with self._lock:
             if hostname in self._services:
                 del self._services[hostname]
+                self.generation += 1
                 print(f"Service Registry: Removed {hostname}")
 
     async def remove_services_by_container_id(self, container_id: str):
@@ -25,8 +37,36 @@ class ServiceRegistry:
             to_remove = [hostname for hostname, (_, source, cid) in self._services.items() if source == "docker" and cid == container_id]
             for hostname in to_remove:
                 del self._services[hostname]
+                self.generation += 1
                 print(f"Service Registry: Removed {hostname} (container_id: {container_id})")
 
+    async def retain_docker_containers(self, container_ids: Iterable[str]):
+        """Removes docker services whose container is not in container_ids (e.g. stale snapshot entries)."""
+        keep = set(container_ids)
+        async with self._lock:
+            to_remove = [(hostname, cid) for hostname, (_, source, cid) in self._services.items() if source == "docker" and cid not in keep]
+            for hostname, cid in to_remove:
+                del self._services[hostname]
+                self.generation += 1
+                print(f"Service Registry: Removed stale {hostname} (container no longer running)")
+                if cid: access_policies.remove_container(cid) # Drop the label policy restored with the snapshot
+
+    async def apply_changes(self, upserts: Dict[str, Tuple[str, str, Optional[str]]], removals: Iterable[str]) -> Tuple[int, int]:
+        """Adds/updates and removes many hostnames under one lock acquisition, as one generation. Returns (upserted, removed)."""
+        async with self._lock:
+            removed = 0
+            for hostname in removals:
+                if self._services.pop(hostname, None) is not None: removed += 1
+            upserted = 0
+            for hostname, info in upserts.items():
+                if self._services.get(hostname) != info:
+                    self._services[hostname] = info
+                    upserted += 1
+            if upserted or removed:
+                self.generation += 1
+                print(f"Service Registry: Applied batch: {upserted} added/updated, {removed} removed")
+            return upserted, removed
+
     async def get_target_url(self, hostname: str) -> Optional[str]:
         async with self._lock:
             service_info = self._services.get(hostname)
@@ -36,5 +76,71 @@ class ServiceRegistry:
         async with self._lock:
             return self._services.copy()
 
+    async def write_snapshot(self, path: Path):
+        """Writes the registry to path as compact JSON (atomically, via a temp file)."""
+        async with self._lock:
+            snapshot = {
+                "version": SNAPSHOT_FORMAT_VERSION,
+                "generation": self.generation,
+                "saved_at": time.time(),
+                "services": {hostname: list(info) for hostname, info in self._services.items()},
+                "access_policies": access_policies.docker_policies(),
+            }
+        data = json.dumps(snapshot, separators=(",", ":"))
+
+        def _write():
+            temp_path = path.with_suffix(path.suffix + ".tmp")
+            temp_path.write_text(data)
+            temp_path.replace(path)
+
+        await asyncio.get_running_loop().run_in_executor(None, _write)
+
+    async def load_snapshot(self, path: Path, source_types: Iterable[str] = ("docker",)) -> int:
+        """Loads entries of the given source types from a snapshot file. Returns how many were loaded."""
+        def _read() -> Optional[dict]:
+            if not path.exists(): return None
+            return json.loads(path.read_text())
+
+        try:
+            snapshot = await asyncio.get_running_loop().run_in_executor(None, _read)
+        except (OSError, ValueError) as e:
+            print(f"Service Registry: Could not read snapshot {path}: {e}")
+            return 0
+        if not snapshot or snapshot.get("version") != SNAPSHOT_FORMAT_VERSION:
+            return 0
+
+        wanted_sources = set(source_types)
+        loaded = 0
+        loaded_container_ids = {}
+        async with self._lock:
+            for hostname, info in (snapshot.get("services") or {}).items():
+                try: target_url, source_type, container_id = info
+                except (TypeError, ValueError): continue
+                if source_type not in wanted_sources or hostname in self._services: continue
+                self._services[hostname] = (target_url, source_type, container_id)
+                if container_id: loaded_container_ids[hostname] = container_id
+                loaded += 1
+            if loaded: self.generation += 1
+        if snapshot.get("access_policies"):
+            access_policies.restore_docker_policies(snapshot["access_policies"], loaded_container_ids)
+        print(f"Service Registry: Loaded {loaded} service(s) from snapshot {path}")
+        return loaded
+
+    async def run_snapshot_loop(self, path: Path, interval_seconds: float):
+        """Periodically writes a snapshot while the registry keeps changing."""
+        last_written_generation = None
+        while True:
+            await asyncio.sleep(interval_seconds)
+            if self.generation == last_written_generation: continue
+            try:
+                generation = self.generation
+                await self.write_snapshot(path)
+                last_written_generation = generation
+            except OSError as e:
+                print(f"Service Registry: Error writing snapshot {path}: {e}")
+
 # Global instance
-registry = ServiceRegistry()
\ No newline at end of file
+registry = ServiceRegistry()
+
+metrics_registry.register(Gauge("moat_registry_services", "Services currently in the routing table.", value_callback=lambda: len(registry._services)))
+metrics_registry.register(Gauge("moat_registry_generation", "Routing table change counter.", value_callback=lambda: registry.generation))
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import stat
+from email.utils import parsedate_to_datetime
+from mimetypes import guess_type
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request, Response as FastAPIResponse
+from starlette.responses import FileResponse
+
+from .models import StaticMountConfig
+
+# Precompressed siblings tried in order of preference: (Accept-Encoding token, file suffix)
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+class _Mount:
+    __slots__ = ("path_prefix", "root", "index_file", "spa_fallback", "cache_control")
+
+    def __init__(self, config: StaticMountConfig):
+        self.path_prefix = "/" + config.path_prefix.strip("/")
+        self.root = os.path.realpath(config.directory)
+        self.index_file = config.index_file
+        self.spa_fallback = config.spa_fallback
+        self.cache_control = config.cache_control
+
+    def matches(self, path: str) -> bool:
+        return self.path_prefix == "/" or path == self.path_prefix or path.startswith(self.path_prefix + "/")
+
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"): continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+def _stat_file(path: str) -> Optional[os.stat_result]:
+    try:
+        result = os.stat(path)
+    except OSError: # Missing, not permitted, or not a valid name here (e.g. ENAMETOOLONG)
+        return None
+    return result if stat.S_ISREG(result.st_mode) else None
+
+def _resolve_file(mount: _Mount, relative_path: str, encodings: set) -> Optional[Tuple[str, os.stat_result, str, Optional[str]]]:
+    """
+    Blocking (runs in the executor). Maps a request path to (file to send, its stat, path whose type
+    gives the media type, content encoding), or None if there is nothing to serve.
+    """
+    if "\x00" in relative_path: return None # realpath() and stat() raise ValueError on it
+    candidate = os.path.realpath(os.path.join(mount.root, relative_path.lstrip("/")))
+    if candidate != mount.root and not candidate.startswith(mount.root + os.sep):
+        return None
+    if os.path.isdir(candidate):
+        candidate = os.path.join(candidate, mount.index_file)
+    file_stat = _stat_file(candidate)
+    if file_stat is None and mount.spa_fallback and not os.path.splitext(relative_path)[1]:
+        candidate = os.path.join(mount.root, mount.index_file)
+        file_stat = _stat_file(candidate)
+    if file_stat is None:
+        return None
+    for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+        if encoding not in encodings: continue
+        compressed_stat = _stat_file(candidate + suffix)
+        if compressed_stat is not None:
+            return candidate + suffix, compressed_stat, candidate, encoding
+    return candidate, file_stat, candidate, None
+
+def _not_modified(request: Request, response: FileResponse) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = response.headers["etag"]
+        return any(tag.strip().removeprefix("W/") in (etag, "*") for tag in if_none_match.split(","))
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(response.headers["last-modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class StaticMounts:
+    """
+    Serves per-service directories from disk instead of proxying to a backend. Mounts are matched by
+    hostname and longest path prefix. File lookups run in the executor; the file body is sent by
+    Starlette's FileResponse (Range/If-Range, and zero-copy `http.response.pathsend` where the server offers it).
+    """
+    def __init__(self):
+        self._mounts: Dict[str, List[_Mount]] = {}
+
+    def configure(self, mounts: Iterable[StaticMountConfig]):
+        by_hostname: Dict[str, List[_Mount]] = {}
+        for config in mounts:
+            by_hostname.setdefault(config.hostname, []).append(_Mount(config))
+        for hostname_mounts in by_hostname.values():
+            hostname_mounts.sort(key=lambda mount: len(mount.path_prefix), reverse=True)
+        self._mounts = by_hostname
+
+    def match(self, hostname: str, path: str) -> Optional[_Mount]:
+        for mount in self._mounts.get(hostname, ()):
+            if mount.matches(path): return mount
+        return None
+
+    async def serve(self, request: Request, mount: _Mount) -> FastAPIResponse:
+        if request.method not in ("GET", "HEAD"):
+            return FastAPIResponse("Method not allowed for static files.", status_code=405, headers={"Allow": "GET, HEAD"})
+        relative_path = request.url.path[len(mount.path_prefix):] if mount.path_prefix != "/" else request.url.path
+        encodings = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        resolved = await asyncio.get_running_loop().run_in_executor(None, _resolve_file, mount, relative_path, encodings)
+        if resolved is None:
+            return FastAPIResponse("Not found", status_code=404)
+
+        file_path, file_stat, media_type_path, content_encoding = resolved
+        headers = {"Vary": "Accept-Encoding"}
+        if content_encoding: headers["Content-Encoding"] = content_encoding
+        if mount.cache_control: headers["Cache-Control"] = mount.cache_control
+        response = FileResponse(file_path, headers=headers, stat_result=file_stat,
+                                media_type=guess_type(media_type_path)[0] or "application/octet-stream")
+        if _not_modified(request, response):
+            not_modified_headers = {name: response.headers[name] for name in ("etag", "last-modified", "vary", "cache-control") if name in response.headers}
+            return FastAPIResponse(status_code=304, headers=not_modified_headers)
+        return response
+
+# Global instance
+static_mounts = StaticMounts()
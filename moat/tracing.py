@@ -0,0 +1,167 @@
+import asyncio
+import json
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from .metrics import metrics_registry, trace_spans_total, Gauge
+
+# W3C Trace Context (https://www.w3.org/TR/trace-context/): version-traceid-parentid-flags
+_TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?$")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+SAMPLED_FLAG = 0x01
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL, SPAN_KIND_SERVER, SPAN_KIND_CLIENT = 1, 2, 3
+STATUS_CODE_ERROR = 2
+
+def _new_trace_id() -> str:
+    return f"{random.getrandbits(128) or 1:032x}"
+
+def new_span_id() -> str:
+    return f"{random.getrandbits(64) or 1:016x}"
+
+class TraceContext:
+    """The trace a proxied request belongs to: Moat's server span plus the client span forwarded upstream."""
+    __slots__ = ("trace_id", "parent_span_id", "span_id", "upstream_span_id", "sampled")
+
+    def __init__(self, trace_id: str, parent_span_id: Optional[str], sampled: bool):
+        self.trace_id = trace_id
+        self.parent_span_id = parent_span_id
+        self.span_id = new_span_id()
+        self.upstream_span_id = new_span_id()
+        self.sampled = sampled
+
+    def upstream_traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.upstream_span_id}-{'01' if self.sampled else '00'}"
+
+def start_trace(traceparent: Optional[str], sample_rate: float) -> TraceContext:
+    """
+    Continues the caller's trace if traceparent is valid, else starts a new one. Sampling is decided once,
+    at the head: a caller's sampled flag is honoured, and new traces are sampled with sample_rate.
+    """
+    if traceparent:
+        match = _TRACEPARENT_RE.match(traceparent.strip().lower())
+        if match:
+            version, trace_id, parent_span_id, flags, rest = match.groups()
+            if version != "ff" and not (version == "00" and rest) and trace_id != _INVALID_TRACE_ID and parent_span_id != _INVALID_SPAN_ID:
+                return TraceContext(trace_id, parent_span_id, bool(int(flags, 16) & SAMPLED_FLAG))
+    return TraceContext(_new_trace_id(), None, random.random() < sample_rate)
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool): return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int): return {"key": key, "value": {"intValue": str(value)}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+def make_span(trace: TraceContext, span_id: str, parent_span_id: Optional[str], name: str, kind: int,
+              start_unix_nano: int, end_unix_nano: int, attributes: Optional[Dict[str, Any]] = None, error: bool = False) -> Dict[str, Any]:
+    span = {
+        "traceId": trace.trace_id, "spanId": span_id, "name": name, "kind": kind,
+        "startTimeUnixNano": str(start_unix_nano), "endTimeUnixNano": str(end_unix_nano),
+        "attributes": [_attribute(k, v) for k, v in (attributes or {}).items() if v is not None],
+    }
+    if parent_span_id: span["parentSpanId"] = parent_span_id
+    if error: span["status"] = {"code": STATUS_CODE_ERROR}
+    return span
+
+
+class SpanExporter:
+    """
+    Buffers finished spans and exports them in batches as OTLP/JSON (an ExportTraceServiceRequest per batch),
+    either appended as one line to a file or POSTed to an OTLP/HTTP collector. Spans beyond max_queued_spans
+    are dropped and counted, so a slow or absent collector cannot grow memory or hold up requests.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.export_path: Optional[Path] = None
+        self.otlp_endpoint: Optional[str] = None
+        self.max_queued_spans = 20000
+        self.batch_size = 512
+        self.flush_interval_seconds = 2.0
+        self._spans: List[Dict[str, Any]] = []
+        self._flush_wanted = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def configure(self, enabled: bool, sample_rate: float, export_path: Optional[str], otlp_endpoint: Optional[str], max_queued_spans: int):
+        self.enabled = enabled and bool(export_path or otlp_endpoint)
+        self.sample_rate = sample_rate
+        self.export_path = Path(export_path) if export_path else None
+        self.otlp_endpoint = otlp_endpoint
+        self.max_queued_spans = max_queued_spans
+
+    def add_spans(self, spans: List[Dict[str, Any]]):
+        if len(self._spans) + len(spans) > self.max_queued_spans:
+            trace_spans_total.inc("dropped", amount=len(spans))
+            return
+        self._spans.extend(spans)
+        if len(self._spans) >= self.batch_size:
+            self._flush_wanted.set()
+
+    def start(self):
+        if not self.enabled or (self._task and not self._task.done()): return
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="SpanExporter")
+
+    async def _run(self):
+        while True:
+            try: await asyncio.wait_for(self._flush_wanted.wait(), timeout=self.flush_interval_seconds)
+            except asyncio.TimeoutError: pass
+            self._flush_wanted.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self._spans:
+            batch, self._spans = self._spans[:self.batch_size], self._spans[self.batch_size:]
+            payload = {"resourceSpans": [{
+                "resource": {"attributes": [_attribute("service.name", "moat")]},
+                "scopeSpans": [{"scope": {"name": "moat"}, "spans": batch}],
+            }]}
+            try:
+                if self.otlp_endpoint: await self._post(payload)
+                elif self.export_path: await self._append(payload)
+                trace_spans_total.inc("exported", amount=len(batch))
+            except (OSError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Tracing: Error exporting {len(batch)} span(s): {e!r}")
+                trace_spans_total.inc("dropped", amount=len(batch))
+
+    async def _post(self, payload: Dict[str, Any]):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        async with self._session.post(self.otlp_endpoint, json=payload) as response:
+            if response.status >= 300:
+                raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status, message=await response.text())
+
+    async def _append(self, payload: Dict[str, Any]):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="moat-span-export")
+        path = self.export_path
+
+        def _write():
+            with open(path, "a") as f: f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+        await asyncio.get_running_loop().run_in_executor(self._executor, _write)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            self._task = None
+        await self.flush()
+        if self._session and not self._session.closed: await self._session.close()
+        self._session = None
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+# Global instance
+span_exporter = SpanExporter()
+
+metrics_registry.register(Gauge("moat_trace_spans_queued", "Finished spans waiting to be exported.", value_callback=lambda: len(span_exporter._spans)))